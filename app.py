@@ -1,11 +1,17 @@
-from flask import Flask, render_template, request, jsonify, send_file
 from file_rag import FileRAGSystem  # 导入自定义的RAG系统
 import os
 import asyncio
-from quart import Quart, render_template, request, jsonify, send_file  # Quart框架支持异步
+from quart import Quart, render_template, request, jsonify, send_file, make_response, g  # Quart框架支持异步
 from datetime import datetime
 import time
-import requests
+import json
+import uuid
+from job_queue import JobManager, RUNNING  # 后台润色任务队列
+from metrics import REGISTRY, CONTENT_TYPE  # 监控指标
+from dotenv import load_dotenv  # 从.env文件读取配置
+
+# 加载环境变量配置（检索后端等）
+load_dotenv()
 
 # 创建Quart应用实例，而非Flask，以支持异步处理
 app = Quart(__name__)
@@ -31,6 +37,125 @@ def get_rag_system():
         _rag_system = FileRAGSystem()
     return _rag_system
 
+@app.before_serving
+async def load_saved_knowledge_base():
+    """启动时自动加载知识库目录中最近保存的知识库 - 向量以内存映射方式打开
+
+    配置了共享知识库目录（多工作进程部署）时加入共享知识库，并在后台同步其他进程发布的新版本。
+    """
+    rag_system = get_rag_system()
+    if rag_system.shared_kb is not None:
+        await asyncio.get_event_loop().run_in_executor(
+            None, rag_system.join_shared, app.config['KNOWLEDGE_BASE_FOLDER']
+        )
+        app.add_background_task(rag_system.run_shared_sync, app.shutdown_event)
+        return
+    await asyncio.get_event_loop().run_in_executor(
+        None, rag_system.load_latest_knowledge_base, app.config['KNOWLEDGE_BASE_FOLDER']
+    )
+
+def remove_upload(file_path: str):
+    """删除润色用的临时上传文件 - 文件不存在时忽略"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️ 删除上传文件 {file_path} 时出错: {str(e)}")
+
+async def run_polish_job(job):
+    """后台文档润色任务 - 解析文档、并发润色，并将结果写入润色目录，返回输出文件名"""
+    rag_system = get_rag_system()
+    filename = job.params['filename']
+    loop = asyncio.get_event_loop()
+    
+    try:
+        # 在线程池中解析文档，避免阻塞事件循环
+        process = rag_system.supported_extensions[os.path.splitext(filename)[1].lower()]
+        documents = await loop.run_in_executor(None, process, job.params['file_path'])
+    finally:
+        # 上传的文件只用于本次任务，解析完成（或失败）后即删除
+        remove_upload(job.params['file_path'])
+    
+    # 并发润色，每完成一个片段更新一次任务进度
+    polished_content = await rag_system.polish_document(
+        documents, job.params['model'], on_progress=job.update_progress
+    )
+    
+    # 生成输出文件名，包含时间戳和任务ID，避免并发任务互相覆盖
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_filename = f"{os.path.splitext(filename)[0]}_polished_{timestamp}_{job.id[:8]}.txt"
+    output_path = os.path.join(app.config['POLISHED_FOLDER'], output_filename)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(polished_content)
+    return output_filename
+
+# 后台任务队列 - 文档润色在后台执行，请求立即返回任务ID
+job_manager = JobManager(run_polish_job, workers=int(os.getenv('RAG_JOB_WORKERS', '2')))
+
+# 请求级监控指标 - 流式响应的耗时为开始返回响应（首字节）的时间
+HTTP_IN_FLIGHT = REGISTRY.gauge('rag_http_in_flight_requests', '正在处理的HTTP请求数')
+HTTP_REQUESTS = REGISTRY.counter('rag_http_requests_total', 'HTTP请求数，按路由与状态码分类', ('route', 'method', 'status'))
+HTTP_SECONDS = REGISTRY.histogram('rag_http_request_seconds', 'HTTP请求处理耗时（秒）', ('route', 'method'))
+JOB_QUEUE_DEPTH = REGISTRY.gauge('rag_job_queue_depth', '等待执行的后台润色任务数')
+JOBS_RUNNING = REGISTRY.gauge('rag_jobs_running', '正在执行的后台润色任务数')
+
+def collect_job_metrics():
+    """导出指标前刷新后台任务队列的深度与正在执行的任务数"""
+    JOB_QUEUE_DEPTH.set(job_manager.queue_depth)
+    JOBS_RUNNING.set(sum(1 for job in list(job_manager.jobs.values()) if job.status == RUNNING))
+
+REGISTRY.set_collector('job_queue', collect_job_metrics)
+
+def check_model(model: str):
+    """检查model参数 - 不是已注册的引擎（或both/all）时返回400响应，否则返回None"""
+    choices = get_rag_system().model_choices()
+    if model in choices:
+        return None
+    return jsonify({'error': f"不支持的模型: {model}，可选: {', '.join(choices)}"}), 400
+
+def trace_requested(form) -> bool:
+    """请求是否要求返回调用链 - 表单字段 trace=1"""
+    return form.get('trace', '') in ('1', 'true')
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+# 监控指标中的请求方法标签 - 客户端可以发送任意方法名，其余方法统一记为other
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH'])
+
+@app.after_request
+async def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method = request.method if request.method in HTTP_METHODS else 'other'
+    HTTP_REQUESTS.inc(route=route, method=method, status=response.status_code)
+    HTTP_SECONDS.observe(time.perf_counter() - g.request_started, route=route, method=method)
+    return response
+
+@app.teardown_request
+async def finish_request(exc):
+    HTTP_IN_FLIGHT.dec()
+
+# 启动预热 - 开启时在后台加载嵌入模型并建立上游长连接，第一次润色不再承担模型加载时间
+WARMUP_ENABLED = os.getenv('RAG_WARMUP', '1') == '1'
+
+@app.before_serving
+async def start_http_pool():
+    """启动时创建共享的HTTP连接池和后台任务工作协程，并在后台开始预热"""
+    rag_system = get_rag_system()
+    await rag_system.startup()
+    await job_manager.start()
+    if WARMUP_ENABLED:
+        app.add_background_task(rag_system.warm_up)
+
+@app.after_serving
+async def close_http_pool():
+    """退出时停止后台任务并关闭共享的HTTP连接池"""
+    await job_manager.stop()
+    await get_rag_system().shutdown()
+
 @app.route('/')
 async def index():
     """主页路由 - 渲染前端界面"""
@@ -108,6 +233,34 @@ async def save_knowledge_base():
     except Exception as e:
         return jsonify({'error': f'保存文件时出错: {str(e)}'})
 
+@app.route('/load_kb', methods=['POST'])
+async def load_knowledge_base():
+    """从知识库目录加载已保存的知识库的路由"""
+    form = await request.form
+    filename = os.path.basename(form.get('filename', ''))
+    rag_system = get_rag_system()
+    
+    try:
+        # 未指定文件名时加载最近保存的知识库
+        if filename:
+            if not filename.lower().endswith('.json'):
+                filename += '.json'
+            input_path = os.path.join(app.config['KNOWLEDGE_BASE_FOLDER'], filename)
+            load = lambda: rag_system.load_knowledge_base(input_path)
+        else:
+            load = lambda: rag_system.load_latest_knowledge_base(app.config['KNOWLEDGE_BASE_FOLDER'])
+        
+        # 使用线程池处理文件加载，避免阻塞主线程
+        success = await asyncio.get_event_loop().run_in_executor(None, load)
+        
+        if success:
+            return jsonify({'message': f'知识库加载完成，当前文档数 {len(rag_system.knowledge_base)}'})
+        else:
+            return jsonify({'error': '加载知识库时出错'})
+            
+    except Exception as e:
+        return jsonify({'error': f'加载文件时出错: {str(e)}'})
+
 @app.route('/polish', methods=['POST'])
 async def polish_text():
     """文本润色处理路由 - 处理单段文本的润色请求"""
@@ -118,6 +271,9 @@ async def polish_text():
     # 检查文本是否为空
     if not text:
         return jsonify({'error': '文本不能为空'})
+    invalid = check_model(model)
+    if invalid:
+        return invalid
     
     try:
         # 增加超时时间到120秒
@@ -128,7 +284,7 @@ async def polish_text():
         
         # 调用异步润色方法，并设置超时
         result = await asyncio.wait_for(
-            rag_system.polish_text(text, model),
+            rag_system.polish_text(text, model, trace=trace_requested(form)),
             timeout=timeout
         )
         
@@ -143,11 +299,13 @@ async def polish_text():
                 'original': str(result.get('original', '')),
                 'suggested': {
                     'youdao': '',
-                    'zhipu': str(result.get('suggested', {}).get('zhipu', ''))
+                    'zhipu': str(result.get('suggested', {}).get('zhipu', '')),
+                    'local': str(result.get('suggested', {}).get('local', ''))
                 },
                 'analysis': {
                     'youdao': '',
-                    'zhipu': str(result.get('analysis', {}).get('zhipu', ''))
+                    'zhipu': str(result.get('analysis', {}).get('zhipu', '')),
+                    'local': str(result.get('analysis', {}).get('local', ''))
                 }
             })
             
@@ -156,13 +314,17 @@ async def polish_text():
             'original': str(result.get('original', '')),
             'suggested': {
                 'youdao': str(result.get('suggested', {}).get('youdao', '')),
-                'zhipu': str(result.get('suggested', {}).get('zhipu', ''))
+                'zhipu': str(result.get('suggested', {}).get('zhipu', '')),
+                'local': str(result.get('suggested', {}).get('local', ''))
             },
             'analysis': {
                 'youdao': str(result.get('analysis', {}).get('youdao', '')),
-                'zhipu': str(result.get('analysis', {}).get('zhipu', ''))
+                'zhipu': str(result.get('analysis', {}).get('zhipu', '')),
+                'local': str(result.get('analysis', {}).get('local', ''))
             }
         }
+        if 'trace' in result:
+            processed_result['trace'] = result['trace']
         return jsonify(processed_result)
         
     except asyncio.TimeoutError:
@@ -170,6 +332,43 @@ async def polish_text():
     except Exception as e:
         return jsonify({'error': f'润色过程中出错: {str(e)}'})
 
+@app.route('/polish_stream', methods=['POST'])
+async def polish_text_stream():
+    """流式文本润色路由 - 每个引擎的每个阶段完成后立即推送，智谱结果逐token推送
+
+    默认以NDJSON（每行一个JSON事件）返回；format=sse 时以SSE格式返回。
+    """
+    form = await request.form
+    text = form.get('text', '')  # 获取要润色的文本
+    model = form.get('model', 'both')  # 获取使用的模型，默认为both（同时使用有道和智谱）
+    stream_format = form.get('format', 'ndjson')  # 输出格式：ndjson 或 sse
+    
+    # 检查文本是否为空
+    if not text:
+        return jsonify({'error': '文本不能为空'})
+    invalid = check_model(model)
+    if invalid:
+        return invalid
+    
+    rag_system = get_rag_system()
+    
+    async def send_events():
+        async for event in rag_system.polish_text_stream(text, model, timeout=120, trace=trace_requested(form)):
+            payload = json.dumps(event, ensure_ascii=False, default=str)
+            if stream_format == 'sse':
+                yield f"event: {event['type']}\ndata: {payload}\n\n".encode('utf-8')
+            else:
+                yield f"{payload}\n".encode('utf-8')
+    
+    content_type = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    response = await make_response(send_events(), {
+        'Content-Type': f'{content_type}; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲事件流
+    })
+    response.timeout = None  # 超时由润色流程自身控制
+    return response
+
 @app.route('/polish_doc', methods=['POST'])
 async def polish_document():
     """文档润色处理路由 - 处理整个文档文件的润色"""
@@ -183,109 +382,38 @@ async def polish_document():
     
     form = await request.form
     model = form.get('model', 'both')  # 获取使用的模型，默认为both
+    invalid = check_model(model)
+    if invalid:
+        return invalid
+    
+    filename = os.path.basename(file.filename)
+    rag_system = get_rag_system()
+    if os.path.splitext(filename)[1].lower() not in rag_system.supported_extensions:
+        return jsonify({'error': f'不支持的文件格式: {filename}'})
     
     try:
-        # 保存上传的文件
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+        # 保存上传的文件 - 加上唯一前缀，避免并发请求互相覆盖
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
         await file.save(file_path)
         
-        # 获取RAG系统
-        rag_system = get_rag_system()
-        
-        # 处理文档 - 根据文件类型调用对应的处理方法
-        documents = rag_system.supported_extensions[os.path.splitext(file.filename)[1].lower()](file_path)
+        # 处理文档 - 根据文件类型调用对应的处理方法，在线程池中解析，避免阻塞事件循环
+        process = rag_system.supported_extensions[os.path.splitext(filename)[1].lower()]
+        try:
+            documents = await asyncio.get_event_loop().run_in_executor(None, process, file_path)
+        finally:
+            remove_upload(file_path)
         
-        # 润色文档内容
-        polished_content = []
-        for doc in documents:
-            # 对每个文档片段进行润色
-            result = await rag_system.polish_text(doc['text'], model)
-            
-            # 添加原文
-            polished_content.append(f"原文：\n{doc['text']}\n")
-            
-            # 当同时使用两种模型时，进行综合对比分析
-            if model == 'both':
-                # 构建增强的对比分析提示词
-                comparison_prompt = f"""请详细对比分析以下两个润色版本，判断哪个更好：
-
-原文：
-{doc['text']}
-
-有道翻译润色版本：
-{result['suggested']['youdao']}
-
-智谱API润色版本：
-{result['suggested']['zhipu']}
-
-请从以下几个方面进行详细对比分析：
-1. 语义准确性：哪个版本更准确地保留了原文的核心含义和细节
-2. 专业性：哪个版本对专业术语和概念的处理更准确
-3. 语言流畅度：哪个版本的表达更自然流畅，更符合中文表达习惯
-4. 结构与逻辑：哪个版本在结构和逻辑上更清晰连贯
-5. 语法与措辞：哪个版本的语法更准确，词语选择更恰当
-
-综合对比：
-1. 明确指出哪个版本总体更优秀，给出具体理由
-2. 分析两个版本各自的优缺点
-3. 建议如何结合两个版本的优点得到最佳润色文本
-
-请提供一个最佳润色版本，可以直接采用更好的那个版本，或结合两者的优点创建一个优化版本。
-
-输出格式：
-1. 分点对比分析（按上述5个维度）
-2. 综合结论（明确指出哪个版本更好，或各有什么优点）
-3. 最佳润色推荐
-"""
-                
-                # 调用智谱API进行对比分析
-                headers = {
-                    "Authorization": f"Bearer {rag_system.zhipu_api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                data = {
-                    "prompt": comparison_prompt,
-                    "temperature": 0.3,
-                    "max_tokens": 2000
-                }
-                
-                response = await asyncio.get_event_loop().run_in_executor(
-                    rag_system.executor,
-                    lambda: requests.post(rag_system.zhipu_api_url, headers=headers, json=data)
-                )
-                
-                if response.status_code == 200:
-                    analysis_result = response.json()
-                    if 'data' in analysis_result and 'choices' in analysis_result['data']:
-                        comparison_analysis = analysis_result['data']['choices'][0]['content'].strip()
-                        
-                        # 添加各自的润色结果
-                        polished_content.append(f"\n有道翻译润色版本：\n{result['suggested']['youdao']}")
-                        polished_content.append(f"\n智谱API润色版本：\n{result['suggested']['zhipu']}")
-                        
-                        # 添加详细的对比分析
-                        polished_content.append(f"\n【润色版本对比分析】：\n{comparison_analysis}")
-            else:
-                # 单模型模式下，只显示该模型的结果
-                if model == 'youdao':
-                    polished_content.append(f"\n有道翻译润色：\n{result['suggested']['youdao']}")
-                    polished_content.append(f"\n有道翻译分析：\n{result['analysis']['youdao']}")
-                elif model == 'zhipu':
-                    polished_content.append(f"\n智谱API润色：\n{result['suggested']['zhipu']}")
-                    polished_content.append(f"\n智谱API分析：\n{result['analysis']['zhipu']}")
-            
-            # 添加分隔符
-            polished_content.append("\n" + "="*50 + "\n")
+        # 并发润色文档内容 - 按片段并发处理，结果按原文顺序拼接
+        polished_content = await rag_system.polish_document(documents, model)
         
         # 生成输出文件名，包含时间戳
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_filename = f"{os.path.splitext(file.filename)[0]}_polished_{timestamp}.txt"
+        output_filename = f"{os.path.splitext(filename)[0]}_polished_{timestamp}.txt"
         output_path = os.path.join(app.config['POLISHED_FOLDER'], output_filename)
         
         # 保存润色后的内容到文件
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(polished_content))
+            f.write(polished_content)
         
         # 返回成功信息和文件名
         return jsonify({
@@ -296,6 +424,91 @@ async def polish_document():
     except Exception as e:
         return jsonify({'error': f'文档润色失败: {str(e)}'})
 
+@app.route('/jobs/polish_doc', methods=['POST'])
+async def submit_polish_job():
+    """提交后台文档润色任务的路由 - 立即返回任务ID"""
+    # 检查是否有文件被上传
+    if 'file' not in (await request.files):
+        return jsonify({'error': '没有文件被上传'})
+    
+    file = (await request.files)['file']
+    if file.filename == '':
+        return jsonify({'error': '没有选择文件'})
+    
+    filename = os.path.basename(file.filename)
+    if os.path.splitext(filename)[1].lower() not in get_rag_system().supported_extensions:
+        return jsonify({'error': f'不支持的文件格式: {filename}'})
+    
+    form = await request.form
+    model = form.get('model', 'both')  # 获取使用的模型，默认为both
+    invalid = check_model(model)
+    if invalid:
+        return invalid
+    
+    try:
+        # 上传文件名加上唯一前缀，避免并发任务互相覆盖
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
+        await file.save(file_path)
+        
+        try:
+            job = await job_manager.submit('polish_doc', file_path=file_path, filename=filename, model=model)
+        except Exception:
+            # 任务没有提交成功，不会再有任务删除该文件
+            remove_upload(file_path)
+            raise
+        return jsonify({'job_id': job.id, 'status': job.status})
+    except Exception as e:
+        return jsonify({'error': f'提交润色任务失败: {str(e)}'})
+
+@app.route('/jobs/<job_id>')
+async def job_status(job_id):
+    """查询后台任务状态与进度的路由"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+async def job_events(job_id):
+    """以SSE方式推送后台任务状态变化的路由 - 任务结束后关闭连接"""
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    async def send_events():
+        async for snapshot in job_manager.subscribe(job_id):
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n".encode('utf-8')
+    
+    response = await make_response(send_events(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲事件流
+    })
+    response.timeout = None  # 事件流可能持续整个任务时长
+    return response
+
+@app.route('/cache_stats')
+async def cache_stats():
+    """翻译与分析缓存命中统计的路由"""
+    return jsonify(get_rag_system().cache_stats())
+
+@app.route('/metrics')
+async def metrics():
+    """Prometheus指标导出路由 - 各阶段耗时直方图、上游错误码、缓存命中率、队列深度与知识库规模"""
+    return REGISTRY.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+@app.route('/ready')
+async def ready():
+    """就绪检查路由 - 预热完成（或未开启预热）时返回200，否则返回503"""
+    state = dict(get_rag_system().warmup_state, warmup_enabled=WARMUP_ENABLED)
+    is_ready = state['ready'] or not WARMUP_ENABLED
+    state['ready'] = is_ready
+    return jsonify(state), 200 if is_ready else 503
+
+@app.route('/limiter_stats')
+async def limiter_stats():
+    """上游引擎限流器状态的路由 - 当前QPS、并发、重试次数与断路器状态"""
+    return jsonify(get_rag_system().limiter_stats())
+
 @app.route('/download_polished/<filename>')
 async def download_polished(filename):
     """下载润色后文件的路由"""
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from rate_limit import QUEUE_CLOCKS, start_with_clocks  # 批量调用排队时为同批次各调用方计时
+
+
+class RequestCoalescer:
+    """请求合并器 - 把短时间窗口内同一分组的并发请求合并成一次批量调用，再把结果分发回各调用方
+
+    batch_fn(group, items) 为异步批量处理函数，按 items 的顺序返回等长的结果列表；
+    批量调用抛出的异常会传递给该批次的所有调用方。同一批次中相同的请求只发送一次。
+    达到条数上限或字符数上限时立即发送，否则等待时间窗口结束后发送。
+    """
+
+    def __init__(self, batch_fn: Callable[[Hashable, List[str]], Awaitable[List[Any]]],
+                 window: float = 0.02, max_items: int = 16, max_chars: int = 4500):
+        self.batch_fn = batch_fn
+        self.window = window  # 合并等待时间（秒）
+        self.max_items = max_items  # 每批最多条数
+        self.max_chars = max_chars  # 每批文本总字符数上限
+        self._pending = {}  # (分组, 事件循环) -> 待发送批次
+        self._running = set()  # 进行中的批量调用任务 - 事件循环只弱引用任务，需在此持有直到完成
+        self.stats = {'requests': 0, 'batches': 0, 'deduplicated': 0}
+
+    async def submit(self, group: Hashable, item: str) -> Any:
+        """提交一个请求，等待所在批次完成后返回对应结果"""
+        loop = asyncio.get_running_loop()
+        key = (group, loop)
+        self.stats['requests'] += 1
+
+        batch = self._pending.get(key)
+        # 加入后会超出字符上限的，先把当前批次发出去
+        if batch is not None and item not in batch['futures'] and batch['chars'] + len(item) > self.max_chars:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = {'futures': {}, 'chars': 0, 'clocks': set(),
+                     'timer': loop.call_later(self.window, self._flush, key)}
+            self._pending[key] = batch
+        batch['clocks'].update(QUEUE_CLOCKS.get())
+
+        future = batch['futures'].get(item)
+        if future is None:
+            future = batch['futures'][item] = loop.create_future()
+            batch['chars'] += len(item)
+        else:
+            self.stats['deduplicated'] += 1
+
+        if len(batch['futures']) >= self.max_items or batch['chars'] >= self.max_chars:
+            self._flush(key)
+        # shield：某个调用方被取消时不影响同批次的其他调用方
+        return await asyncio.shield(future)
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch['timer'].cancel()
+        self.stats['batches'] += 1
+        task = start_with_clocks(self._run(key[0], batch['futures']), batch['clocks'])
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, group: Hashable, futures: Dict[str, asyncio.Future]):
+        items = list(futures)
+        try:
+            results = await self.batch_fn(group, items)
+            if len(results) != len(items):
+                raise ValueError(f"批量结果数量不匹配：请求 {len(items)} 条，返回 {len(results)} 条")
+        except BaseException as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        for item, result in zip(items, results):
+            if not futures[item].done():
+                futures[item].set_result(result)
+
+
+class SingleFlight:
+    """单飞请求合并 - 同一个键同时只执行一次，期间到达的相同请求等待同一个结果
+
+    第一个调用方在独立的任务中执行 fn，之后的调用方直接等待该任务；任务结束后键即被移除，
+    结果不做保存（由结果缓存负责）。fn 抛出的异常会传递给所有调用方。
+    某个调用方被取消时不影响其他调用方，所有调用方都被取消时才取消任务本身。
+    """
+
+    def __init__(self):
+        self._calls = {}  # (键, 事件循环) -> {'task': 任务, 'waiters': 等待的调用方数}
+        self.stats = {'requests': 0, 'executions': 0, 'shared': 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn() 或等待正在执行的相同请求，返回其结果"""
+        loop = asyncio.get_running_loop()
+        call_key = (key, loop)
+        self.stats['requests'] += 1
+
+        call = self._calls.get(call_key)
+        if call is None:
+            call = {'task': loop.create_task(fn()), 'waiters': 0}
+            self._calls[call_key] = call
+            call['task'].add_done_callback(lambda task: self._forget(call_key, call))
+            self.stats['executions'] += 1
+        else:
+            self.stats['shared'] += 1
+
+        call['waiters'] += 1
+        try:
+            # shield：单个调用方被取消时任务继续为其他调用方执行
+            return await asyncio.shield(call['task'])
+        except asyncio.CancelledError:
+            if call['waiters'] == 1 and not call['task'].done():
+                # 最后一个调用方也离开了，任务不再有人等待；先移除键，之后的相同请求重新执行
+                self._forget(call_key, call)
+                call['task'].cancel()
+            raise
+        finally:
+            call['waiters'] -= 1
+
+    def _forget(self, call_key, call):
+        if self._calls.get(call_key) is call:
+            del self._calls[call_key]
+
+    def in_flight(self) -> int:
+        """正在执行的请求数"""
+        return len(self._calls)
@@ -0,0 +1,173 @@
+"""润色吞吐量基准测试 - 在本地模拟的有道/智谱/Ollama服务上，按指定并发驱动润色接口，报告延迟分位数、吞吐量与内存
+
+测试目标：
+    direct      直接调用 FileRAGSystem.polish_text
+    polish      通过应用的 /polish 路由（Quart测试客户端，包含表单解析与JSON序列化）
+    polish_doc  通过应用的 /polish_doc 路由上传整篇文档
+
+驱动方与应用运行在同一个事件循环中，不需要启动服务器，也不需要真实密钥。
+默认使用合成嵌入引擎，只测量检索与上游调用链路；--embedding model 时使用配置的真实嵌入模型。
+应用自身的上游限速（RAG_YOUDAO_QPS / RAG_ZHIPU_QPS）默认关闭，可用 --client-qps 打开。
+
+用法：
+    python benchmarks/bench_polish.py --targets direct polish --concurrency 1 8 32 --requests 200
+    python benchmarks/bench_polish.py --latency 0.1 --error-rate 0.02 --rate-limit 100 --json polish.json
+    python benchmarks/bench_polish.py --baseline polish.json --tolerance 0.2
+    python benchmarks/bench_polish.py --model local --targets polish_doc --ollama-parallel 2
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import (  # noqa: E402
+    SyntheticEngine, add_result_arguments, current_rss_mb, finish, latency_summary, peak_rss_mb
+)
+
+SAMPLE = "本实验在常温常压下进行，样品经过三次重复测量取平均值，结果表明催化剂的活性随温度升高而显著增强。"
+
+
+def make_text(index: int, chars: int) -> str:
+    """生成互不相同的待润色文本，避免结果缓存命中"""
+    text = f"第{index}号样本：" + SAMPLE * (chars // len(SAMPLE) + 1)
+    return text[:chars]
+
+
+async def drive(name: str, send, requests: int, concurrency: int):
+    """闭环压测 - concurrency 个工作协程循环发送请求，直到发出 requests 个请求"""
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                ok = await send(index)
+            except Exception as e:
+                print(f"❌ {name} 请求出错: {str(e)}")
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'name': f"{name}@{concurrency}",
+        'requests': requests,
+        'errors': errors,
+        'requests_per_sec': round(requests / elapsed, 2),
+        **latency_summary(latencies),
+        'rss_mb': current_rss_mb(),
+    }
+
+
+async def run(args):
+    from werkzeug.datastructures import FileStorage  # Quart依赖werkzeug，用于构造上传文件
+
+    import app as web_app
+    from mock_upstream import mock_base_url, mock_stats, point_to_mock, start_mock_upstream
+
+    runner = await start_mock_upstream(latency=args.latency, error_rate=args.error_rate,
+                                       rate_limit=args.rate_limit, seed=args.seed,
+                                       ollama_parallel=args.ollama_parallel)
+    rag_system = web_app.get_rag_system()
+    point_to_mock(rag_system, mock_base_url(runner))
+    if args.embedding == 'synthetic':
+        rag_system.embedding_engine = SyntheticEngine(args.dim)
+    if args.kb_chunks:
+        rag_system._index_documents([
+            {'text': make_text(i, 200), 'source': f'kb_{i // 100}.txt'} for i in range(args.kb_chunks)
+        ])
+
+    doc_body = "\n\n".join(make_text(i, args.text_chars) for i in range(args.doc_paragraphs)).encode('utf-8')
+    rows = []
+    async with web_app.app.test_app() as test_app:
+        client = test_app.test_client()
+        run_id = 0
+
+        async def send_direct(index):
+            result = await rag_system.polish_text(make_text(run_id + index, args.text_chars), args.model)
+            return 'error' not in result
+
+        async def send_polish(index):
+            response = await client.post('/polish', form={
+                'text': make_text(run_id + index, args.text_chars), 'model': args.model
+            })
+            return 'error' not in await response.get_json()
+
+        async def send_polish_doc(index):
+            # 每个请求的文档内容不同，避免命中结果缓存
+            body = f"第{run_id + index}份文档\n\n".encode('utf-8') + doc_body
+            response = await client.post('/polish_doc', form={'model': args.model}, files={
+                'file': FileStorage(io.BytesIO(body), filename=f'bench_{run_id + index}.txt')
+            })
+            return 'error' not in await response.get_json()
+
+        senders = {'direct': send_direct, 'polish': send_polish, 'polish_doc': send_polish_doc}
+        print(f"模型: {args.model}，上游延迟 {args.latency}s，错误率 {args.error_rate}，"
+              f"限流 {args.rate_limit or '无'}，知识库分块 {args.kb_chunks}")
+        print(f"{'场景':<18}{'请求':>6}{'失败':>6}{'请求/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}"
+              f"{'p99(ms)':>10}{'内存(MB)':>10}")
+        for target in args.targets:
+            requests = args.doc_requests if target == 'polish_doc' else args.requests
+            for concurrency in args.concurrency:
+                row = await drive(target, senders[target], requests, concurrency)
+                run_id += requests
+                rows.append(row)
+                print(f"{row['name']:<18}{row['requests']:>6}{row['errors']:>6}{row['requests_per_sec']:>10}"
+                      f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['rss_mb']:>10}")
+
+    stats = mock_stats(runner)
+    print(f"\n模拟上游: {dict(sorted(stats.items()))}")
+    print(f"峰值内存: {peak_rss_mb()} MB")
+    await runner.cleanup()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="润色接口吞吐量与延迟基准测试")
+    parser.add_argument('--targets', nargs='+', default=['direct', 'polish', 'polish_doc'],
+                        choices=['direct', 'polish', 'polish_doc'], help='测试目标')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32], help='并发请求数')
+    parser.add_argument('--requests', type=int, default=200, help='direct/polish 每个并发级别的请求数')
+    parser.add_argument('--doc-requests', type=int, default=20, help='polish_doc 每个并发级别的请求数')
+    parser.add_argument('--doc-paragraphs', type=int, default=10, help='polish_doc 上传文档的段落数')
+    parser.add_argument('--model', default='both', help='润色模型：both / youdao / zhipu / local / all')
+    parser.add_argument('--text-chars', type=int, default=120, help='每段待润色文本的字数')
+    parser.add_argument('--kb-chunks', type=int, default=1000, help='预先写入知识库的分块数')
+    parser.add_argument('--embedding', default='synthetic', choices=['synthetic', 'model'], help='嵌入引擎')
+    parser.add_argument('--dim', type=int, default=384, help='合成嵌入的向量维度')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟上游每个请求的耗时（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟上游返回503的请求比例')
+    parser.add_argument('--rate-limit', type=float, default=0, help='模拟上游每个引擎的QPS上限，0表示不限流')
+    parser.add_argument('--client-qps', type=float, default=0, help='应用自身的上游限速（QPS），0表示不限速')
+    parser.add_argument('--ollama-parallel', type=int, default=2, help='模拟Ollama同时处理的请求数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    # 应用配置在导入时读取，需在导入前设置；上传与润色输出写入临时目录
+    os.environ['RAG_WARMUP'] = '0'
+    os.environ['RAG_YOUDAO_QPS'] = os.environ['RAG_ZHIPU_QPS'] = str(args.client_qps)
+    for name in ('RAG_CACHE_PATH', 'RAG_EMBED_CACHE_PATH', 'RAG_PARSE_CACHE_PATH'):
+        os.environ[name] = ''
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench_polish_') as workdir:
+        os.chdir(workdir)
+        try:
+            rows = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+    finish(args, 'polish', rows)
+
+
+if __name__ == '__main__':
+    main()
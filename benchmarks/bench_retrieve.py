@@ -0,0 +1,126 @@
+"""检索基准测试 - 在1k/100k/1M个分块的知识库上测量 FileRAGSystem.retrieve 的延迟分位数、吞吐量与内存
+
+知识库向量为随机生成，分块文本由按Zipf分布抽取的合成中文词组成；查询使用合成嵌入引擎编码，
+结果只反映嵌入缓存查询、向量索引/BM25检索、排名融合与取回文档的开销。
+--modes 选择检索模式（dense / lexical / hybrid），--threads 大于1时多个线程同时检索，用于观察无锁快照下的读扩展性。
+
+用法：
+    python benchmarks/bench_retrieve.py --sizes 1000 100000 1000000 --backends exact ivf
+    python benchmarks/bench_retrieve.py --sizes 100000 --modes dense lexical hybrid --json retrieve.json
+    python benchmarks/bench_retrieve.py --sizes 100000 --threads 4
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import (  # noqa: E402
+    SyntheticEngine, add_result_arguments, current_rss_mb, finish, latency_summary
+)
+
+
+class SyntheticText:
+    """合成中文文本 - 词表为随机的双字词，按Zipf分布抽词，常用词出现在大量分块中"""
+
+    def __init__(self, vocabulary: int = 20000, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        chars = self.rng.integers(0x4e00, 0x9fa5, size=(vocabulary, 2))
+        self.words = [chr(a) + chr(b) for a, b in chars]
+
+    def sample(self, count: int, words: int):
+        ranks = np.minimum(self.rng.zipf(1.3, size=(count, words)), len(self.words)) - 1
+        return [''.join(self.words[r] for r in row) for row in ranks]
+
+
+def build_knowledge_base(rag_system, size: int, dim: int, text: SyntheticText, block: int = 65536) -> float:
+    """分块写入随机向量与合成文本并建立索引，返回耗时（秒） - 不经过嵌入模型"""
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    with rag_system._index_lock:
+        rag_system.embedding_store.clear()
+        for begin in range(0, size, block):
+            count = min(block, size - begin)
+            documents = [{'text': chunk, 'source': f'doc_{(begin + i) // 1000}.txt'}
+                         for i, chunk in enumerate(text.sample(count, 60))]
+            rag_system.embedding_store.add(documents, rng.standard_normal((count, dim), dtype=np.float32))
+        rag_system._update_indexes()
+        rag_system._publish()
+    return time.perf_counter() - started
+
+
+def measure(rag_system, queries, threads: int):
+    """每个查询文本只检索一次（嵌入缓存不命中），返回 (各次延迟, 总耗时)"""
+    def timed(query):
+        started = time.perf_counter()
+        rag_system.retrieve(query, 3)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    if threads <= 1:
+        latencies = [timed(query) for query in queries]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(timed, queries))
+    return latencies, time.perf_counter() - started
+
+
+def run(args):
+    from file_rag import FileRAGSystem
+
+    rows = []
+    print(f"{'场景':<30}{'构建(s)':>9}{'查询/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'内存(MB)':>10}")
+    text = SyntheticText()
+    for mode, backend in [(mode, backend) for mode in args.modes for backend in args.backends]:
+        os.environ['RAG_RETRIEVAL_MODE'] = mode
+        os.environ['RAG_INDEX_BACKEND'] = backend
+        for size in args.sizes:
+            try:
+                rag_system = FileRAGSystem()
+            except ImportError as e:
+                print(f"{mode}/{backend:<16}跳过（缺少可选依赖: {e.name}）")
+                break
+            rag_system.embedding_engine = SyntheticEngine(args.dim)
+            build_seconds = build_knowledge_base(rag_system, size, args.dim, text)
+
+            rag_system.retrieve('预热查询', 3)
+            # 查询互不相同（嵌入缓存不命中），长度与一句话相当
+            queries = [f'{i}' + query for i, query in enumerate(text.sample(args.queries, 12))]
+            latencies, elapsed = measure(rag_system, queries, args.threads)
+            row = {
+                'name': f'{mode}/{backend}@{size}x{args.threads}',
+                'build_seconds': round(build_seconds, 3),
+                'queries_per_sec': round(len(queries) / elapsed, 1),
+                **latency_summary(latencies),
+                'rss_mb': current_rss_mb(),
+            }
+            rows.append(row)
+            print(f"{row['name']:<30}{row['build_seconds']:>9}{row['queries_per_sec']:>10}{row['p50_ms']:>10}"
+                  f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['rss_mb']:>10}")
+            del rag_system
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库检索延迟基准测试")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 100000, 1000000], help='知识库分块数')
+    parser.add_argument('--dim', type=int, default=384, help='向量维度（all-MiniLM-L6-v2为384）')
+    parser.add_argument('--queries', type=int, default=500, help='每个规模的查询次数')
+    parser.add_argument('--threads', type=int, default=1, help='同时检索的线程数')
+    parser.add_argument('--backends', nargs='+', default=['exact'], help='向量索引后端：exact / ivf / faiss / hnsw')
+    parser.add_argument('--modes', nargs='+', default=['dense', 'lexical', 'hybrid'],
+                        choices=['dense', 'lexical', 'hybrid'], help='检索模式')
+    add_result_arguments(parser)
+    args = parser.parse_args()
+    os.environ['RAG_EMBED_CACHE_PATH'] = ''
+    os.environ['RAG_PARSE_CACHE_PATH'] = ''
+    rows = run(args)
+    finish(args, 'retrieve', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""启动基准测试 - 测量冷启动导入耗时，以及开启/关闭后台预热时第一次润色的响应时间
+
+每个场景都在全新的子进程中执行，上游有道/智谱接口由本地模拟服务代替，不需要真实密钥。
+
+用法：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 3 --request-delay 2 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROCESS_STARTED = time.perf_counter()
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_TEXT = "镜式润色通过中英互译发现原文中表达不够准确的地方，并参考知识库保持专业术语一致。"
+
+
+def run_child(args, *child_args) -> dict:
+    """在临时目录中启动子进程执行一个场景，返回其最后一行输出的JSON结果"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', *child_args, '--latency', str(args.latency),
+         '--request-delay', str(args.request_delay)],
+        cwd=args.workdir, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip() or completed.stdout.strip())
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def child_import(module: str) -> dict:
+    started = time.perf_counter()
+    __import__(module)
+    return {'seconds': time.perf_counter() - started}
+
+
+def child_prepare() -> dict:
+    """构建一个小知识库并保存到 knowledge_base 目录，供后续场景加载"""
+    from file_rag import FileRAGSystem
+    rag_system = FileRAGSystem()
+    os.makedirs('corpus', exist_ok=True)
+    with open(os.path.join('corpus', 'corpus.txt'), 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(f"第{i}段：{SAMPLE_TEXT}" for i in range(200)))
+    rag_system.ingest_directory('corpus', workers=1)
+    rag_system.save_knowledge_base(os.path.join('knowledge_base', 'bench.json'))
+    return {'documents': len(rag_system.knowledge_base)}
+
+
+async def child_first_polish(warmup: bool, request_delay: float, latency: float) -> dict:
+    """模拟服务启动：加载知识库、建立连接池、（可选）后台预热，等待request_delay秒后发出第一次润色请求"""
+    started = time.perf_counter()
+    from file_rag import FileRAGSystem
+    from mock_upstream import mock_base_url, point_to_mock, start_mock_upstream
+    imported = time.perf_counter()
+
+    runner = await start_mock_upstream(latency=latency)
+    rag_system = FileRAGSystem()
+    point_to_mock(rag_system, mock_base_url(runner))
+    rag_system.load_latest_knowledge_base('knowledge_base')
+    await rag_system.startup()
+    warm_task = asyncio.create_task(rag_system.warm_up()) if warmup else None
+    serving = time.perf_counter()
+
+    await asyncio.sleep(request_delay)
+    request_started = time.perf_counter()
+    first = await rag_system.polish_text(SAMPLE_TEXT)
+    first_seconds = time.perf_counter() - request_started
+    if first.get('error'):
+        raise RuntimeError(first['error'])
+
+    # 换一段文本避开结果缓存，作为已预热状态下的参照
+    request_started = time.perf_counter()
+    await rag_system.polish_text(SAMPLE_TEXT + "（第二次）")
+    second_seconds = time.perf_counter() - request_started
+
+    if warm_task is not None:
+        await warm_task
+    await rag_system.shutdown()
+    await runner.cleanup()
+    return {
+        'import': imported - started,
+        'serving': serving - PROCESS_STARTED,
+        'first_polish': first_seconds,
+        'second_polish': second_seconds,
+        'warmup': rag_system.warmup_state['seconds'],
+    }
+
+
+def child_main(args):
+    scenario = args.child[0]
+    if scenario == 'import':
+        result = child_import(args.child[1])
+    elif scenario == 'prepare':
+        result = child_prepare()
+    else:
+        result = asyncio.run(child_first_polish(scenario == 'warm', args.request_delay, args.latency))
+    print(json.dumps(result))
+
+
+def median(values):
+    return statistics.median(values) if values else float('nan')
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as workdir:
+        args.workdir = workdir
+        print(f"运行次数: {args.runs}，首个请求在启动后 {args.request_delay}s 到达，模拟上游延迟 {args.latency}s")
+
+        print("\n冷启动导入耗时（全新进程，取中位数）")
+        for module in ('file_rag', 'app'):
+            seconds = [run_child(args, 'import', module)['seconds'] for _ in range(args.runs)]
+            print(f"  import {module:<10}{median(seconds) * 1000:>10.1f} ms")
+
+        prepared = run_child(args, 'prepare')
+        print(f"\n已构建测试知识库，文档数 {prepared['documents']}")
+
+        print(f"\n{'场景':<10}{'可服务(s)':>12}{'首次润色(s)':>14}{'第二次润色(s)':>16}{'预热耗时(s)':>14}")
+        for scenario in ('cold', 'warm'):
+            results = [run_child(args, scenario) for _ in range(args.runs)]
+            warmup = median([r['warmup'] for r in results if r['warmup'] is not None])
+            print(f"{'预热开启' if scenario == 'warm' else '预热关闭':<10}"
+                  f"{median([r['serving'] for r in results]):>12.3f}"
+                  f"{median([r['first_polish'] for r in results]):>14.3f}"
+                  f"{median([r['second_polish'] for r in results]):>16.3f}"
+                  f"{warmup:>14.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动与首次润色响应时间基准测试")
+    parser.add_argument('--runs', type=int, default=3, help='每个场景重复的次数')
+    parser.add_argument('--request-delay', type=float, default=2.0, help='服务可用后多久发出第一次润色请求（秒）')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟上游每个请求的耗时（秒）')
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_main(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""基准测试公共工具 - 延迟分位数、内存占用、结果保存与基线对比、合成嵌入引擎"""
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_engine import EmbeddingEngine  # noqa: E402
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    """延迟样本（秒）的p50/p95/p99与均值（毫秒）"""
+    if not len(samples):
+        return {'p50_ms': float('nan'), 'p95_ms': float('nan'), 'p99_ms': float('nan'), 'mean_ms': float('nan')}
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3), 'mean_ms': round(float(values.mean()), 3)}
+
+
+def peak_rss_mb() -> float:
+    """进程的峰值常驻内存（MB），不支持的平台返回NaN"""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def current_rss_mb() -> float:
+    """进程当前的常驻内存（MB），只支持Linux，其他平台返回峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def save_results(path: str, benchmark: str, rows: List[Dict[str, Any]], params: Dict[str, Any]):
+    """把结果写入JSON文件，可作为之后运行的基线"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'benchmark': benchmark, 'params': params, 'results': rows}, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已保存到: {path}")
+
+
+def compare_with_baseline(path: str, rows: List[Dict[str, Any]], tolerance: float) -> int:
+    """与基线结果逐行对比，返回退化的指标数
+
+    以 name 字段匹配行；以 _ms 结尾的指标越小越好，以 per_sec 结尾的指标越大越好，
+    变差超过 tolerance（比例）即视为退化。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = {row['name']: row for row in json.load(f)['results']}
+    regressions = 0
+    for row in rows:
+        base = baseline.get(row['name'])
+        if base is None:
+            continue
+        for key, value in row.items():
+            old = base.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            if key.endswith('_ms'):
+                change = value / old - 1
+            elif key.endswith('per_sec'):
+                change = old / value - 1 if value else float('inf')
+            else:
+                continue
+            if change > tolerance:
+                regressions += 1
+                print(f"❌ 性能退化 {row['name']} {key}: {old} -> {value}（变差 {change:.0%}）")
+    if not regressions:
+        print(f"✅ 与基线 {path} 相比没有超过 {tolerance:.0%} 的退化")
+    return regressions
+
+
+def add_result_arguments(parser):
+    parser.add_argument('--json', help='把结果保存到JSON文件')
+    parser.add_argument('--baseline', help='与基线JSON文件对比，出现退化时以非零状态码退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+
+
+def finish(args, benchmark: str, rows: List[Dict[str, Any]]):
+    """按命令行参数保存结果并与基线对比"""
+    params = {k: v for k, v in vars(args).items() if k not in ('json', 'baseline', 'tolerance')}
+    if args.json:
+        save_results(args.json, benchmark, rows, params)
+    if args.baseline and compare_with_baseline(args.baseline, rows, args.tolerance):
+        sys.exit(1)
+
+
+class _HashModel:
+    """按文本摘要生成确定性随机向量的模型 - 编码几乎不耗时，用于隔离检索与导入本身的开销"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        return vectors
+
+
+class SyntheticEngine(EmbeddingEngine):
+    """合成嵌入引擎 - 不加载真实模型，向量维度与真实模型一致"""
+
+    backend = 'synthetic'
+
+    def __init__(self, dim: int = 384, **options):
+        super().__init__('synthetic', **options)
+        self.dim = dim
+
+    def _load(self):
+        return _HashModel(self.dim)
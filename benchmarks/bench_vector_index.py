@@ -0,0 +1,101 @@
+"""向量索引基准测试 - 比较各索引后端的召回率与查询延迟
+
+HNSW后端（faiss / hnsw）只构建一次，依次用 --ef-search 中的各个值查询，观察召回率与延迟的取舍。
+
+用法：
+    python benchmarks/bench_vector_index.py --size 100000 --dim 384 --backends exact ivf
+    python benchmarks/bench_vector_index.py --size 1000000 --backends exact ivf hnsw --ef-search 64 128 256
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import create_index, normalize_rows  # noqa: E402
+
+
+def make_dataset(size: int, dim: int, clusters: int, noise: float = 0.6, seed: int = 0) -> np.ndarray:
+    """生成带簇结构的归一化向量，近似真实文本嵌入的分布 - noise 越大簇内的点越接近等距，近似检索越难"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    data = np.empty((size, dim), dtype=np.float32)
+    for begin in range(0, size, 65536):
+        block = slice(begin, min(begin + 65536, size))
+        data[block] = centers[labels[block]] + noise * rng.standard_normal((block.stop - begin, dim)).astype(np.float32)
+    return normalize_rows(data)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(args):
+    print(f"生成数据: {args.size} 条 x {args.dim} 维")
+    data = make_dataset(args.size, args.dim, args.clusters, args.noise)
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(data[rng.choice(args.size, args.queries)] +
+                             0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+
+    # 以精确检索结果作为召回率基准
+    exact = create_index('exact')
+    exact.build(data)
+    truth = [set(exact.search(q, args.top_k)[0].tolist()) for q in queries]
+
+    print(f"{'后端':<16}{'构建(s)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'召回率@' + str(args.top_k):>12}")
+    for backend in args.backends:
+        options = {}
+        if backend == 'ivf':
+            options = {'nlist': args.nlist, 'nprobe': args.nprobe}
+        try:
+            index = create_index(backend, **options)
+        except ImportError as e:
+            print(f"{backend:<16}跳过（缺少可选依赖: {e.name}）")
+            continue
+
+        started = time.perf_counter()
+        index.build(data)
+        build_seconds = time.perf_counter() - started
+
+        for ef_search in args.ef_search if hasattr(index, 'ef_search') else [None]:
+            label = backend
+            if ef_search is not None:
+                index.ef_search = ef_search
+                label = f'{backend}(ef={ef_search})'
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                indices, _ = index.search(query, args.top_k)
+                latencies.append(time.perf_counter() - started)
+                hits += len(expected & set(indices.tolist()))
+            recall = hits / (len(queries) * args.top_k)
+            print(f"{label:<16}{build_seconds:>10.2f}{percentile_ms(latencies, 50):>10.3f}"
+                  f"{percentile_ms(latencies, 99):>10.3f}{recall:>12.3f}")
+        # 释放上一个索引再构建下一个，百万级数据时避免两个图索引同时占用内存
+        del index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引召回率/延迟基准测试")
+    parser.add_argument('--size', type=int, default=100000, help='向量数量')
+    parser.add_argument('--dim', type=int, default=384, help='向量维度（all-MiniLM-L6-v2为384）')
+    parser.add_argument('--clusters', type=int, default=1000, help='合成数据的簇数量')
+    parser.add_argument('--noise', type=float, default=0.6, help='簇内噪声的标准差（簇中心各维为标准正态分布）')
+    parser.add_argument('--queries', type=int, default=200, help='查询次数')
+    parser.add_argument('--top-k', type=int, default=10, help='每次查询返回的结果数')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF簇数量，0表示自动')
+    parser.add_argument('--nprobe', type=int, default=8, help='IVF每次查询扫描的簇数量')
+    parser.add_argument('--ef-search', nargs='+', type=int, default=[64, 128, 256],
+                        help='HNSW每次查询的候选列表长度，依次测试')
+    parser.add_argument('--backends', nargs='+', default=['exact', 'ivf', 'faiss', 'hnsw'],
+                        help='要测试的索引后端')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
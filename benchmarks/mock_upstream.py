@@ -0,0 +1,240 @@
+"""模拟上游服务 - 在本地模拟有道翻译（单条/批量）、智谱（普通/SSE流式）与Ollama（普通/流式/批量JSON）接口，供基准测试使用
+
+可配置延迟、错误率（返回503）与限流（每个引擎的QPS上限，超出时有道返回411、智谱返回429、Ollama返回503），
+每个接口的请求数、限流次数与错误次数记录在 app['stats'] 中。
+模拟的Ollama同时处理的请求数不超过 --ollama-parallel（对应 OLLAMA_NUM_PARALLEL），其余请求在服务端排队。
+
+用法：
+    python benchmarks/mock_upstream.py --port 18080 --latency 0.05 --error-rate 0.01 --rate-limit 50
+
+在其他基准测试中：
+    runner = await start_mock_upstream(port=0, latency=0.05)
+    point_to_mock(rag_system, mock_base_url(runner))
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class RateLimiter:
+    """固定窗口限流 - 每秒最多放行 qps 个请求，0表示不限流"""
+
+    def __init__(self, qps: float):
+        self.qps = qps
+        self._window = 0
+        self._count = 0
+
+    def allow(self) -> bool:
+        if not self.qps:
+            return True
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window, self._count = window, 0
+        self._count += 1
+        return self._count <= self.qps
+
+
+def _admit(request: web.Request, engine: str):
+    """按配置判断本次请求应当被限流、失败还是正常处理，返回 'throttled' / 'error' / None"""
+    app = request.app
+    app['stats'][f'{engine}_requests'] += 1
+    if not app['limiters'][engine].allow():
+        app['stats'][f'{engine}_throttled'] += 1
+        return 'throttled'
+    if app['error_rate'] and app['rng'].random() < app['error_rate']:
+        app['stats'][f'{engine}_errors'] += 1
+        return 'error'
+    return None
+
+
+async def youdao_single(request: web.Request) -> web.Response:
+    """有道单条翻译接口 - 返回 T(原文)"""
+    data = await request.post()
+    outcome = _admit(request, 'youdao')
+    if outcome == 'throttled':
+        return web.json_response({'errorCode': '411'})
+    if outcome == 'error':
+        return web.Response(status=503, text='service unavailable')
+    await asyncio.sleep(request.app['latency'])
+    return web.json_response({'errorCode': '0', 'translation': [f"T({data['q']})"]})
+
+
+async def youdao_batch(request: web.Request) -> web.Response:
+    """有道批量翻译接口 - 多个q参数，按顺序返回 translateResults"""
+    data = await request.post()
+    outcome = _admit(request, 'youdao')
+    if outcome == 'throttled':
+        return web.json_response({'errorCode': '411'})
+    if outcome == 'error':
+        return web.Response(status=503, text='service unavailable')
+    await asyncio.sleep(request.app['latency'])
+    results = [{'query': q, 'translation': f"T({q})", 'type': f"{data['from']}2{data['to']}"}
+               for q in data.getall('q')]
+    return web.json_response({'errorCode': '0', 'errorIndex': [], 'translateResults': results})
+
+
+def _zhipu_reply(prompt: str) -> str:
+    # 只回显提示词末尾的原文，译文长度与原文相近
+    return 'Z:' + prompt.rsplit('\n\n', 1)[-1][:200]
+
+
+async def zhipu_invoke(request: web.Request) -> web.Response:
+    """智谱普通接口"""
+    data = await request.json()
+    outcome = _admit(request, 'zhipu')
+    if outcome == 'throttled':
+        return web.json_response({'code': 1302, 'msg': '请求频率过高'}, status=429)
+    if outcome == 'error':
+        return web.Response(status=503, text='service unavailable')
+    await asyncio.sleep(request.app['latency'] * 2)
+    return web.json_response({'code': 200, 'data': {'choices': [{'content': _zhipu_reply(data['prompt'])}]}})
+
+
+async def zhipu_sse(request: web.Request) -> web.StreamResponse:
+    """智谱SSE流式接口 - 每次推送4个字符"""
+    data = await request.json()
+    outcome = _admit(request, 'zhipu')
+    if outcome == 'throttled':
+        return web.json_response({'code': 1302, 'msg': '请求频率过高'}, status=429)
+    if outcome == 'error':
+        return web.Response(status=503, text='service unavailable')
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    text = _zhipu_reply(data['prompt'])
+    delay = request.app['latency'] * 2 / max(1, len(text) // 4)
+    for start in range(0, len(text), 4):
+        await asyncio.sleep(delay)
+        await response.write(f"event: add\ndata: {text[start:start + 4]}\n\n".encode('utf-8'))
+    await response.write(b"event: finish\ndata: \n\n")
+    await response.write_eof()
+    return response
+
+
+def _ollama_reply(prompt: str, response_format) -> str:
+    # 批量请求的提示词末尾为原文的JSON数组，按顺序逐条回显；否则只回显末尾的原文
+    source = prompt.rsplit('\n\n', 1)[-1]
+    if response_format is not None:
+        return json.dumps({'translations': ['L:' + text[:200] for text in json.loads(source)]}, ensure_ascii=False)
+    return 'L:' + source[:200]
+
+
+async def ollama_generate(request: web.Request) -> web.StreamResponse:
+    """Ollama /api/generate 接口 - 不带提示词时只加载模型；stream为真时按NDJSON每次推送4个字符
+
+    批量请求（带 format）的耗时按条数增加，每多一条增加四分之一，模拟一次推理中生成更多token。
+    """
+    data = await request.json()
+    app = request.app
+    outcome = _admit(request, 'local')
+    if outcome is not None:
+        return web.json_response({'error': 'server busy, please try again'}, status=503)
+    app['stats'][f"local_keep_alive_{data.get('keep_alive')}"] += 1
+    if not data.get('prompt'):
+        app['stats']['local_loads'] += 1
+        return web.json_response({'model': data['model'], 'response': '', 'done': True, 'done_reason': 'load'})
+
+    response_format = data.get('format')
+    items = len(json.loads(data['prompt'].rsplit('\n\n', 1)[-1])) if response_format is not None else 1
+    app['stats']['local_items'] += items
+    async with app['ollama_slots']:
+        app['stats']['local_active'] += 1
+        app['stats']['local_peak_active'] = max(app['stats']['local_peak_active'], app['stats']['local_active'])
+        try:
+            text = _ollama_reply(data['prompt'], response_format)
+            latency = app['latency'] * 2 * (1 + 0.25 * (items - 1))
+            if not data.get('stream', True):
+                await asyncio.sleep(latency)
+                return web.json_response({'model': data['model'], 'response': text, 'done': True})
+            response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+            await response.prepare(request)
+            delay = latency / max(1, len(text) // 4)
+            for start in range(0, len(text), 4):
+                await asyncio.sleep(delay)
+                chunk = {'model': data['model'], 'response': text[start:start + 4], 'done': False}
+                await response.write((json.dumps(chunk, ensure_ascii=False) + '\n').encode('utf-8'))
+            await response.write(b'{"response": "", "done": true}\n')
+            await response.write_eof()
+            return response
+        finally:
+            app['stats']['local_active'] -= 1
+
+
+async def ping(request: web.Request) -> web.Response:
+    """连接预热使用的HEAD请求"""
+    return web.Response()
+
+
+def create_app(latency: float = 0.05, error_rate: float = 0.0, rate_limit: float = 0, seed: int = 0,
+               ollama_parallel: int = 2) -> web.Application:
+    app = web.Application()
+    app['latency'] = latency  # 每个请求的模拟耗时（秒），智谱与Ollama接口为两倍
+    app['error_rate'] = error_rate  # 返回503的请求比例
+    # 每个引擎的QPS上限
+    app['limiters'] = {engine: RateLimiter(rate_limit) for engine in ('youdao', 'zhipu', 'local')}
+    app['ollama_slots'] = asyncio.Semaphore(ollama_parallel)  # 模拟Ollama同时处理的请求数
+    app['rng'] = random.Random(seed)  # 固定种子，错误出现的位置可复现
+    app['stats'] = Counter()
+    app.router.add_post('/youdao/api', youdao_single)
+    app.router.add_post('/youdao/v2/api', youdao_batch)
+    app.router.add_post('/zhipu/invoke', zhipu_invoke)
+    app.router.add_post('/zhipu/sse-invoke', zhipu_sse)
+    app.router.add_post('/ollama/api/generate', ollama_generate)
+    app.router.add_route('HEAD', '/{tail:.*}', ping)
+    return app
+
+
+async def start_mock_upstream(host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                              error_rate: float = 0.0, rate_limit: float = 0, seed: int = 0,
+                              ollama_parallel: int = 2) -> web.AppRunner:
+    """在当前事件循环中启动模拟服务，port为0时自动选择空闲端口"""
+    runner = web.AppRunner(create_app(latency, error_rate, rate_limit, seed, ollama_parallel), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def mock_base_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+def mock_stats(runner: web.AppRunner) -> Counter:
+    """模拟服务收到的请求数、限流次数与错误次数"""
+    return runner.app['stats']
+
+
+def point_to_mock(rag_system, base_url: str):
+    """把RAG系统的上游接口地址与密钥指向模拟服务"""
+    rag_system.youdao_appid = 'bench-appid'
+    rag_system.youdao_key = 'bench-key'
+    rag_system.zhipu_api_key = 'bench-key'
+    rag_system.youdao_api_url = f"{base_url}/youdao/api"
+    rag_system.youdao_batch_api_url = f"{base_url}/youdao/v2/api"
+    rag_system.zhipu_api_url = f"{base_url}/zhipu/invoke"
+    rag_system.zhipu_stream_url = f"{base_url}/zhipu/sse-invoke"
+    rag_system.ollama_url = f"{base_url}/ollama"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟有道/智谱上游服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的模拟耗时（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回503的请求比例')
+    parser.add_argument('--rate-limit', type=float, default=0, help='每个引擎的QPS上限，0表示不限流')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--ollama-parallel', type=int, default=2, help='模拟Ollama同时处理的请求数')
+    args = parser.parse_args()
+    print(f"模拟上游服务: http://{args.host}:{args.port}，延迟 {args.latency}s，"
+          f"错误率 {args.error_rate}，限流 {args.rate_limit or '无'}，Ollama地址 /ollama")
+    web.run_app(create_app(args.latency, args.error_rate, args.rate_limit, args.seed, args.ollama_parallel),
+                host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
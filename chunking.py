@@ -0,0 +1,153 @@
+import hashlib
+import re
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+# 段落：按行切分，连续空行视为段落间隔
+PARAGRAPH_PATTERN = re.compile(r'[^\n]+')
+# 句末标点：中文句号/问号/叹号/分号/省略号（含后随的引号、括号），以及后接空白的英文句点
+SENTENCE_END_PATTERN = re.compile(r'[。！？!?；;…]+[”’"\'」』）)\]]*|\.(?=\s|$)')
+# 中日韩表意文字及全角标点，MiniLM等BERT类分词器对每个字符单独计一个token
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def _char_cost(char: str) -> float:
+    """单个字符的近似token开销 - 汉字及全角标点约1个token，其余可见字符约4个一个token"""
+    if char.isspace():
+        return 0.0
+    if CJK_PATTERN.match(char):
+        return 1.0
+    return 0.25
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数，用于在不加载分词器的情况下控制窗口大小"""
+    return int(round(sum(_char_cost(char) for char in text)))
+
+
+def make_chunk_id(source: str, start: int, end: int, text: str) -> str:
+    """基于来源、原文偏移和内容的稳定分块ID"""
+    return hashlib.sha1(f"{source}:{start}:{end}:{text}".encode('utf-8')).hexdigest()[:16]
+
+
+def rebase_chunks(chunks: List[Dict[str, Any]], offset: int, first_index: int) -> List[Dict[str, Any]]:
+    """把分段分块得到的偏移与序号换算到整篇文本中 - 用于按页码范围分别分块的大文件，同时重新计算分块ID"""
+    for i, chunk in enumerate(chunks):
+        chunk['start'] += offset
+        chunk['end'] += offset
+        chunk['chunk_index'] = first_index + i
+        chunk['chunk_id'] = make_chunk_id(chunk['source'], chunk['start'], chunk['end'], chunk['text'])
+    return chunks
+
+
+class TextChunker:
+    """文本分块器 - 按段落/句子切分，并按token预算打包成带重叠的窗口
+
+    每个分块保留原文中的字符偏移 (start, end) 以及基于来源、偏移和内容的稳定ID，
+    同一文件重复导入时得到相同的分块ID。
+    """
+
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens 必须小于 max_tokens")
+        self.max_tokens = max_tokens  # 每个分块的token上限（all-MiniLM-L6-v2的窗口为256）
+        self.overlap_tokens = overlap_tokens  # 相邻分块之间重叠的token数
+        self.count_tokens = count_tokens or estimate_tokens  # 可替换为真实分词器的计数函数
+
+    def _split_sentences(self, text: str) -> List[Tuple[int, int, bool]]:
+        """切分句子，返回 (起始偏移, 结束偏移, 是否段落首句) 列表"""
+        sentences = []
+        for paragraph in PARAGRAPH_PATTERN.finditer(text):
+            first = True
+            position = paragraph.start()
+            boundaries = [m.end() for m in SENTENCE_END_PATTERN.finditer(text, paragraph.start(), paragraph.end())]
+            for end in boundaries + [paragraph.end()]:
+                span = self._strip(text, position, end)
+                if span:
+                    for piece in self._split_long(text, *span):
+                        sentences.append((piece[0], piece[1], first))
+                        first = False
+                position = end
+        return sentences
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """去掉首尾空白后的区间，空区间返回None"""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if start < end else None
+
+    def _split_long(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """超过token上限的长句按字符硬切分"""
+        if self.count_tokens(text[start:end]) <= self.max_tokens:
+            return [(start, end)]
+        pieces = []
+        piece_start = start
+        cost = 0.0
+        for position in range(start, end):
+            char_cost = _char_cost(text[position])
+            if cost + char_cost > self.max_tokens and position > piece_start:
+                pieces.append((piece_start, position))
+                piece_start = position
+                cost = 0.0
+            cost += char_cost
+        pieces.append((piece_start, end))
+        return pieces
+
+    def _windows(self, text: str, sentences: List[Tuple[int, int, bool]]) -> List[Tuple[int, int]]:
+        """把句子打包成不超过token上限的窗口，窗口之间保留末尾若干句作为重叠"""
+        windows = []
+        current = []  # 当前窗口中的句子下标
+        current_tokens = 0
+        costs = [self.count_tokens(text[s:e]) for s, e, _ in sentences]
+
+        for i, (_, _, paragraph_start) in enumerate(sentences):
+            # 超出预算，或在窗口已过半时遇到新段落，则结束当前窗口（优先在段落边界切分）
+            overflow = current_tokens + costs[i] > self.max_tokens
+            paragraph_break = paragraph_start and current_tokens >= self.max_tokens // 2
+            if current and (overflow or paragraph_break):
+                windows.append((sentences[current[0]][0], sentences[current[-1]][1]))
+                # 从窗口末尾回收不超过重叠预算的句子，且不能回收整个窗口
+                carry = []
+                carry_tokens = 0
+                for j in reversed(current[1:]):
+                    if carry_tokens + costs[j] > self.overlap_tokens:
+                        break
+                    carry.insert(0, j)
+                    carry_tokens += costs[j]
+                if carry_tokens + costs[i] > self.max_tokens:
+                    carry, carry_tokens = [], 0
+                current, current_tokens = carry, carry_tokens
+            current.append(i)
+            current_tokens += costs[i]
+
+        if current:
+            windows.append((sentences[current[0]][0], sentences[current[-1]][1]))
+        return windows
+
+    def chunk_text(self, text: str, source: str = '') -> List[Dict[str, Any]]:
+        """把一段文本切分为分块列表"""
+        chunks = []
+        for index, (start, end) in enumerate(self._windows(text, self._split_sentences(text))):
+            chunk_text = text[start:end]
+            chunks.append({
+                "text": chunk_text,
+                "source": source,
+                "chunk_id": make_chunk_id(source, start, end, chunk_text),
+                "chunk_index": index,
+                "start": start,
+                "end": end
+            })
+        return chunks
+
+    def chunk_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """对文件处理器输出的文档逐个分块，保留文档上的其余字段"""
+        chunks = []
+        for document in documents:
+            text = str(document.get("text", ""))
+            extra = {k: v for k, v in document.items() if k != "text"}
+            for chunk in self.chunk_text(text, str(document.get("source", ""))):
+                chunks.append({**extra, **chunk})
+        return chunks
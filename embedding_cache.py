@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+from result_cache import make_cache_key  # 内容寻址的缓存键
+
+
+class EmbeddingCache:
+    """嵌入向量缓存 - 以 (模型名, 文本) 的摘要为键，内存层按字节数做LRU淘汰，可选SQLite磁盘层
+
+    向量按 dtype（float32 或 float16）以原始字节存储。encode() 只把未命中的文本交给模型编码，
+    全部命中时不会触发模型加载与前向计算。
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, path: str = '',
+                 max_disk_bytes: int = 2 * 1024 * 1024 * 1024, dtype: str = 'float32'):
+        self.max_bytes = max_bytes  # 内存层的字节数上限
+        self.path = path  # SQLite文件路径，为空时只使用内存层
+        self.max_disk_bytes = max_disk_bytes  # 磁盘层的字节数上限
+        self.dtype = np.dtype(dtype)  # 向量的存储精度，float16可减半内存与磁盘占用
+        self._entries = OrderedDict()  # key -> 向量
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_writes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if path:
+            self._open_db()
+
+    def _open_db(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at)')
+
+    def key(self, model_name: str, text: str) -> str:
+        return make_cache_key('embedding', model_name, self.dtype.name, text)
+
+    def encode(self, model_name: str, texts: Sequence[str],
+               encode_fn: Callable[[List[str]], Any]) -> np.ndarray:
+        """编码文本列表，返回 (len(texts), dim) 的矩阵 - 命中的直接取缓存，未命中的去重后一次性编码"""
+        keys = [self.key(model_name, text) for text in texts]
+        found = self._get_many(keys)
+
+        missing = {}  # key -> 文本，同一批中重复的文本只编码一次
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=self.dtype)
+            computed = dict(zip(missing, vectors))
+            self._set_many(computed)
+            found.update(computed)
+
+        if not keys:
+            return np.empty((0, 0), dtype=self.dtype)
+        return np.stack([found[key] for key in keys])
+
+    def _get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            memory_hits = set(found)
+
+            remaining = [key for key in dict.fromkeys(keys) if key not in found]
+            if remaining and self._db is not None:
+                now = time.time()
+                # SQLite对单条语句的参数数量有限制，分批查询
+                for start in range(0, len(remaining), 500):
+                    batch = remaining[start:start + 500]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = self._db.execute(
+                        f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=self.dtype)
+                        found[key] = vector
+                        self._put_memory(key, vector)
+                    if rows:
+                        self._db.executemany('UPDATE embeddings SET accessed_at = ? WHERE key = ?',
+                                             [(now, key) for key, _ in rows])
+
+            # 按请求次数统计，同一批中重复的文本各计一次
+            for key in keys:
+                if key in memory_hits:
+                    self.stats['hits'] += 1
+                elif key in found:
+                    self.stats['disk_hits'] += 1
+                else:
+                    self.stats['misses'] += 1
+        return found
+
+    def _set_many(self, vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._put_memory(key, vector)
+            if self._db is not None and vectors:
+                now = time.time()
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)',
+                    [(key, vector.tobytes(), vector.nbytes, now) for key, vector in vectors.items()]
+                )
+                self._disk_writes += len(vectors)
+                if self._disk_writes >= 1000:
+                    self._disk_writes = 0
+                    self._prune_disk()
+
+    def _put_memory(self, key: str, vector: np.ndarray):
+        if vector.nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).nbytes
+        vector = np.array(vector, dtype=self.dtype)  # 独立副本，不引用调用方的批量矩阵
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        # 按最近最少使用顺序淘汰，直到总字节数回到上限以内
+        while self._bytes > self.max_bytes:
+            _, oldest = self._entries.popitem(last=False)
+            self._bytes -= oldest.nbytes
+            self.stats['evictions'] += 1
+
+    def _prune_disk(self):
+        """按最近访问时间淘汰磁盘层中超出字节上限的部分"""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM embeddings').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        freed = 0
+        victims = []
+        for key, size in self._db.execute('SELECT key, size FROM embeddings ORDER BY accessed_at'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany('DELETE FROM embeddings WHERE key = ?', victims)
+
+    def clear(self):
+        """清空内存层与磁盘层"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM embeddings')
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        """返回命中统计及容量信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
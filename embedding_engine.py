@@ -0,0 +1,135 @@
+import threading
+from typing import Optional, Sequence
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+
+class EmbeddingEngine:
+    """嵌入引擎 - 统一封装模型加载、批大小、线程数、输出归一化与输出精度
+
+    模型在第一次使用时加载。encode() 返回按行归一化（可关闭）的float32或float16矩阵。
+    不同后端生成的向量略有差异，cache_id 用于区分嵌入缓存。
+    """
+
+    backend = 'torch'
+
+    def __init__(self, model_name: str, batch_size: int = 64, threads: int = 0, normalize: bool = True,
+                 dtype: str = 'float32', device: str = 'cpu'):
+        self.model_name = model_name
+        self.batch_size = batch_size  # 每次前向计算的句子数
+        self.threads = threads  # 算子内并行线程数，0表示使用框架默认值
+        self.normalize = normalize  # 输出前按行做L2归一化
+        self.dtype = np.dtype(dtype)  # 输出精度：float32 或 float16
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"不支持的嵌入输出精度: {dtype}，可选: float32, float16")
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_id(self) -> str:
+        """嵌入缓存中使用的模型标识 - 默认后端与模型名相同，其余后端附加后端名"""
+        return self.model_name if self.backend == 'torch' else f"{self.model_name}@{self.backend}"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """懒加载模型 - 多线程同时首次使用时只加载一次"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        raise NotImplementedError
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """编码文本列表，返回 (len(texts), dim) 的矩阵"""
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize and len(vectors):
+            vectors = normalize_rows(vectors)
+        return vectors.astype(self.dtype, copy=False)
+
+
+class TorchEngine(EmbeddingEngine):
+    """PyTorch后端 - sentence-transformers默认实现"""
+
+    backend = 'torch'
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer  # 用于文本嵌入
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)  # 进程级设置，影响所有PyTorch计算
+        return SentenceTransformer(self.model_name, device=self.device)
+
+
+class TorchInt8Engine(TorchEngine):
+    """PyTorch动态int8量化后端 - 线性层权重量化为int8，无需额外依赖"""
+
+    backend = 'torch-int8'
+
+    def _load(self):
+        import torch
+        model = super()._load()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class OnnxEngine(EmbeddingEngine):
+    """ONNX Runtime后端 - 需要安装 sentence-transformers[onnx]，使用模型仓库中导出好的ONNX文件"""
+
+    backend = 'onnx'
+    default_file = None  # 为None时使用仓库中的 onnx/model.onnx
+
+    def __init__(self, model_name: str, onnx_file: Optional[str] = None, **options):
+        super().__init__(model_name, **options)
+        self.onnx_file = onnx_file or self.default_file  # 模型仓库中的ONNX文件路径
+
+    def _load(self):
+        import onnxruntime  # ONNX推理，未安装时在加载阶段报错
+        from sentence_transformers import SentenceTransformer  # 用于文本嵌入
+        model_kwargs = {'provider': 'CPUExecutionProvider'}
+        if self.threads:
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.threads
+            model_kwargs['session_options'] = session_options
+        if self.onnx_file:
+            model_kwargs['file_name'] = self.onnx_file
+        return SentenceTransformer(self.model_name, device=self.device, backend='onnx', model_kwargs=model_kwargs)
+
+
+class OnnxInt8Engine(OnnxEngine):
+    """ONNX Runtime int8量化后端 - 默认使用仓库中面向AVX2的量化模型，其他指令集可通过onnx_file指定"""
+
+    backend = 'onnx-int8'
+    default_file = 'onnx/model_quint8_avx2.onnx'
+
+
+EMBEDDING_BACKENDS = {
+    'torch': TorchEngine,
+    'torch-int8': TorchInt8Engine,
+    'onnx': OnnxEngine,
+    'onnx-int8': OnnxInt8Engine,
+}
+
+
+def create_embedding_engine(backend: str = 'torch', model_name: str = 'all-MiniLM-L6-v2', **options) -> EmbeddingEngine:
+    """根据配置名称创建嵌入引擎"""
+    backend = (backend or 'torch').lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的嵌入后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+    if not backend.startswith('onnx'):
+        options.pop('onnx_file', None)
+    return EMBEDDING_BACKENDS[backend](model_name, **options)
@@ -1,23 +1,55 @@
 import os
 import json
-from docx import Document  # 用于处理Word文档
-from PyPDF2 import PdfReader  # 用于处理PDF文件
 import numpy as np
-from sentence_transformers import SentenceTransformer  # 用于文本嵌入
-from sklearn.metrics.pairwise import cosine_similarity  # 用于计算向量相似度
-from ollama import Client  # 用于连接本地大模型
 import time
-from typing import List, Dict, Any  # 类型注解
+from typing import List, Dict, Any, Awaitable, Callable, Iterable, Optional, Sequence, Tuple  # 类型注解
 import re
-import requests
 import asyncio  # 异步处理
-from functools import lru_cache  # 缓存装饰器
 import concurrent.futures  # 线程池
+import contextvars  # 把请求的调用链传入线程池
 import hashlib  # 用于生成签名
 import urllib.parse
 import random
 import aiohttp  # 异步HTTP请求
 import uuid
+import threading
+import collections
+import multiprocessing
+from vector_store import EmbeddingStore, KnowledgeBaseSnapshot  # 增量式向量存储与知识库快照
+from shared_store import SharedKnowledgeBase  # 多工作进程共享的内存映射知识库
+from vector_index import create_index, normalize_rows  # 可插拔向量索引
+from lexical_index import BM25Index, reciprocal_rank_fusion  # BM25倒排索引与排名融合
+from chunking import TextChunker, rebase_chunks  # 知识库文档分块
+from http_client import HTTPClient  # 共享的异步HTTP连接池
+from result_cache import ResultCache, make_cache_key  # 翻译与分析结果缓存
+from embedding_cache import EmbeddingCache  # 嵌入向量缓存
+from embedding_engine import create_embedding_engine  # 可配置的嵌入引擎
+from ingest import (  # 文件解析与多进程批量导入
+    parse_file, open_parse_cache, file_digest, iter_files, init_worker,
+    parse_and_chunk, format_throughput, pdf_page_ranges, docx_needs_split, iter_docx_parts
+)
+from batching import RequestCoalescer, SingleFlight  # 有道批量翻译请求合并、相同并发请求的单飞合并
+from rate_limit import (  # 上游引擎限流、重试与熔断
+    CircuitOpenError, EngineLimiter, OK, RETRY, THROTTLED, UPSTREAM_ERRORS, wait_for_active
+)
+from metrics import REGISTRY, STAGE_ERRORS, Trace, record_stage, run_traced, start_trace, timed_stage  # 监控指标与调用链
+
+# 由 FileRAGSystem._collect_metrics 在每次导出指标前刷新
+CACHE_REQUESTS = REGISTRY.counter('rag_cache_requests_total', '缓存查询次数，按命中结果分类', ('cache', 'result'))
+CACHE_HIT_RATIO = REGISTRY.gauge('rag_cache_hit_ratio', '缓存命中率（内存与磁盘命中之和）', ('cache',))
+CACHE_BYTES = REGISTRY.gauge('rag_cache_memory_bytes', '缓存内存层占用的字节数', ('cache',))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge('rag_upstream_in_flight_requests', '正在进行的上游请求数', ('engine',))
+UPSTREAM_QPS = REGISTRY.gauge('rag_upstream_qps', '上游引擎当前生效的每秒请求数上限', ('engine',))
+UPSTREAM_BREAKER_OPEN = REGISTRY.gauge('rag_upstream_breaker_open', '断路器是否打开（1为打开或半开）', ('engine',))
+KB_DOCUMENTS = REGISTRY.gauge('rag_knowledge_base_documents', '知识库中的文档分块数')
+KB_EMBEDDING_BYTES = REGISTRY.gauge('rag_knowledge_base_embedding_bytes', '知识库向量矩阵已分配的字节数')
+KB_VERSION = REGISTRY.gauge('rag_knowledge_base_version', '当前发布的知识库快照版本')
+KB_LEXICAL_TERMS = REGISTRY.gauge('rag_knowledge_base_lexical_terms', 'BM25倒排索引中的词数')
+KB_SHARED_WRITER = REGISTRY.gauge('rag_shared_kb_writer', '本进程是否为共享知识库的写入进程（1为写入进程）')
+SINGLE_FLIGHT_REQUESTS = REGISTRY.counter(
+    'rag_single_flight_requests_total', '可合并的请求数，按实际执行（executed）或等待进行中的相同请求（shared）分类',
+    ('scope', 'result')
+)
 
 
 class FileRAGSystem:
@@ -25,8 +57,11 @@ class FileRAGSystem:
         # 初始化API配置 - 这里填入实际的API密钥
         self.youdao_appid = "YOUR_YOUDAO_APPID"  # 网易有道翻译APPID
         self.youdao_key = "YOUR_YOUDAO_KEY"  # 网易有道翻译密钥
+        self.youdao_api_url = "https://openapi.youdao.com/api"  # 网易有道翻译接口地址
+        self.youdao_batch_api_url = "https://openapi.youdao.com/v2/api"  # 网易有道批量翻译接口地址
         self.zhipu_api_key = "YOUR_ZHIPU_API_KEY"  # 智谱API密钥
         self.zhipu_api_url = "https://open.bigmodel.cn/api/paas/v3/model-api/GLM-4-Flash/invoke"
+        self.zhipu_stream_url = "https://open.bigmodel.cn/api/paas/v3/model-api/GLM-4-Flash/sse-invoke"  # 流式接口
         
         # 检查API配置并提供警告
         if self.youdao_appid == "YOUR_YOUDAO_APPID" or self.youdao_key == "YOUR_YOUDAO_KEY":
@@ -43,9 +78,64 @@ class FileRAGSystem:
             print("3. 创建应用获取API密钥")
             print("4. 将获取的API密钥填入代码中")
 
-        # 初始化知识库和嵌入向量
-        self.knowledge_base = []  # 存储文档内容
-        self.embeddings = None  # 存储文档的向量表示
+        # 初始化知识库和嵌入向量 - 文档与向量统一由增量存储管理
+        self.embedding_store = EmbeddingStore()
+        self.embedding_model_name = 'all-MiniLM-L6-v2'  # 嵌入模型名称，随知识库一起保存
+
+        # 嵌入引擎配置 - 可选 torch / torch-int8 / onnx / onnx-int8，批大小、线程数与输出精度可调
+        self.embedding_engine = create_embedding_engine(
+            os.getenv('RAG_EMBED_BACKEND', 'torch'),
+            self.embedding_model_name,
+            batch_size=int(os.getenv('RAG_EMBED_BATCH_SIZE', '64')),
+            threads=int(os.getenv('RAG_EMBED_THREADS', '0')),
+            dtype=os.getenv('RAG_EMBED_DTYPE', 'float32'),
+            onnx_file=os.getenv('RAG_EMBED_ONNX_FILE') or None
+        )
+
+        # 向量索引配置 - 可选 exact / ivf / faiss / hnsw
+        self.index_backend = os.getenv('RAG_INDEX_BACKEND', 'exact')
+        index_options = {}
+        if self.index_backend == 'ivf':
+            index_options = {
+                'nlist': int(os.getenv('RAG_IVF_NLIST', '0')),
+                'nprobe': int(os.getenv('RAG_IVF_NPROBE', '8'))
+            }
+        elif self.index_backend in ('faiss', 'hnsw'):
+            index_options = {
+                'm': int(os.getenv('RAG_HNSW_M', '32')),
+                'ef_construction': int(os.getenv('RAG_HNSW_EF_CONSTRUCTION', '200')),
+                'ef_search': int(os.getenv('RAG_HNSW_EF_SEARCH', '512'))
+            }
+        self.vector_index = create_index(self.index_backend, **index_options)
+        self._index_lock = threading.Lock()  # 写入方互斥，保证向量存储与索引按同样的顺序更新
+
+        # 检索模式 - dense（向量检索）/ lexical（BM25关键词检索，不编码查询）/ hybrid（两者按排名融合）
+        self.retrieval_mode = os.getenv('RAG_RETRIEVAL_MODE', 'hybrid').lower()
+        if self.retrieval_mode not in ('dense', 'lexical', 'hybrid'):
+            raise ValueError(f"不支持的检索模式: {self.retrieval_mode}，可选: dense, lexical, hybrid")
+        # BM25倒排索引在导入时与向量索引同步更新，只使用向量检索时不建立
+        self.lexical_index = BM25Index(
+            os.getenv('RAG_LEXICAL_TOKENIZER', 'ngram'),
+            k1=float(os.getenv('RAG_BM25_K1', '1.5')),
+            b=float(os.getenv('RAG_BM25_B', '0.75'))
+        ) if self.retrieval_mode != 'dense' else None
+        self.rrf_k = int(os.getenv('RAG_RRF_K', '60'))  # 排名融合的平滑常数
+        self.hybrid_candidates = int(os.getenv('RAG_HYBRID_CANDIDATES', '20'))  # 融合前每种检索各取的候选数
+
+        # 知识库快照 - 检索只读取已发布的快照，无需加锁；写入方修改完成后整体替换快照引用
+        self._snapshot = KnowledgeBaseSnapshot(
+            0, [], None, self.vector_index.snapshot(),
+            self.lexical_index.snapshot() if self.lexical_index is not None else None
+        )
+        self._appended_from = 0  # 上次发布之后只追加了文档时新文档的起始行号，有删除或重建时为None
+        self._upload_seq = 0  # 上传序号
+        self._latest_uploads = {}  # 来源 -> 最近一次上传（或删除）的序号，较早的上传晚于较新的完成时被丢弃
+
+        # 分块配置 - 文件处理之后、向量编码之前把文档切成带重叠的窗口
+        self.chunker = TextChunker(
+            max_tokens=int(os.getenv('RAG_CHUNK_TOKENS', '256')),
+            overlap_tokens=int(os.getenv('RAG_CHUNK_OVERLAP', '32'))
+        )
 
         # 文件处理配置 - 支持的文件类型及对应的处理函数
         self.supported_extensions = {
@@ -55,6 +145,40 @@ class FileRAGSystem:
             '.json': self._process_json
         }
 
+        # 批量导入配置 - 解析进程数与每批编码的分块数
+        self.ingest_workers = int(os.getenv('RAG_INGEST_WORKERS', '0')) or os.cpu_count() or 1
+        self.ingest_batch_size = int(os.getenv('RAG_INGEST_BATCH_SIZE', '1024'))
+        # 大PDF按页码范围切分，每个范围单独解析、分块并写入知识库，0表示不切分
+        self.pdf_pages_per_part = int(os.getenv('RAG_PDF_PAGES_PER_PART', '50'))
+        # 大docx按段落分批分块并写入知识库的每批段落数，0表示整篇处理
+        self.docx_paragraphs_per_part = int(os.getenv('RAG_DOCX_PARAGRAPHS_PER_PART', '2000'))
+
+        # 多工作进程共享知识库 - 设置目录后，同一目录下的多个工作进程中只有一个写入进程负责导入并发布版本，
+        # 其余只读进程以内存映射方式加载已发布的版本，并把上传与删除请求转交给写入进程
+        shared_dir = os.getenv('RAG_SHARED_KB_DIR', '')
+        self.shared_kb = SharedKnowledgeBase(shared_dir) if shared_dir else None
+        self.shared_poll_interval = float(os.getenv('RAG_SHARED_KB_POLL', '1'))  # 检查新版本与转交请求的间隔（秒）
+        self.shared_role = None  # writer / reader，加入共享知识库之前为None
+        self._shared_meta = None  # 本进程已加载或已发布的共享版本元数据
+        self._shared_fallback = None  # 共享目录中还没有版本时，写入进程从该目录加载最近保存的知识库
+
+        # 解析结果缓存 - 按文件内容摘要与解析器版本缓存提取出的文本，保存在磁盘上，重启后仍然有效，
+        # 命令行、网页端与批量导入的子进程共用同一个SQLite文件
+        self.parse_cache_options = {
+            'path': os.getenv('RAG_PARSE_CACHE_PATH', os.path.join('cache', 'parse_cache.db')),
+            'max_bytes': int(os.getenv('RAG_PARSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+            'max_disk_bytes': int(os.getenv('RAG_PARSE_CACHE_MAX_DISK_BYTES', str(1024 * 1024 * 1024)))
+        }
+        self.parse_cache = open_parse_cache(**self.parse_cache_options)
+
+        # 嵌入向量缓存 - 按模型名与文本摘要缓存向量，重复的查询和重复导入的分块不再重新编码
+        self.embedding_cache = EmbeddingCache(
+            max_bytes=int(os.getenv('RAG_EMBED_CACHE_MAX_BYTES', str(128 * 1024 * 1024))),
+            path=os.getenv('RAG_EMBED_CACHE_PATH', ''),
+            max_disk_bytes=int(os.getenv('RAG_EMBED_CACHE_MAX_DISK_BYTES', str(2 * 1024 * 1024 * 1024))),
+            dtype=self.embedding_engine.dtype.name
+        )
+
         # 提示词模板 - 用于RAG问答
         self.prompt_template = """基于以下上下文回答问题：
 
@@ -164,69 +288,427 @@ class FileRAGSystem:
 3. 如果发现润色后的文本存在明显问题（如重复、语义错误等），必须明确指出
 4. 最终结论必须基于以上分析得出"""
 
+        # 版本对比提示词模板 - 文档润色时对比有道与智谱两个润色版本
+        self.version_compare_template = """请详细对比分析以下两个润色版本，判断哪个更好：
+
+原文：
+{original}
+
+有道翻译润色版本：
+{youdao}
+
+智谱API润色版本：
+{zhipu}
+
+请从以下几个方面进行详细对比分析：
+1. 语义准确性：哪个版本更准确地保留了原文的核心含义和细节
+2. 专业性：哪个版本对专业术语和概念的处理更准确
+3. 语言流畅度：哪个版本的表达更自然流畅，更符合中文表达习惯
+4. 结构与逻辑：哪个版本在结构和逻辑上更清晰连贯
+5. 语法与措辞：哪个版本的语法更准确，词语选择更恰当
+
+综合对比：
+1. 明确指出哪个版本总体更优秀，给出具体理由
+2. 分析两个版本各自的优缺点
+3. 建议如何结合两个版本的优点得到最佳润色文本
+
+请提供一个最佳润色版本，可以直接采用更好的那个版本，或结合两者的优点创建一个优化版本。
+
+输出格式：
+1. 分点对比分析（按上述5个维度）
+2. 综合结论（明确指出哪个版本更好，或各有什么优点）
+3. 最佳润色推荐
+"""
+
         # 创建线程池 - 用于并行处理任务
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
 
-        # 缓存配置 - 用于存储已处理的翻译和分析结果
-        self.translation_cache = {}
-        self.analysis_cache = {}
+        # 共享的异步HTTP客户端 - 有道与智谱请求复用长连接
+        self.http = HTTPClient(
+            limit=int(os.getenv('RAG_HTTP_POOL_SIZE', '100')),
+            limit_per_host=int(os.getenv('RAG_HTTP_POOL_PER_HOST', '20')),
+            keepalive_timeout=float(os.getenv('RAG_HTTP_KEEPALIVE', '30')),
+            total_timeout=float(os.getenv('RAG_HTTP_TIMEOUT', '60')),
+            connect_timeout=float(os.getenv('RAG_HTTP_CONNECT_TIMEOUT', '10'))
+        )
+
+        # 缓存配置 - 用于存储已处理的翻译和分析结果（内存LRU + 可选SQLite磁盘层）
+        cache_options = {
+            'max_bytes': int(os.getenv('RAG_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            'ttl': float(os.getenv('RAG_CACHE_TTL', str(7 * 24 * 3600))),
+            'path': os.getenv('RAG_CACHE_PATH', ''),
+            'max_disk_bytes': int(os.getenv('RAG_CACHE_MAX_DISK_BYTES', str(512 * 1024 * 1024)))
+        }
+        self.translation_cache = ResultCache('translation', **cache_options)
+        self.analysis_cache = ResultCache('analysis', **cache_options)
+
+        # 文档润色并发配置 - 文档切分为段落级片段并发润色，各上游引擎分别限制并发请求数
+        self.polish_chunker = TextChunker(
+            max_tokens=int(os.getenv('RAG_POLISH_SEGMENT_TOKENS', '300')),
+            overlap_tokens=0  # 片段需要按顺序拼接回原文，不能重叠
+        )
+        self.segment_concurrency = int(os.getenv('RAG_POLISH_SEGMENT_CONCURRENCY', '16'))
+        self.polish_timeout = float(os.getenv('RAG_POLISH_TIMEOUT', '60'))  # 单段文本润色流程的超时（秒）
+        # 上游引擎流量控制 - 并发上限、令牌桶限速（检测到限流时自适应降速）、指数退避重试与断路器
+        retry_options = {
+            'max_retries': int(os.getenv('RAG_RETRY_MAX', '3')),
+            'base_delay': float(os.getenv('RAG_RETRY_BASE_DELAY', '0.5')),
+            'max_delay': float(os.getenv('RAG_RETRY_MAX_DELAY', '8')),
+            'failure_threshold': int(os.getenv('RAG_BREAKER_FAILURES', '5')),
+            'reset_timeout': float(os.getenv('RAG_BREAKER_RESET', '30'))
+        }
+        self.limiters = {
+            'youdao': EngineLimiter(
+                '有道翻译',
+                label='youdao',
+                qps=float(os.getenv('RAG_YOUDAO_QPS', '10')),
+                concurrency=int(os.getenv('RAG_YOUDAO_CONCURRENCY', '4')),
+                **retry_options
+            ),
+            'zhipu': EngineLimiter(
+                '智谱API',
+                label='zhipu',
+                qps=float(os.getenv('RAG_ZHIPU_QPS', '10')),
+                concurrency=int(os.getenv('RAG_ZHIPU_CONCURRENCY', '8')),
+                **retry_options
+            )
+        }
+
+        # 有道批量翻译 - 同一语言方向的并发请求在时间窗口内合并为一次批量调用，窗口为0时关闭合并
+        batch_window_ms = float(os.getenv('RAG_YOUDAO_BATCH_WINDOW_MS', '20'))
+        self.youdao_batcher = RequestCoalescer(
+            self._youdao_translate_batch,
+            window=batch_window_ms / 1000,
+            max_items=int(os.getenv('RAG_YOUDAO_BATCH_SIZE', '16')),
+            max_chars=int(os.getenv('RAG_YOUDAO_BATCH_MAX_CHARS', '4500'))
+        ) if batch_window_ms > 0 else None
+
+        # 本地模型引擎 - 通过Ollama接口在本机执行 中->英->中 与分析，不受远程接口配额限制
+        self.ollama_url = os.getenv('RAG_OLLAMA_URL', 'http://localhost:11434').rstrip('/')
+        self._local_model = os.getenv('RAG_LOCAL_MODEL', 'llama3:8b')  # 使用的本地模型名称
+        # 每次请求都带上驻留时间，模型在两次请求之间保持加载；-1表示一直驻留
+        keep_alive = os.getenv('RAG_LOCAL_KEEP_ALIVE', '30m')
+        self.local_keep_alive = int(keep_alive) if keep_alive.lstrip('-').isdigit() else keep_alive
+        self.local_timeout = float(os.getenv('RAG_LOCAL_TIMEOUT', '300'))  # 单次推理的超时（秒）
+        self.local_preload = os.getenv('RAG_LOCAL_PRELOAD', '0') == '1'  # 预热时把模型加载进内存/显存
+        # 并发上限对应Ollama的 OLLAMA_NUM_PARALLEL；排队的请求达到上限后新请求直接返回错误
+        self.limiters['local'] = EngineLimiter(
+            '本地模型',
+            label='local',
+            qps=0,
+            concurrency=int(os.getenv('RAG_LOCAL_CONCURRENCY', '2')),
+            max_queue=int(os.getenv('RAG_LOCAL_MAX_QUEUE', '64')),
+            **retry_options
+        )
+        # 本地批量推理 - 同一语言方向、同一上下文的并发翻译在时间窗口内合并为一次推理，窗口为0时关闭合并
+        local_window_ms = float(os.getenv('RAG_LOCAL_BATCH_WINDOW_MS', '50'))
+        self.local_batcher = RequestCoalescer(
+            self._local_translate_batch,
+            window=local_window_ms / 1000,
+            max_items=int(os.getenv('RAG_LOCAL_BATCH_SIZE', '8')),
+            max_chars=int(os.getenv('RAG_LOCAL_BATCH_MAX_CHARS', '2000'))
+        ) if local_window_ms > 0 else None
+
+        # 单飞合并 - 相同的润色或翻译请求同时到达时只执行一次，其余调用方等待同一个结果
+        single_flight = os.getenv('RAG_SINGLE_FLIGHT', '1') == '1'
+        self.single_flights = {
+            'polish': SingleFlight(),
+            'translation': SingleFlight()
+        } if single_flight else {}
+
+        # 润色引擎注册表 - 每个引擎独立执行 中->英->中->分析 链路，可通过 register_engine 扩展
+        self.engines = {}
+        self.register_engine('youdao', self._youdao_engine)
+        self.register_engine('zhipu', self._zhipu_engine)
+        self.register_engine('local', self._local_engine)
+
+        # 调用链 - 开启时每次润色都在结果中附带各阶段的开始时间与耗时，也可按请求单独开启
+        self.trace_enabled = os.getenv('RAG_TRACE', '0') == '1'
+        REGISTRY.set_collector('rag_system', self._collect_metrics)
 
         # 模型实例 - 懒加载模式
-        self._embedding_model = None  # 文本嵌入模型
         self._ollama_client = None  # 本地大模型客户端
-        self._local_model = "llama3:8b"  # 使用的本地模型名称
+
+        # 预热状态 - 由 warm_up() 更新，供就绪检查使用
+        self.warmup_state = {
+            'started': False,
+            'ready': False,
+            'embedding_model': False,
+            'http_pool': False,
+            'local_model': False,
+            'seconds': None,
+            'errors': []
+        }
+
+    @property
+    def snapshot(self) -> KnowledgeBaseSnapshot:
+        """当前发布的知识库快照 - 文档、向量与索引属于同一版本"""
+        return self._snapshot
+
+    @property
+    def knowledge_base(self) -> Sequence[Dict[str, str]]:
+        """知识库文档列表（只读） - 与嵌入向量一一对应"""
+        return self._snapshot.documents
+
+    @property
+    def embeddings(self):
+        """知识库文档的向量表示（只读） - 知识库为空时为None"""
+        return self._snapshot.embeddings
+
+    def _update_indexes(self, start: Optional[int] = None):
+        """按向量存储的当前内容更新向量索引与BM25索引 - start 为None时全部重建；必须在持有 _index_lock 时调用"""
+        if start is None:
+            self.vector_index.build(self.embedding_store.embeddings)
+        else:
+            self.vector_index.update(self.embedding_store.embeddings, start)
+        if self.lexical_index is not None:
+            if start is None:
+                self.lexical_index.build(self.embedding_store.documents)
+            else:
+                self.lexical_index.update(self.embedding_store.documents, start)
+        if start is None:
+            self._appended_from = None
+
+    def _publish(self, version: Optional[int] = None):
+        """发布新的知识库快照 - 必须在持有 _index_lock 时调用
+
+        本进程是共享知识库的写入进程时同时发布到共享目录；version 为加载的共享版本号时只更新本进程的快照。
+        """
+        self._snapshot = self.embedding_store.snapshot(
+            version or self._snapshot.version + 1, self.vector_index.snapshot(),
+            self.lexical_index.snapshot() if self.lexical_index is not None else None
+        )
+        if version is None and self.shared_role == 'writer':
+            snapshot = self._snapshot
+            try:
+                self._shared_meta = self.shared_kb.publish(
+                    snapshot.documents, snapshot.embeddings, snapshot.version,
+                    self.embedding_model_name, self._appended_from
+                )
+            except Exception as e:
+                STAGE_ERRORS.inc(stage='shared_publish', engine='')
+                print(f"❌ 发布共享知识库时出错: {str(e)}")
+        self._appended_from = len(self.embedding_store)
 
     @property
     def embedding_model(self):
         """懒加载嵌入模型"""
-        if self._embedding_model is None:
-            self._embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        return self._embedding_model
+        return self.embedding_engine.model
 
     @property
     def ollama_client(self):
         """懒加载Ollama客户端"""
         if self._ollama_client is None:
-            self._ollama_client = Client(host='http://localhost:11434')
+            from ollama import Client  # 用于连接本地大模型，首次使用时才导入
+            self._ollama_client = Client(host=self.ollama_url)
         return self._ollama_client
 
-    @lru_cache(maxsize=100)
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """编码文本 - 经过嵌入缓存，只有未命中的文本才会加载模型并做前向计算"""
+        with timed_stage('embed', texts=len(texts)):
+            return self.embedding_cache.encode(self.embedding_engine.cache_id, texts, self.embedding_engine.encode)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """翻译、分析、文件解析与嵌入向量缓存的命中统计"""
+        return {
+            'translation': self.translation_cache.snapshot_stats(),
+            'analysis': self.analysis_cache.snapshot_stats(),
+            'parse': self.parse_cache.snapshot_stats(),
+            'embedding': self.embedding_cache.snapshot_stats()
+        }
+
+    def single_flight_stats(self) -> Dict[str, Any]:
+        """单飞合并的请求数、实际执行次数与共享结果的次数"""
+        return {scope: dict(flights.stats, in_flight=flights.in_flight())
+                for scope, flights in self.single_flights.items()}
+
+    async def _single_flight(self, scope: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """按键合并进行中的相同请求，未开启单飞合并时直接执行"""
+        flights = self.single_flights.get(scope)
+        if flights is None:
+            return await fn()
+        return await flights.do(key, fn)
+
+    def limiter_stats(self) -> Dict[str, Any]:
+        """各上游引擎的限流器状态"""
+        return {engine: limiter.snapshot() for engine, limiter in self.limiters.items()}
+
+    def _collect_metrics(self):
+        """导出指标前刷新缓存、限流器与知识库的瞬时值"""
+        for name, stats in self.cache_stats().items():
+            CACHE_REQUESTS.set(stats['hits'] + stats['disk_hits'], cache=name, result='hit')
+            CACHE_REQUESTS.set(stats['misses'], cache=name, result='miss')
+            CACHE_HIT_RATIO.set(stats['hit_rate'], cache=name)
+            CACHE_BYTES.set(stats['bytes'], cache=name)
+        for engine, stats in self.limiter_stats().items():
+            UPSTREAM_IN_FLIGHT.set(stats['in_flight'], engine=engine)
+            UPSTREAM_QPS.set(stats['qps'], engine=engine)
+            UPSTREAM_BREAKER_OPEN.set(0 if stats['breaker_state'] == 'closed' else 1, engine=engine)
+        for scope, stats in self.single_flight_stats().items():
+            SINGLE_FLIGHT_REQUESTS.set(stats['executions'], scope=scope, result='executed')
+            SINGLE_FLIGHT_REQUESTS.set(stats['shared'], scope=scope, result='shared')
+        snapshot = self._snapshot
+        KB_DOCUMENTS.set(len(snapshot.documents))
+        KB_VERSION.set(snapshot.version)
+        KB_LEXICAL_TERMS.set(snapshot.lexical.vocabulary_size if snapshot.lexical is not None else 0)
+        KB_SHARED_WRITER.set(1 if self.shared_role == 'writer' else 0)
+        store = self.embedding_store
+        KB_EMBEDDING_BYTES.set(store.capacity * (store.dim or 0) * 4)
+
+    @staticmethod
+    def _classify_youdao(response) -> str:
+        """判断有道响应是否需要重试 - 112/411/412为频率限制，113/303为服务端临时故障"""
+        status, result = response
+        error_code = result.get('errorCode')
+        if status >= 400 or error_code not in (None, '0'):
+            UPSTREAM_ERRORS.inc(engine='youdao', code=error_code or f'http_{status}')
+        if error_code in ('112', '411', '412'):
+            return THROTTLED
+        if status >= 500 or error_code in ('113', '303'):
+            return RETRY
+        return OK
+
+    @staticmethod
+    def _classify_zhipu(response) -> str:
+        """判断智谱响应是否需要重试 - 429及1302/1303/1305为频率限制，5xx为服务端临时故障"""
+        status, result = response
+        error_code = result.get('code') if isinstance(result, dict) else None
+        if status != 200 or error_code not in (None, 200):
+            UPSTREAM_ERRORS.inc(engine='zhipu', code=error_code if error_code not in (None, 200) else f'http_{status}')
+        if status == 429 or error_code in (1302, 1303, 1305):
+            return THROTTLED
+        if status >= 500:
+            return RETRY
+        return OK
+
+    @staticmethod
+    def _classify_local(response) -> str:
+        """判断本地模型响应是否需要重试 - 503为Ollama排队已满（OLLAMA_MAX_QUEUE），其他5xx为临时故障"""
+        status, result = response
+        if status != 200:
+            UPSTREAM_ERRORS.inc(engine='local', code=f'http_{status}')
+        if status in (429, 503):
+            return THROTTLED
+        if status >= 500:
+            return RETRY
+        return OK
+
+    def register_engine(self, name: str, translate: Callable[..., Awaitable[str]]):
+        """注册润色引擎
+
+        translate(text, direction, context_prompt, on_delta) 为异步翻译函数：
+        direction 为 'forward'（中->英）或 'back'（英->中），context_prompt 为知识库上下文提示词，
+        on_delta 不为None时可逐段回调增量文本。返回译文字符串，出错时返回错误说明。
+        """
+        self.engines[name] = translate
+
+    def select_engines(self, model: str) -> List[str]:
+        """根据model参数选择引擎 - both为有道与智谱，all为全部已注册引擎，其余为单个引擎名"""
+        if model == 'both':
+            names = ['youdao', 'zhipu']
+        elif model == 'all':
+            names = list(self.engines)
+        else:
+            names = [model]
+        return [name for name in names if name in self.engines]
+
+    def model_choices(self) -> List[str]:
+        """model参数的可选值 - both、all 与已注册的引擎名"""
+        return ['both', 'all'] + list(self.engines)
+
+    def _model_label(self, model: str) -> str:
+        """监控指标中的引擎标签 - 只使用已注册的引擎名，任意的model参数不会产生新的时间序列"""
+        return '+'.join(self.select_engines(model)) or 'unknown'
+
+    async def _youdao_engine(self, text: str, direction: str, context_prompt: str = '',
+                             on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """有道翻译引擎 - 不使用上下文，也不支持流式输出"""
+        if direction == 'forward':
+            return await self.translate_with_youdao(text, 'zh-CHS', 'en')
+        return await self.translate_with_youdao(text, 'en', 'zh-CHS')
+
+    async def _zhipu_engine(self, text: str, direction: str, context_prompt: str = '',
+                            on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """智谱翻译引擎 - 带知识库上下文，支持流式输出"""
+        if direction == 'forward':
+            return await self.translate_with_zhipu(text, 'zh', 'en', context_prompt, on_delta=on_delta)
+        return await self.translate_with_zhipu(text, 'en', 'zh', context_prompt, on_delta=on_delta)
+
+    async def _local_engine(self, text: str, direction: str, context_prompt: str = '',
+                            on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """本地模型翻译引擎 - 带知识库上下文，支持批量推理与流式输出"""
+        if direction == 'forward':
+            return await self.translate_with_local(text, 'zh', 'en', context_prompt, on_delta=on_delta)
+        return await self.translate_with_local(text, 'en', 'zh', context_prompt, on_delta=on_delta)
+
+    async def startup(self):
+        """应用启动钩子 - 创建HTTP连接池"""
+        await self.http.start()
+
+    async def shutdown(self):
+        """应用退出钩子 - 关闭HTTP连接池"""
+        await self.http.close()
+
+    async def warm_up(self):
+        """后台预热 - 加载嵌入模型并完成一次编码，同时预先建立到各上游服务的长连接
+
+        开启 RAG_LOCAL_PRELOAD 时同时把本地模型加载进内存/显存。
+        嵌入模型加载完成后 ready 置为True；上游连接与本地模型加载失败只记录错误，不影响就绪状态。
+        """
+        state = self.warmup_state
+        state['started'] = True
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        async def warm_model():
+            # 直接调用引擎而不经过嵌入缓存，避免预热文本进入缓存
+            await loop.run_in_executor(self.executor, self.embedding_engine.encode, ['预热'])
+            state['embedding_model'] = True
+
+        async def warm_http():
+            await self.http.warm([self.youdao_api_url, self.zhipu_api_url])
+            state['http_pool'] = True
+
+        async def warm_local():
+            # 不带提示词的请求只加载模型，并按 keep_alive 保持驻留
+            status, result = await self.http.post(f"{self.ollama_url}/api/generate", json={
+                'model': self._local_model, 'keep_alive': self.local_keep_alive
+            }, timeout=self.local_timeout)
+            if status != 200:
+                raise RuntimeError(f"状态码 {status}，{result.get('error', '未知错误')}")
+            state['local_model'] = True
+
+        stages = {'embedding_model': warm_model(), 'http_pool': warm_http()}
+        if self.local_preload:
+            stages['local_model'] = warm_local()
+        results = await asyncio.gather(*stages.values(), return_exceptions=True)
+        for stage, result in zip(stages, results):
+            if isinstance(result, Exception):
+                state['errors'].append(f"{stage}: {str(result)}")
+                print(f"❌ 预热 {stage} 失败: {str(result)}")
+        state['seconds'] = round(time.perf_counter() - started, 3)
+        state['ready'] = state['embedding_model']
+        print(f"🔥 预热完成，耗时 {state['seconds']}s")
+
     def _process_txt(self, file_path: str) -> List[Dict[str, str]]:
         """处理txt文件 - 读取内容并返回结构化数据"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return [{"text": content, "source": os.path.basename(file_path)}]
+        return parse_file(file_path, self.parse_cache)
 
-    @lru_cache(maxsize=100)
     def _process_docx(self, file_path: str) -> List[Dict[str, str]]:
         """处理docx文件 - 提取所有段落文本"""
-        doc = Document(file_path)
-        content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        return [{"text": content, "source": os.path.basename(file_path)}]
+        return parse_file(file_path, self.parse_cache)
 
-    @lru_cache(maxsize=100)
     def _process_pdf(self, file_path: str) -> List[Dict[str, str]]:
         """处理pdf文件 - 提取所有页面的文本"""
-        reader = PdfReader(file_path)
-        content = ""
-        for page in reader.pages:
-            content += page.extract_text() + "\n"
-        return [{"text": content, "source": os.path.basename(file_path)}]
+        return parse_file(file_path, self.parse_cache)
 
-    @lru_cache(maxsize=100)
     def _process_json(self, file_path: str) -> List[Dict[str, str]]:
         """处理json文件 - 支持不同的JSON结构"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            return data  # 假设列表已经是合适的格式
-        elif isinstance(data, dict):
-            return [{"text": str(data), "source": os.path.basename(file_path)}]
-        else:
-            return [{"text": str(data), "source": os.path.basename(file_path)}]
+        return parse_file(file_path, self.parse_cache)
 
     def upload_file(self, file_path: str) -> bool:
         """上传并处理文件 - 添加到知识库并更新嵌入向量"""
+        started = time.perf_counter()
         try:
             # 检查文件扩展名是否支持
             file_ext = os.path.splitext(file_path)[1].lower()
@@ -234,75 +716,532 @@ class FileRAGSystem:
                 print(f"❌ 不支持的文件格式: {file_ext}")
                 return False
 
-            # 处理文件内容
-            documents = self.supported_extensions[file_ext](file_path)
-
-            # 添加到知识库
-            self.knowledge_base.extend(documents)
-
-            # 异步更新向量 - 在后台线程中执行
-            def update_embeddings():
-                texts = [doc["text"] for doc in self.knowledge_base]
-                self.embeddings = self.embedding_model.encode(texts)
+            # 处理文件内容，并补全来源字段以便按来源替换；记录内容摘要以便批量导入时跳过未变化的文件
+            if self._forward_to_writer('upload', file_path=os.path.abspath(file_path)):
+                print(f"📨 已将 {os.path.basename(file_path)} 转交给共享知识库的写入进程")
+                return True
+
+            source = os.path.basename(file_path)
+            content_hash = file_digest(file_path)
+
+            ranges = pdf_page_ranges(file_path, self.pdf_pages_per_part)
+            if ranges:
+                # 大PDF在后台由进程池按页码范围并行解析与分块，按顺序逐段编码，不把整篇文本读入内存
+                with self._index_lock:
+                    self._upload_seq += 1
+                    self._latest_uploads[source] = ticket = self._upload_seq
+                parts = self._iter_pdf_parts(file_path, source, ranges, content_hash)
+                self.executor.submit(self._index_parts, parts, (source, ticket))
+                record_stage('upload', time.perf_counter() - started, pages=ranges[-1][1])
+                print(f"✅ 成功上传文件: {source}（{ranges[-1][1]} 页，分 {len(ranges)} 段处理）")
+                return True
+
+            if docx_needs_split(file_path, self.docx_paragraphs_per_part):
+                # 大docx在后台按段落分批分块与编码，不拼接整篇文本
+                with self._index_lock:
+                    self._upload_seq += 1
+                    self._latest_uploads[source] = ticket = self._upload_seq
+                parts = iter_docx_parts(file_path, source, self.docx_paragraphs_per_part, self.chunker, content_hash)
+                self.executor.submit(self._index_parts, parts, (source, ticket))
+                record_stage('upload', time.perf_counter() - started)
+                print(f"✅ 成功上传文件: {source}（按每 {self.docx_paragraphs_per_part} 段分批处理）")
+                return True
+
+            documents = [
+                dict(doc, source=doc.get("source") or source, content_hash=content_hash)
+                for doc in parse_file(file_path, self.parse_cache, content_hash)
+            ]
+
+            # 分块 - 避免整篇文档超出嵌入模型的token窗口被截断
+            documents = self.chunker.chunk_documents(documents)
+
+            # 异步更新向量 - 只编码新文档，并替换同来源的旧文档
+            with self._index_lock:
+                self._upload_seq += 1
+                self._latest_uploads[source] = ticket = self._upload_seq
+            self.executor.submit(self._index_documents, documents, (source, ticket))
+
+            record_stage('upload', time.perf_counter() - started, chunks=len(documents))
+            print(f"✅ 成功上传文件: {source}")
+            return True
 
-            # 使用线程池异步处理向量更新
-            self.executor.submit(update_embeddings)
+        except Exception as e:
+            STAGE_ERRORS.inc(stage='upload', engine='')
+            print(f"❌ 处理文件时出错: {str(e)}")
+            return False
 
-            print(f"✅ 成功上传文件: {os.path.basename(file_path)}")
+    def ingest_directory(self, folder: str, workers: Optional[int] = None, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """批量导入目录中的所有受支持文件 - 多进程解析，单一消费者按大批量编码
+
+        子进程负责计算内容摘要、解析与分块，主进程按文件顺序收集分块，攒满 batch_size 后统一编码写入知识库。
+        大PDF按页码范围切分为多个任务，由多个子进程同时解析，各范围的分块按顺序换算偏移后分批写入。
+        内容摘要已在知识库中的文件直接跳过。来源字段使用相对于导入目录的路径，避免不同子目录中的同名文件互相覆盖。
+        返回导入统计（文件数、分块数、耗时与吞吐量）。
+        """
+        workers = workers or self.ingest_workers
+        batch_size = batch_size or self.ingest_batch_size
+        stats = {'files_total': 0, 'files_ingested': 0, 'files_skipped': 0, 'files_failed': 0,
+                 'chunks': 0, 'bytes': 0, 'parse_wait': 0.0, 'embed_time': 0.0}
+        start_time = time.perf_counter()
+
+        known_digests = frozenset(doc['content_hash'] for doc in self.knowledge_base if doc.get('content_hash'))
+        seen_digests = set()  # 本次导入中已处理的内容，重复的文件只导入一次
+        pending = []  # 已解析、等待编码的分块
+        parts = {}  # 切分的大PDF：来源 -> {'offset': 已处理的字符数, 'index': 已产生的分块数, 'skip': 是否跳过其余范围}
+        flushed_parts = set()  # 已有部分范围写入知识库的大PDF，之后的批次只追加不替换
+        failed_parts = set()  # 部分范围出错的大PDF，结束时删除已写入的部分
+
+        def flush():
+            if pending:
+                embed_start = time.perf_counter()
+                indexed = self._index_documents(list(pending), keep_sources=frozenset(flushed_parts))
+                stats['embed_time'] += time.perf_counter() - embed_start
+                if indexed:
+                    flushed_parts.update(doc['source'] for doc in pending if doc['source'] in parts)
+                else:
+                    # 编码或写入失败：本批次中的文件（整个文件都在同一批次中）不计为已导入
+                    failed = collections.Counter(doc['source'] for doc in pending if doc['source'] not in parts)
+                    stats['files_ingested'] -= len(failed)
+                    stats['files_failed'] += len(failed)
+                    stats['chunks'] -= sum(failed.values())
+                    # 大PDF跳过其余范围，结束时删除之前批次已写入的部分
+                    for source in {doc['source'] for doc in pending if doc['source'] in parts}:
+                        self._fail_part(source, parts, failed_parts, stats)
+                pending.clear()
+
+        def tasks():
+            """逐个产出解析任务参数；大PDF在主进程中计算摘要并检查是否已导入，再按页码范围产出多个任务"""
+            for path in iter_files(folder, self.supported_extensions):
+                source = os.path.relpath(path, folder).replace(os.sep, '/')
+                stats['files_total'] += 1
+                try:
+                    ranges = pdf_page_ranges(path, self.pdf_pages_per_part)
+                except Exception:
+                    ranges = None  # 交给子进程解析并报告错误
+                if not ranges:
+                    yield path, source, None, None
+                    continue
+                digest = file_digest(path)
+                if digest in known_digests:
+                    stats['files_skipped'] += 1
+                    continue
+                stats['bytes'] += os.path.getsize(path)
+                for pages in ranges:
+                    yield path, source, digest, pages
+
+        files = tasks()
+        with self._process_pool(workers, known_digests) as pool:
+            # 限制同时在途的任务数，按提交顺序消费结果，保证大目录下内存占用有界
+            in_flight = collections.deque()
+            exhausted = False
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < workers * 4:
+                    task = next(files, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    in_flight.append(pool.submit(parse_and_chunk, *task))
+                if not in_flight:
+                    break
+
+                wait_start = time.perf_counter()
+                result = in_flight.popleft().result()
+                stats['parse_wait'] += time.perf_counter() - wait_start
+
+                if result['pages'] is not None:
+                    self._collect_part(result, parts, seen_digests, failed_parts, stats, pending)
+                    if len(pending) >= batch_size:
+                        flush()
+                    continue
+                if result['error']:
+                    stats['files_failed'] += 1
+                    print(f"❌ 处理文件时出错 {result['source']}: {result['error']}")
+                    continue
+                if result['skipped'] or result['digest'] in seen_digests:
+                    stats['files_skipped'] += 1
+                    continue
+                seen_digests.add(result['digest'])
+                stats['files_ingested'] += 1
+                stats['chunks'] += len(result['documents'])
+                stats['bytes'] += result['bytes']
+                pending.extend(result['documents'])
+                if len(pending) >= batch_size:
+                    flush()
+            flush()
+
+        # 只删除已有部分范围写入的大PDF；一个范围都没写入时知识库中仍是完整的旧版本
+        for source in failed_parts & flushed_parts:
+            self.remove_file(source)
+
+        elapsed = time.perf_counter() - start_time
+        stats['elapsed'] = round(elapsed, 3)
+        stats['parse_wait'] = round(stats['parse_wait'], 3)
+        stats['embed_time'] = round(stats['embed_time'], 3)
+        stats['files_per_sec'] = round(stats['files_ingested'] / elapsed, 2) if elapsed else 0.0
+        stats['chunks_per_sec'] = round(stats['chunks'] / elapsed, 2) if elapsed else 0.0
+        stats['mb_per_sec'] = round(stats['bytes'] / 1024 / 1024 / elapsed, 3) if elapsed else 0.0
+        record_stage('ingest', elapsed, files=stats['files_ingested'], chunks=stats['chunks'])
+        print(f"✅ 批量导入完成: {format_throughput(stats)}")
+        if stats['files_skipped'] or stats['files_failed']:
+            print(f"⏭️ 跳过未变化的文件 {stats['files_skipped']} 个，失败 {stats['files_failed']} 个")
+        return stats
+
+    def _process_pool(self, workers: int, known_digests: frozenset = frozenset()) -> concurrent.futures.ProcessPoolExecutor:
+        """创建解析与分块用的进程池 - 子进程中的分块器与解析缓存与当前配置一致"""
+        # 子进程不直接fork当前进程，避免复制主进程中的线程与模型状态；
+        # 优先使用forkserver（主模块只导入一次），Windows上使用spawn
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(start_method), initializer=init_worker,
+            initargs=(self.chunker.max_tokens, self.chunker.overlap_tokens, known_digests, self.parse_cache_options)
+        )
+
+    def _iter_pdf_parts(self, file_path: str, source: str, ranges: List[Tuple[int, int]],
+                        digest: str) -> Iterable[List[Dict[str, Any]]]:
+        """在进程池中并行解析与分块大PDF的各页码范围，按范围顺序产出换算到整篇偏移后的分块
+
+        同时在途的范围数有上限，内存占用与文件总页数无关；某个范围出错时抛出异常，停止提交其余范围。
+        """
+        workers = min(self.ingest_workers, len(ranges))
+        tasks = iter(ranges)
+        in_flight = collections.deque()
+        offset = index = 0
+        pool = self._process_pool(workers)
+        try:
+            while True:
+                while len(in_flight) < workers * 2:
+                    pages = next(tasks, None)
+                    if pages is None:
+                        break
+                    in_flight.append(pool.submit(parse_and_chunk, file_path, source, digest, pages))
+                if not in_flight:
+                    return
+                result = in_flight.popleft().result()
+                if result['error']:
+                    raise RuntimeError(f"第 {result['pages'][0] + 1}-{result['pages'][1]} 页: {result['error']}")
+                chunks = rebase_chunks(result['documents'], offset, index)
+                offset += result['chars']
+                index += len(chunks)
+                yield chunks
+        finally:
+            # 写入中断（已有更新的上传或出错）时取消尚未开始的范围
+            pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _collect_part(result: Dict[str, Any], parts: Dict[str, Dict[str, Any]], seen_digests: set,
+                      failed_parts: set, stats: Dict[str, Any], pending: List[Dict[str, Any]]):
+        """收集大PDF一个页码范围的解析结果 - 按范围顺序换算分块偏移后加入待编码列表"""
+        source = result['source']
+        if result['pages'][0] == 0:
+            duplicate = result['digest'] in seen_digests
+            parts[source] = {'offset': 0, 'index': 0, 'skip': duplicate}
+            if duplicate:
+                stats['files_skipped'] += 1
+            else:
+                seen_digests.add(result['digest'])
+                stats['files_ingested'] += 1
+        state = parts[source]
+        if state['skip']:
+            return
+        if result['error']:
+            FileRAGSystem._fail_part(source, parts, failed_parts, stats)
+            print(f"❌ 处理文件时出错 {source}（第 {result['pages'][0] + 1}-{result['pages'][1]} 页）: {result['error']}")
+            return
+        documents = rebase_chunks(result['documents'], state['offset'], state['index'])
+        state['offset'] += result['chars']
+        state['index'] += len(documents)
+        stats['chunks'] += len(documents)
+        pending.extend(documents)
+
+    @staticmethod
+    def _fail_part(source: str, parts: Dict[str, Dict[str, Any]], failed_parts: set, stats: Dict[str, Any]):
+        """把大PDF标记为导入失败 - 跳过其余范围，已计入的文件数与分块数改为失败"""
+        state = parts[source]
+        if state['skip']:
+            return
+        state['skip'] = True
+        stats['files_ingested'] -= 1
+        stats['files_failed'] += 1
+        stats['chunks'] -= state['index']
+        failed_parts.add(source)
+
+    def _index_documents(self, documents: List[Dict[str, str]], upload: Optional[Tuple[str, int]] = None,
+                         keep_sources: Iterable[str] = ()) -> bool:
+        """编码新文档并写入向量存储，完成后发布新快照 - 已有文档不会被重新编码
+
+        编码在锁外进行，多个上传可以同时编码；upload 为 (来源, 上传序号)，
+        同一来源已有更新的上传或删除时丢弃本次结果，避免旧内容覆盖新内容。
+        同来源的旧文档会被替换，keep_sources 中的来源除外（分批写入的大文件，之前的批次已写入）；
+        上传的来源即使没有产生任何文档也会被替换，空文件重新上传后旧内容不会残留。
+        返回是否已写入。
+        """
+        try:
+            vectors = self.embed_texts([doc["text"] for doc in documents])
+            with timed_stage('index', chunks=len(documents)), self._index_lock:
+                if upload is not None and self._latest_uploads.get(upload[0]) != upload[1]:
+                    print(f"⏭️ {upload[0]} 已有更新的上传或已被删除，丢弃本次结果")
+                    return False
+                start = len(self.embedding_store)
+                removed = self.embedding_store.replace_sources(documents, vectors, keep_sources,
+                                                               (upload[0],) if upload is not None else ())
+                # 有删除时行号发生压缩，需要重建索引
+                self._update_indexes(None if removed else start)
+                self._publish()
+            if removed:
+                print(f"♻️ 已替换同来源的旧文档 {removed} 个")
             print(f"📚 当前知识库文档数: {len(self.knowledge_base)}")
             return True
-
         except Exception as e:
-            print(f"❌ 处理文件时出错: {str(e)}")
+            STAGE_ERRORS.inc(stage='index', engine='')
+            print(f"❌ 更新向量时出错: {str(e)}")
             return False
 
+    def _index_parts(self, parts: Iterable[List[Dict[str, str]]], upload: Tuple[str, int]):
+        """依次编码并写入大文件的各段分块 - 第一段替换同来源的旧文档，之后各段追加
+
+        某一段被丢弃（已有更新的上传）、解析或编码出错时停止，出错时删除已写入的部分，下次上传重新处理。
+        """
+        source = upload[0]
+        count = 0
+        try:
+            for documents in parts:
+                if not documents:
+                    continue
+                if not self._index_documents(documents, upload, keep_sources=(source,) if count else ()):
+                    self._discard_parts(upload, count)
+                    return
+                count += len(documents)
+            if not count and not self._index_documents([], upload):
+                # 所有页码范围都没有产生分块时，仍删除该来源的旧文档
+                return
+            print(f"✅ {source} 已全部写入知识库，共 {count} 个分块")
+        except Exception as e:
+            STAGE_ERRORS.inc(stage='upload', engine='')
+            print(f"❌ 处理文件时出错 {source}: {str(e)}")
+            self._discard_parts(upload, count)
+        finally:
+            # 提前停止时关闭生成器，释放其中的进程池等资源
+            close = getattr(parts, 'close', None)
+            if close is not None:
+                close()
+
+    def _discard_parts(self, upload: Tuple[str, int], count: int):
+        """大文件分段写入中断时删除已写入的 count 个分块 - 已有更新的上传或删除时由新的上传替换，不在此删除"""
+        with self._index_lock:
+            stale = self._latest_uploads.get(upload[0]) != upload[1]
+        if count and not stale:
+            print(f"🧹 {upload[0]} 未能全部写入知识库，删除已写入的 {count} 个分块")
+            self.remove_file(upload[0])
+
+    def remove_file(self, source: str) -> int:
+        """按来源从知识库中删除文档 - 返回删除的文档数（转交给共享知识库的写入进程时返回0）"""
+        if self._forward_to_writer('remove', source=source):
+            print(f"📨 已将删除 {source} 的请求转交给共享知识库的写入进程")
+            return 0
+        with self._index_lock:
+            # 使尚未完成的同来源上传失效
+            self._upload_seq += 1
+            self._latest_uploads[source] = self._upload_seq
+            removed = self.embedding_store.remove_sources([source])
+            if removed:
+                self._update_indexes()
+                self._publish()
+        print(f"🗑️ 已删除 {source} 的 {removed} 个文档")
+        return removed
+
     def save_knowledge_base(self, output_path: str = None):
-        """保存知识库到JSON文件 - 便于后续加载"""
+        """保存知识库 - JSON元数据文件 + 同名 .npy 向量文件，便于后续加载"""
         try:
             # 如果没有指定文件名，使用默认格式
             if output_path is None:
                 output_path = f"knowledge_base_{time.strftime('%Y%m%d_%H%M%S')}.json"
             
             # 确保输出目录存在
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if os.path.dirname(output_path):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # 优化JSON序列化 - 处理NumPy数组
-            def default(obj):
-                if isinstance(obj, np.ndarray):
-                    return obj.tolist()
-                return str(obj)
+            # 文档列表写入JSON，向量以float32二进制写入 .npy，加载时无需重新编码
+            embeddings_path = self.embedding_store.save(output_path, {
+                'model': self.embedding_model_name,
+                'saved_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            })
             
-            # 使用更高效的JSON序列化方式
-            with open(output_path, 'w', encoding='utf-8') as f:
-                # 使用separators参数减少文件大小
-                json.dump(
-                    self.knowledge_base, 
-                    f, 
-                    ensure_ascii=False, 
-                    indent=None,  # 移除缩进以减小文件大小
-                    separators=(',', ':'),  # 使用最小分隔符
-                    default=default
-                )
-            
-            print(f"✅ 知识库已保存到: {output_path}")
+            print(f"✅ 知识库已保存到: {output_path}（向量文件: {os.path.basename(embeddings_path)}）")
             return True
         except Exception as e:
             print(f"❌ 保存知识库时出错: {str(e)}")
             return False
 
+    def load_knowledge_base(self, input_path: str, mmap: bool = True) -> bool:
+        """加载知识库 - 向量文件以内存映射方式打开，替换当前知识库内容"""
+        try:
+            if self._forward_to_writer('load', input_path=os.path.abspath(input_path)):
+                print(f"📨 已将加载 {input_path} 的请求转交给共享知识库的写入进程")
+                return True
+            started = time.time()
+            with self._index_lock:
+                meta = self.embedding_store.load(input_path, mmap=mmap)
+                reencode = None
+                if 'format_version' not in meta:
+                    # 旧版只包含文档列表的JSON文件，需要分块并重新编码
+                    print("⚠️ 旧版知识库文件不含向量，正在重新编码")
+                    self.embedding_store.clear()
+                    reencode = self.chunker.chunk_documents(meta['documents'])
+                elif meta.get('model') != self.embedding_model_name:
+                    # 嵌入模型不同时向量不可比，需要重新编码
+                    print(f"⚠️ 知识库向量由 {meta.get('model')} 生成，正在使用 {self.embedding_model_name} 重新编码")
+                    reencode = list(self.embedding_store.documents)
+                    self.embedding_store.clear()
+                self._update_indexes()
+                self._publish()
+
+            if reencode:
+                self._index_documents(reencode)
+
+            print(f"✅ 已加载知识库: {input_path}，文档数 {len(self.knowledge_base)}，"
+                  f"耗时 {(time.time() - started) * 1000:.1f}ms")
+            return True
+        except Exception as e:
+            print(f"❌ 加载知识库时出错: {str(e)}")
+            return False
+
+    def load_latest_knowledge_base(self, folder: str) -> bool:
+        """从目录中加载最近保存的知识库文件 - 用于启动时自动恢复"""
+        if not os.path.isdir(folder):
+            return False
+        candidates = sorted(
+            (os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith('.json')),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for path in candidates:
+            if self.load_knowledge_base(path):
+                return True
+        return False
+
+    def join_shared(self, folder: Optional[str] = None) -> str:
+        """加入共享知识库 - 抢到写入锁的进程成为写入进程，其余进程以只读方式加载当前版本，返回本进程的角色
+
+        共享目录中还没有版本时，写入进程从 folder 加载最近保存的知识库并发布。
+        """
+        self._shared_fallback = folder
+        if self.shared_kb.try_acquire_writer():
+            print(f"✍️ 本进程（{os.getpid()}）是共享知识库的写入进程")
+            self._take_over_shared()
+        else:
+            self.shared_role = 'reader'
+            self.sync_shared()
+        return self.shared_role
+
+    def _take_over_shared(self):
+        """成为写入进程 - 从共享目录的当前版本继续写入，之后只追加的修改直接写在当前代文件末尾"""
+        self.shared_role = 'writer'
+        if self.shared_kb.current() is not None:
+            self.sync_shared()
+        elif self._shared_fallback:
+            self.load_latest_knowledge_base(self._shared_fallback)
+
+    def sync_shared(self) -> bool:
+        """加载共享知识库的最新版本 - 向量与文档以内存映射方式挂载，不复制数据；返回是否加载了新版本
+
+        同一代文件只追加了文档时增量更新向量索引与BM25索引，否则重建。
+        """
+        meta = self.shared_kb.current()
+        previous = self._shared_meta
+        if meta is None or (previous is not None and meta['version'] == previous['version']):
+            return False
+        started = time.time()
+        documents, matrix = self.shared_kb.open(meta)
+        with self._index_lock:
+            self.embedding_store.attach(documents, matrix)
+            appended = previous is not None and previous['generation'] == meta['generation'] \
+                and 0 < previous['count'] <= meta['count']
+            self._update_indexes(previous['count'] if appended else None)
+            self._publish(meta['version'])
+            self._shared_meta = meta
+        print(f"🔄 已加载共享知识库版本 {meta['version']}，文档数 {meta['count']}，"
+              f"耗时 {(time.time() - started) * 1000:.1f}ms")
+        return True
+
+    def _forward_to_writer(self, op: str, **params) -> bool:
+        """只读进程把写操作转交给写入进程，由写入进程处理后发布新版本 - 返回是否已转交"""
+        if self.shared_role != 'reader':
+            return False
+        self.shared_kb.submit(op, **params)
+        return True
+
+    def poll_shared(self):
+        """共享知识库的一次同步 - 写入进程处理转交的请求；只读进程加载新版本，写入进程退出后由其中一个接替"""
+        if self.shared_role == 'reader' and self.shared_kb.try_acquire_writer():
+            print(f"✍️ 写入进程已退出，本进程（{os.getpid()}）接替为共享知识库的写入进程")
+            self._take_over_shared()
+        if self.shared_role != 'writer':
+            self.sync_shared()
+            return
+        for request in self.shared_kb.take_requests():
+            op = request.get('op')
+            if op == 'upload':
+                self.upload_file(request['file_path'])
+            elif op == 'remove':
+                self.remove_file(request['source'])
+            elif op == 'load':
+                self.load_knowledge_base(request['input_path'])
+            else:
+                print(f"❌ 未知的共享知识库请求: {op}")
+
+    async def run_shared_sync(self, stop: Optional[asyncio.Event] = None):
+        """后台定期同步共享知识库，直到 stop 被设置 - 文件读写与索引更新在线程池中进行"""
+        loop = asyncio.get_event_loop()
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.shared_poll_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await loop.run_in_executor(self.executor, self.poll_shared)
+            except Exception as e:
+                STAGE_ERRORS.inc(stage='shared_sync', engine='')
+                print(f"❌ 同步共享知识库时出错: {str(e)}")
+
     def retrieve(self, query: str, top_k: int = 3) -> List[str]:
-        """检索最相关的文档片段 - 基于向量相似度"""
-        if not self.knowledge_base:
+        """检索最相关的文档片段 - 按检索模式使用向量索引、BM25索引或两者融合，整个检索过程只使用同一个知识库快照"""
+        snapshot = self._snapshot
+        if not snapshot.documents:
             return []
 
-        # 将查询转换为向量
-        query_embedding = self.embedding_model.encode([query])
-        # 计算查询向量与所有文档向量的相似度
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-        # 获取相似度最高的top_k个文档索引
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        if self.retrieval_mode == 'dense' or snapshot.lexical is None:
+            top_indices = self._dense_search(snapshot, query, top_k)
+        elif self.retrieval_mode == 'lexical':
+            # 只做关键词检索，不需要编码查询
+            top_indices = self._lexical_search(snapshot, query, top_k)
+        else:
+            # 两种检索各取一批候选，按倒数排名融合：字面一致的术语与语义相近的段落都能排在前面
+            candidates = max(top_k, self.hybrid_candidates)
+            fused = reciprocal_rank_fusion([
+                self._lexical_search(snapshot, query, candidates),
+                self._dense_search(snapshot, query, candidates)
+            ], self.rrf_k)
+            top_indices = [doc_id for doc_id, _ in fused[:top_k]]
         # 返回对应的文档文本
-        return [self.knowledge_base[i]["text"] for i in top_indices]
+        return [snapshot.documents[i]["text"] for i in top_indices]
+
+    def _dense_search(self, snapshot: KnowledgeBaseSnapshot, query: str, top_k: int) -> np.ndarray:
+        """向量检索 - 返回相似度最高的top_k个文档下标"""
+        if not len(snapshot.index):
+            return np.empty(0, dtype=np.int64)
+        # 将查询转换为归一化向量，与预归一化的文档矩阵做内积即为余弦相似度
+        query_embedding = normalize_rows(self.embed_texts([query]))[0]
+        with timed_stage('search', documents=len(snapshot.documents)):
+            top_indices, _ = snapshot.index.search(query_embedding, top_k)
+        return top_indices
+
+    def _lexical_search(self, snapshot: KnowledgeBaseSnapshot, query: str, top_k: int) -> np.ndarray:
+        """BM25关键词检索 - 返回得分最高的top_k个文档下标，没有任何词命中的文档不返回"""
+        with timed_stage('lexical_search', documents=len(snapshot.documents)):
+            top_indices, _ = snapshot.lexical.search(query, top_k)
+        return top_indices
 
     def ask(self, question: str) -> str:
         """基于知识库回答问题 - RAG方法"""
@@ -329,119 +1268,156 @@ class FileRAGSystem:
         except Exception as e:
             return f"回答问题时出错: {str(e)}"
 
+    def _youdao_sign(self, query: str, salt: str, curtime: str) -> str:
+        """生成有道v3签名: sha256(应用ID+input+salt+curtime+应用密钥)，批量请求时query为所有q拼接后的字符串"""
+        # 根据输入文本长度处理签名计算
+        if len(query) <= 20:
+            input_text = query
+        else:
+            input_text = query[:10] + str(len(query)) + query[-10:]
+        sign_str = self.youdao_appid + input_text + salt + curtime + self.youdao_key
+        return hashlib.sha256(sign_str.encode('utf-8')).hexdigest()
+
+    async def _youdao_translate_batch(self, languages, texts: List[str]) -> List[Dict[str, Any]]:
+        """批量调用有道翻译 - 一批只签名一次、发送一次请求，返回与texts等长的单条结果列表
+
+        单条结果与普通接口的响应格式一致：{'errorCode': ..., 'translation': [...]}。
+        只有一条时使用普通接口，多条时使用批量接口（多个q参数）。
+        """
+        from_lang, to_lang = languages
+        url = self.youdao_api_url if len(texts) == 1 else self.youdao_batch_api_url
+
+        def request():
+            # 每次尝试重新签名：重试时沿用同一个salt会被当作重放请求（207），时间戳过旧也会被拒绝（206）
+            # 当前UTC时间戳
+            curtime = str(int(time.time()))
+            # 随机数，使用UUID
+            salt = str(uuid.uuid1())
+            fields = [
+                ('from', from_lang),
+                ('to', to_lang),
+                ('appKey', self.youdao_appid),
+                ('salt', salt),
+                ('sign', self._youdao_sign(''.join(texts), salt, curtime)),
+                ('signType', 'v3'),
+                ('curtime', curtime)
+            ]
+            return self.http.post(url, data=[('q', text) for text in texts] + fields)
+
+        # 通过共享连接池发送异步请求，整批只占用一个并发名额，限流或临时故障时自动退避重试
+        _, result = await self.limiters['youdao'].call(request, self._classify_youdao)
+
+        if len(texts) == 1 or result.get('errorCode') != '0':
+            return [result] * len(texts)
+
+        # 批量接口按请求顺序返回 translateResults，失败的条目下标在 errorIndex 中；
+        # 按位置而不是回显的 query 对应，上游对原文做了空白或全角半角规整时也能对上
+        items = result.get('translateResults') or []
+        failed = {str(index) for index in result.get('errorIndex') or []}
+        if len(items) != len(texts):
+            # 只返回了成功的条目时，按顺序依次对应未失败的下标
+            remaining = iter(items)
+            items = [None if str(index) in failed else next(remaining, None) for index in range(len(texts))]
+        results = []
+        for index, item in enumerate(items):
+            translation = item.get('translation') if item else None
+            if str(index) in failed or not translation:
+                results.append({'errorCode': '302', 'translation': []})
+            else:
+                results.append({'errorCode': '0', 'translation': [translation]})
+        return results
+
+    @staticmethod
+    def _youdao_error_message(error_code: str) -> str:
+        """把有道错误码转换为带说明的错误信息"""
+        error_msg = {
+            '101': '缺少必填参数，请检查是否缺少appKey、salt、sign、curtime等参数',
+            '102': '不支持的语言类型',
+            '103': '翻译文本过长',
+            '104': '不支持的API类型',
+            '105': '不支持的签名类型',
+            '106': '无效的应用ID',
+            '107': '无效的IP地址',
+            '108': '无效的应用密钥',
+            '109': 'batchLog格式不正确',
+            '110': '无相关服务的有效实例',
+            '111': '开发者账号已经欠费',
+            '112': '请求频率受限',
+            '113': '服务器内部错误',
+            '114': '账户校验失败',
+            '201': '解密失败，可能为DES加密等级不够',
+            '202': '签名检验失败，请检查签名生成方法',
+            '203': '访问IP地址不在可访问IP列表',
+            '205': '请求的接口与应用的接口类型不一致',
+            '206': '因为时间戳太旧而被拒绝',
+            '207': '重放请求',
+            '301': '辞典查询失败',
+            '302': '翻译查询失败',
+            '303': '服务端的其它异常',
+            '304': '会话闲置太久超时',
+            '401': '账户已经欠费',
+            '402': 'offlinesdk不可用',
+            '411': '访问频率受限',
+            '412': '长请求过于频繁'
+        }.get(error_code, f'未知错误（{error_code}）')
+        
+        # 根据错误代码提供更详细的说明
+        error_details = ""
+        if error_code == '202':
+            error_details = "，请检查appKey、appSecret配置是否正确，以及签名生成方法是否正确"
+        elif error_code == '108':
+            error_details = "，请检查API密钥是否正确"
+        elif error_code == '106':
+            error_details = "，请检查API ID是否正确"
+        elif error_code == '112' or error_code == '411':
+            error_details = "，请检查API调用频率或稍后再试"
+        elif error_code == '401':
+            error_details = "，请充值账户"
+        
+        return f"有道翻译错误: {error_code}，{error_msg}{error_details}"
+
     async def translate_with_youdao(self, text, from_lang='zh-CHS', to_lang='en'):
-        """使用有道翻译API进行文本翻译 - 异步方法"""
+        """使用有道翻译API进行文本翻译 - 异步方法
+
+        开启批量合并时，同一语言方向的并发请求在短时间窗口内合并为一次批量调用；
+        同一文本的并发请求只发送一次（单飞合并）。
+        """
         try:
             # 检查缓存，避免重复翻译
-            cache_key = f"{from_lang}_{to_lang}_{text}"
-            if cache_key in self.translation_cache:
-                return self.translation_cache[cache_key]
+            cache_key = make_cache_key('youdao', from_lang, to_lang, text)
+            cached = self.translation_cache.get(cache_key)
+            if cached is not None:
+                return cached
                 
             # 检查API配置
             if not self.youdao_key or not self.youdao_appid:
                 raise ValueError("有道翻译API配置缺失，请检查环境变量")
-                
-            # 准备请求参数
-            app_key = self.youdao_appid
-            app_secret = self.youdao_key
             
-            # 当前UTC时间戳
-            curtime = str(int(time.time()))
-            # 随机数，使用UUID
-            salt = str(uuid.uuid1())
-            
-            # 根据输入文本长度处理签名计算
-            if len(text) <= 20:
-                input_text = text
-            else:
-                input_text = text[:10] + str(len(text)) + text[-10:]
-                
-            # 生成签名: sha256(应用ID+input+salt+curtime+应用密钥)
-            sign_str = app_key + input_text + salt + curtime + app_secret
-            sign = hashlib.sha256(sign_str.encode('utf-8')).hexdigest()
-            
-            # 构建请求数据
-            data = {
-                'q': text,
-                'from': from_lang,
-                'to': to_lang,
-                'appKey': app_key,
-                'salt': salt,
-                'sign': sign,
-                'signType': 'v3',
-                'curtime': curtime
-            }
-            
-            # 发送异步请求
-            async with aiohttp.ClientSession() as session:
-                # 增加超时时间到60秒
-                async with session.post(
-                    'https://openapi.youdao.com/api', 
-                    data=data, 
-                    timeout=60
-                ) as response:
-                    result = await response.json()
-                    
-            # 解析结果
-            if result.get('errorCode') == '0':
-                # 获取翻译结果
-                translations = result.get('translation', [])
-                if translations:
-                    translated_text = translations[0]
-                    # 存入缓存
-                    self.translation_cache[cache_key] = translated_text
-                    return translated_text
+            async def request():
+                if self.youdao_batcher is not None:
+                    result = await self.youdao_batcher.submit((from_lang, to_lang), text)
                 else:
-                    return f"有道翻译错误: 未返回翻译结果"
-            else:
-                # 处理错误响应
-                error_code = result.get('errorCode', 'unknown')
-                error_msg = {
-                    '101': '缺少必填参数，请检查是否缺少appKey、salt、sign、curtime等参数',
-                    '102': '不支持的语言类型',
-                    '103': '翻译文本过长',
-                    '104': '不支持的API类型',
-                    '105': '不支持的签名类型',
-                    '106': '无效的应用ID',
-                    '107': '无效的IP地址',
-                    '108': '无效的应用密钥',
-                    '109': 'batchLog格式不正确',
-                    '110': '无相关服务的有效实例',
-                    '111': '开发者账号已经欠费',
-                    '112': '请求频率受限',
-                    '113': '服务器内部错误',
-                    '114': '账户校验失败',
-                    '201': '解密失败，可能为DES加密等级不够',
-                    '202': '签名检验失败，请检查签名生成方法',
-                    '203': '访问IP地址不在可访问IP列表',
-                    '205': '请求的接口与应用的接口类型不一致',
-                    '206': '因为时间戳太旧而被拒绝',
-                    '207': '重放请求',
-                    '301': '辞典查询失败',
-                    '302': '翻译查询失败',
-                    '303': '服务端的其它异常',
-                    '304': '会话闲置太久超时',
-                    '401': '账户已经欠费',
-                    '402': 'offlinesdk不可用',
-                    '411': '访问频率受限',
-                    '412': '长请求过于频繁'
-                }.get(error_code, f'未知错误（{error_code}）')
-                
-                # 根据错误代码提供更详细的说明
-                error_details = ""
-                if error_code == '202':
-                    error_details = "，请检查appKey、appSecret配置是否正确，以及签名生成方法是否正确"
-                elif error_code == '108':
-                    error_details = "，请检查API密钥是否正确"
-                elif error_code == '106':
-                    error_details = "，请检查API ID是否正确"
-                elif error_code == '112' or error_code == '411':
-                    error_details = "，请检查API调用频率或稍后再试"
-                elif error_code == '401':
-                    error_details = "，请充值账户"
-                
-                return f"有道翻译错误: {error_code}，{error_msg}{error_details}"
+                    result = (await self._youdao_translate_batch((from_lang, to_lang), [text]))[0]
+
+                # 解析结果
+                if result.get('errorCode') == '0':
+                    # 获取翻译结果
+                    translations = result.get('translation', [])
+                    if translations:
+                        translated_text = translations[0]
+                        # 存入缓存
+                        self.translation_cache.set(cache_key, translated_text)
+                        return translated_text
+                    else:
+                        return f"有道翻译错误: 未返回翻译结果"
+                else:
+                    # 处理错误响应
+                    return self._youdao_error_message(result.get('errorCode', 'unknown'))
+
+            return await self._single_flight('translation', cache_key, request)
                 
+        except CircuitOpenError as e:
+            return f"有道翻译错误: {str(e)}"
         except aiohttp.ClientError as e:
             return f"有道翻译请求错误: {str(e)}"
         except asyncio.TimeoutError:
@@ -449,71 +1425,261 @@ class FileRAGSystem:
         except Exception as e:
             return f"有道翻译未知错误: {str(e)}"
 
-    async def translate_with_zhipu(self, text: str, from_lang: str = 'zh', to_lang: str = 'en', context_prompt: str = '') -> str:
-        """使用智谱API进行翻译 - 带上下文的翻译"""
+    async def translate_with_zhipu(self, text: str, from_lang: str = 'zh', to_lang: str = 'en', context_prompt: str = '',
+                                   on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """使用智谱API进行翻译 - 带上下文的翻译；传入 on_delta 时使用流式接口逐段回调译文
+
+        同一请求正在进行时等待其结果（单飞合并），此时 on_delta 在译文完成后一次性回调。
+        """
         if not self.zhipu_api_key:
             return "错误：智谱API未配置，请先配置API密钥"
         
-        # 检查缓存
-        cache_key = f"zhipu_{from_lang}_{to_lang}_{hash(text)}"
-        if cache_key in self.translation_cache:
-            return self.translation_cache[cache_key]
+        # 检查缓存 - 键包含上下文提示词，不同知识库上下文的译文分开缓存
+        cache_key = make_cache_key('zhipu', from_lang, to_lang, context_prompt, text)
+        cached = self.translation_cache.get(cache_key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached
         
         try:
-            # 准备请求头
-            headers = {
-                "Authorization": f"Bearer {self.zhipu_api_key}",
-                "Content-Type": "application/json"
-            }
-            
             # 构建带上下文的翻译提示词
             if from_lang == 'zh' and to_lang == 'en':
                 prompt = f"{context_prompt}请将以下中文文本翻译成英文，保持专业性和准确性：\n\n{text}"
             else:
                 prompt = f"{context_prompt}请将以下英文文本翻译成中文，保持专业性和准确性：\n\n{text}"
             
-            # 准备请求数据
-            data = {
-                "prompt": prompt,
-                "temperature": 0.3,
-                "max_tokens": 2000
-            }
-            
-            # 异步发送请求
-            response = await asyncio.get_event_loop().run_in_executor(
-                self.executor,
-                lambda: requests.post(self.zhipu_api_url, headers=headers, json=data)
-            )
-            
-            # 检查响应状态
-            if response.status_code != 200:
-                return f"智谱API请求失败，状态码：{response.status_code}"
-            
-            # 处理响应数据
-            result = response.json()
-            if 'data' in result and 'choices' in result['data']:
-                translated_text = result['data']['choices'][0]['content'].strip()
-                # 保存到缓存
-                self.translation_cache[cache_key] = translated_text
-                return translated_text
-            else:
-                error_msg = result.get('msg', '未知错误')
-                return f"智谱API错误: {error_msg}"
+            shared = True  # 是否在等待其他调用方发起的相同请求
+
+            async def request():
+                # 返回 (译文或错误信息, 是否成功)
+                status, result = await self.invoke_zhipu(prompt, on_delta=on_delta)
+
+                # 检查响应状态
+                if status != 200:
+                    return f"智谱API请求失败，状态码：{status}", False
+
+                # 处理响应数据
+                if 'data' in result and 'choices' in result['data']:
+                    translated_text = result['data']['choices'][0]['content'].strip()
+                    # 保存到缓存
+                    self.translation_cache.set(cache_key, translated_text)
+                    return translated_text, True
+                else:
+                    error_msg = result.get('msg', '未知错误')
+                    return f"智谱API错误: {error_msg}", False
+
+            async def lead():
+                nonlocal shared
+                shared = False
+                return await request()
+
+            # 异步发送请求；等待其他调用方的请求时，流式回调改为完成后一次性回调
+            translated_text, ok = await self._single_flight('translation', cache_key, lead)
+            if ok and on_delta and shared:
+                on_delta(translated_text)
+            return translated_text
         except Exception as e:
             return f"智谱API调用错误: {str(e)}"
 
-    async def mirror_polish(self, text: str, model: str = 'both', context: str = '') -> Dict[str, Any]:
-        """镜式润色：中->英->中，并比较结果 - 实现中英互译润色"""
-        # 初始化结果结构
-        result = {
-            'original': text,
-            'intermediate': {},  # 中间英文翻译结果
-            'final': {},         # 最终中文润色结果
-            'comparison': {}     # 原文与润色结果比较
+    async def invoke_zhipu(self, prompt: str, temperature: float = 0.3, max_tokens: int = 2000,
+                           on_delta: Optional[Callable[[str], None]] = None):
+        """调用智谱API - 通过共享连接池发送请求，返回 (状态码, 响应数据)
+
+        传入 on_delta 时改用SSE流式接口，每收到一段token调用一次 on_delta，
+        结束后把完整文本组装成与非流式接口相同的响应结构返回。
+        """
+        headers = {
+            "Authorization": f"Bearer {self.zhipu_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens
         }
+        limiter = self.limiters['zhipu']
+        if on_delta is None:
+            return await limiter.call(
+                lambda: self.http.post(self.zhipu_api_url, json=data, headers=headers),
+                self._classify_zhipu
+            )
 
-        # 构建带有上下文的提示词，用于更专业的翻译
-        context_prompt = f"""请参考以下相关文本进行翻译：
+        parts = []
+        errors = []
+
+        def on_event(event: str, payload: str):
+            # add为增量token，finish为结束，error/interrupted为异常中断
+            if event in ('add', 'message'):
+                parts.append(payload)
+                if payload:
+                    on_delta(payload)
+            elif event in ('error', 'interrupted'):
+                errors.append(payload or event)
+
+        async def request():
+            try:
+                return await self.http.post_sse(self.zhipu_stream_url, on_event, json=data, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 已经输出了部分内容时不能重试，否则调用方会收到重复的文本
+                if parts:
+                    return 200, {'msg': f'流式响应中断: {str(e)}'}
+                raise
+
+        status, result = await limiter.call(request, self._classify_zhipu)
+        if status != 200 or result:
+            return status, result
+        if errors:
+            return status, {'msg': errors[0]}
+        return status, {'data': {'choices': [{'content': ''.join(parts)}]}}
+
+    async def translate_with_local(self, text: str, from_lang: str = 'zh', to_lang: str = 'en', context_prompt: str = '',
+                                   on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """使用本地模型进行翻译 - 带上下文的翻译；并发的翻译请求合并为批量推理，传入 on_delta 时使用流式接口逐段回调译文
+
+        同一请求正在进行时等待其结果（单飞合并），此时 on_delta 在译文完成后一次性回调。
+        """
+        cache_key = make_cache_key('local', self._local_model, from_lang, to_lang, context_prompt, text)
+        cached = self.translation_cache.get(cache_key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached
+
+        try:
+            shared = True  # 是否在等待其他调用方发起的相同请求
+
+            async def request():
+                # 返回 (译文或错误信息, 是否成功)；流式输出的请求不参与合并
+                group = (from_lang, to_lang, context_prompt)
+                if on_delta is None and self.local_batcher is not None:
+                    translated_text, ok = await self.local_batcher.submit(group, text)
+                else:
+                    translated_text, ok = await self._local_translate_one(group, text, on_delta)
+                if ok:
+                    self.translation_cache.set(cache_key, translated_text)
+                return translated_text, ok
+
+            async def lead():
+                nonlocal shared
+                shared = False
+                return await request()
+
+            translated_text, ok = await self._single_flight('translation', cache_key, lead)
+            if ok and on_delta and shared:
+                on_delta(translated_text)
+            return translated_text
+        except Exception as e:
+            return f"本地模型调用错误: {str(e)}"
+
+    def _local_translation_prompt(self, group: Tuple[str, str, str], text: str) -> str:
+        """构建本地模型的单条翻译提示词 - 本地模型容易附带解释，明确要求只输出译文"""
+        from_lang, to_lang, context_prompt = group
+        if from_lang == 'zh' and to_lang == 'en':
+            return f"{context_prompt}请将以下中文文本翻译成英文，保持专业性和准确性，只输出译文：\n\n{text}"
+        return f"{context_prompt}请将以下英文文本翻译成中文，保持专业性和准确性，只输出译文：\n\n{text}"
+
+    async def _local_translate_one(self, group: Tuple[str, str, str], text: str,
+                                   on_delta: Optional[Callable[[str], None]] = None) -> Tuple[str, bool]:
+        """本地模型翻译单条文本，返回 (译文或错误信息, 是否成功)"""
+        status, result = await self.invoke_local(self._local_translation_prompt(group, text), on_delta=on_delta)
+        if status != 200:
+            return f"本地模型请求失败，状态码：{status}，{result.get('error', '未知错误')}", False
+        if 'error' in result:
+            return f"本地模型错误: {result['error']}", False
+        return result.get('response', '').strip(), True
+
+    async def _local_translate_batch(self, group: Tuple[str, str, str], texts: List[str]) -> List[Tuple[str, bool]]:
+        """本地模型批量翻译 - 多段文本放在一次推理中，要求模型按顺序返回JSON数组
+
+        只有一条时按单条翻译；返回的条数不符或无法解析时退回逐条翻译。
+        """
+        if len(texts) == 1:
+            return [await self._local_translate_one(group, texts[0])]
+        from_lang, to_lang, context_prompt = group
+        languages = {'zh': '中文', 'en': '英文'}
+        prompt = (f"{context_prompt}请将以下JSON数组中的 {len(texts)} 段{languages[from_lang]}文本分别翻译成"
+                  f"{languages[to_lang]}，保持专业性和准确性。以JSON对象返回，格式为 "
+                  f"{{\"translations\": [译文1, 译文2, ...]}}，译文与原文按顺序一一对应，不要合并或拆分段落：\n\n"
+                  f"{json.dumps(texts, ensure_ascii=False)}")
+        # 用JSON Schema约束输出结构，条数固定为本批的文本数
+        response_format = {
+            'type': 'object',
+            'properties': {'translations': {
+                'type': 'array', 'items': {'type': 'string'}, 'minItems': len(texts), 'maxItems': len(texts)
+            }},
+            'required': ['translations']
+        }
+        status, result = await self.invoke_local(prompt, response_format=response_format)
+        if status != 200 or 'error' in result:
+            error = f"本地模型请求失败，状态码：{status}，{result.get('error', '未知错误')}"
+            return [(error, False)] * len(texts)
+        try:
+            translations = json.loads(result.get('response', ''))['translations']
+        except (ValueError, KeyError, TypeError):
+            translations = None
+        if (isinstance(translations, list) and len(translations) == len(texts)
+                and all(isinstance(t, str) and t.strip() for t in translations)):
+            return [(t.strip(), True) for t in translations]
+        print(f"⚠️ 本地模型批量翻译的结果无法与原文对应（{len(texts)} 段），改为逐条翻译")
+        return list(await asyncio.gather(*[self._local_translate_one(group, text) for text in texts]))
+
+    async def invoke_local(self, prompt: str, temperature: float = 0.3, response_format: Any = None,
+                           on_delta: Optional[Callable[[str], None]] = None):
+        """调用本地Ollama模型 - 通过共享连接池发送 /api/generate 请求，返回 (状态码, 响应数据)
+
+        请求经过本地模型的限流器排队，同时进行的推理数不超过配置的并发数；每次请求都带上 keep_alive，
+        模型在空闲期间保持驻留。response_format 为 'json' 或JSON Schema时约束输出格式。
+        传入 on_delta 时改用流式接口，每收到一段文本调用一次 on_delta，结束后返回与非流式接口相同结构的数据。
+        """
+        url = f"{self.ollama_url}/api/generate"
+        data = {
+            'model': self._local_model,
+            'prompt': prompt,
+            'stream': on_delta is not None,
+            'keep_alive': self.local_keep_alive,
+            'options': {'temperature': temperature}
+        }
+        if response_format is not None:
+            data['format'] = response_format
+        limiter = self.limiters['local']
+        if on_delta is None:
+            return await limiter.call(
+                lambda: self.http.post(url, json=data, timeout=self.local_timeout),
+                self._classify_local
+            )
+
+        parts = []
+        errors = []
+
+        def on_message(message: Dict[str, Any]):
+            if message.get('error'):
+                errors.append(message['error'])
+                return
+            chunk = message.get('response', '')
+            if chunk:
+                parts.append(chunk)
+                on_delta(chunk)
+
+        async def request():
+            try:
+                return await self.http.post_ndjson(url, on_message, json=data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 已经输出了部分内容时不能重试，否则调用方会收到重复的文本
+                if parts:
+                    return 200, {'error': f'流式响应中断: {str(e)}'}
+                raise
+
+        status, result = await limiter.call(request, self._classify_local)
+        if status != 200 or result:
+            return status, result
+        if errors:
+            return status, {'error': errors[0]}
+        return status, {'response': ''.join(parts), 'done': True}
+
+    def _translation_context_prompt(self, context: str) -> str:
+        """构建带有知识库上下文的翻译提示词前缀"""
+        return f"""请参考以下相关文本进行翻译：
 
 相关文本：
 {context}
@@ -525,56 +1691,92 @@ class FileRAGSystem:
 
 """
 
-        # 并行处理翻译任务
-        tasks = []
-        if model in ['youdao', 'both']:
-            # 使用有道翻译
-            tasks.append(self.translate_with_youdao(text, 'zh-CHS', 'en'))
-        if model in ['zhipu', 'both']:
-            # 使用智谱翻译
-            tasks.append(self.translate_with_zhipu(text, 'zh', 'en', context_prompt))
-
-        # 等待所有翻译任务完成
-        translations = await asyncio.gather(*tasks)
-
-        # 处理有道翻译结果
-        if model in ['youdao', 'both']:
-            result['intermediate']['youdao'] = translations[0]
-            # 将英文翻译回中文
-            result['final']['youdao'] = await self.translate_with_youdao(translations[0], 'en', 'zh-CHS')
-            # 分析润色结果
-            result['comparison']['youdao'] = await self.analyze_text(text, result['final']['youdao'], context)
-
-        # 处理智谱翻译结果
-        if model in ['zhipu', 'both']:
-            idx = 1 if model == 'both' else 0
-            result['intermediate']['zhipu'] = translations[idx]
-            # 将英文翻译回中文
-            result['final']['zhipu'] = await self.translate_with_zhipu(translations[idx], 'en', 'zh', context_prompt)
-            # 分析润色结果
-            result['comparison']['zhipu'] = await self.analyze_text(text, result['final']['zhipu'], context)
+    async def _run_engine_chain(self, engine: str, text: str, context: str, context_prompt: str,
+                                on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """执行单个引擎的 中->英->中->分析 链路，记录各阶段耗时
+
+        传入 on_event 时，每个阶段完成后回调一次 stage 事件，引擎支持流式输出时还会回调 delta 事件。
+        """
+        translate = self.engines[engine]
+        timings = {}
+        chain_start = time.perf_counter()
+
+        def delta_callback(stage: str) -> Optional[Callable[[str], None]]:
+            if on_event is None:
+                return None
+            return lambda delta: on_event({'type': 'delta', 'engine': engine, 'stage': stage, 'text': delta})
+
+        def finish_stage(stage: str, started: float, payload: str, **extra):
+            timings[stage] = round(time.perf_counter() - started, 4)
+            record_stage(stage, time.perf_counter() - started, engine, started)
+            if on_event is not None:
+                on_event({'type': 'stage', 'engine': engine, 'stage': stage, 'text': payload,
+                          'elapsed': timings[stage], **extra})
+
+        # 中 -> 英
+        started = time.perf_counter()
+        intermediate = await translate(text, 'forward', context_prompt, delta_callback('intermediate'))
+        finish_stage('intermediate', started, intermediate)
+
+        # 英 -> 中
+        started = time.perf_counter()
+        final = await translate(intermediate, 'back', context_prompt, delta_callback('final'))
+        finish_stage('final', started, final)
+
+        # 分析润色结果
+        started = time.perf_counter()
+        # 本地模型链路的分析同样在本地执行，其余引擎的分析使用智谱API
+        comparison = await self.analyze_text(text, final, context, on_delta=delta_callback('analysis'),
+                                             engine='local' if engine == 'local' else 'zhipu')
+        finish_stage('analysis', started, comparison['analysis'],
+                     better_version=comparison.get('better_version'), scores=comparison.get('scores', {}))
+
+        timings['total'] = round(time.perf_counter() - chain_start, 4)
+        record_stage('chain', time.perf_counter() - chain_start, engine, chain_start)
+        return {'intermediate': intermediate, 'final': final, 'comparison': comparison, 'timings': timings}
+
+    async def mirror_polish(self, text: str, model: str = 'both', context: str = '') -> Dict[str, Any]:
+        """镜式润色：中->英->中，并比较结果 - 实现中英互译润色
+
+        每个引擎的链路作为独立任务并发执行，快的引擎不等待慢的引擎，总耗时取决于最慢的一条链路。
+        """
+        # 初始化结果结构
+        result = {
+            'original': text,
+            'intermediate': {},  # 中间英文翻译结果
+            'final': {},         # 最终中文润色结果
+            'comparison': {},    # 原文与润色结果比较
+            'timings': {}        # 各引擎各阶段耗时（秒）
+        }
+
+        # 构建带有上下文的提示词，用于更专业的翻译
+        context_prompt = self._translation_context_prompt(context)
+
+        engines = self.select_engines(model)
+        chains = await asyncio.gather(*[
+            self._run_engine_chain(engine, text, context, context_prompt) for engine in engines
+        ])
+
+        for engine, chain in zip(engines, chains):
+            result['intermediate'][engine] = chain['intermediate']
+            result['final'][engine] = chain['final']
+            result['comparison'][engine] = chain['comparison']
+            result['timings'][engine] = chain['timings']
 
         return result
 
-    async def analyze_text(self, original: str, translated: str, context: str = '') -> Dict[str, Any]:
-        """使用智谱API分析文本质量 - 比较原文与润色后文本"""
-        try:
-            # 准备请求头
-            headers = {
-                "Authorization": f"Bearer {self.zhipu_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # 构建带有上下文的分析提示词
-            context_prompt = f"""请参考以下相关文本进行分析：
+    def _analysis_prompt(self, original: str, translated: str, context: str = '') -> str:
+        """构建分析润色质量的提示词"""
+        # 构建带有上下文的分析提示词
+        context_prompt = f"""请参考以下相关文本进行分析：
 
 相关文本：
 {context}
 
 """
-            
-            # 构建详细的分析提示词，更明确地要求判断质量
-            prompt = f"""{context_prompt}请严格分析以下两段中文文本的质量，并明确判断哪个文本更好：
+        
+        # 构建详细的分析提示词，更明确地要求判断质量
+        return f"""{context_prompt}请严格分析以下两段中文文本的质量，并明确判断哪个文本更好：
 
 原文：
 {original}
@@ -624,76 +1826,86 @@ class FileRAGSystem:
 2. 对每个方面都要给出具体分析
 3. 如果发现润色后的文本存在明显问题（如重复、语义错误等），必须明确指出
 4. 最终结论必须基于以上分析得出，并明确指出哪个文本更好"""
-            
-            # 准备请求数据
-            data = {
-                "prompt": prompt,
-                "temperature": 0.3,
-                "max_tokens": 2000
+
+    @staticmethod
+    def _parse_analysis(analysis: str, original: str, translated: str) -> Dict[str, Any]:
+        """从分析文本中解析评分与结论，判断哪个版本更好"""
+        # 判断哪个版本更好 - 使用更精确的判断标准
+        better_version = 'original'  # 默认为原文更好
+        scores = {}
+        
+        # 判断评分或明确陈述来确定更好的版本
+        if '润色后的文本评分' in analysis and '原文评分' in analysis:
+            # 使用正则表达式匹配分数
+            original_score_match = re.search(r'原文评分[：:]\s*(\d+(?:\.\d+)?)', analysis)
+            translated_score_match = re.search(r'润色后的文本评分[：:]\s*(\d+(?:\.\d+)?)', analysis)
+            scores = {
+                'original': original_score_match.group(1) if original_score_match else 'N/A',
+                'translated': translated_score_match.group(1) if translated_score_match else 'N/A'
             }
             
+            # 如果润色后的分数更高，则设为更好的版本
+            if original_score_match and translated_score_match:
+                if float(translated_score_match.group(1)) > float(original_score_match.group(1)):
+                    better_version = 'translated'
+        
+        # 基于关键词判断
+        if better_version == 'original':  # 如果评分方式未确定结果，使用关键词
+            if ('润色后的文本更好' in analysis or 
+                '润色后的版本更好' in analysis or 
+                '润色后的文本优于原文' in analysis or
+                '润色版本优于原文' in analysis):
+                better_version = 'translated'
+        
+        return {
+            'analysis': analysis,
+            'better_version': better_version,
+            'suggested_text': translated if better_version == 'translated' else original,
+            'scores': scores
+        }
+
+    async def analyze_text(self, original: str, translated: str, context: str = '',
+                           on_delta: Optional[Callable[[str], None]] = None, engine: str = 'zhipu') -> Dict[str, Any]:
+        """分析文本质量 - 比较原文与润色后文本；engine 为 zhipu（智谱API）或 local（本地模型），传入 on_delta 时流式回调分析文本"""
+        # 检查缓存 - 本地模型的分析按模型名分开缓存
+        if engine == 'local':
+            cache_key = make_cache_key('local-analysis', self._local_model, original, translated, context)
+        else:
+            cache_key = make_cache_key('zhipu-analysis', original, translated, context)
+        cached = self.analysis_cache.get(cache_key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached['analysis'])
+            return cached
+
+        try:
             # 异步发送请求
-            response = await asyncio.get_event_loop().run_in_executor(
-                self.executor,
-                lambda: requests.post(self.zhipu_api_url, headers=headers, json=data)
-            )
+            prompt = self._analysis_prompt(original, translated, context)
+            if engine == 'local':
+                status, result = await self.invoke_local(prompt, on_delta=on_delta)
+                content = result.get('response') if 'error' not in result else None
+            else:
+                status, result = await self.invoke_zhipu(prompt, on_delta=on_delta)
+                content = result['data']['choices'][0]['content'] \
+                    if 'data' in result and 'choices' in result['data'] else None
             
             # 检查响应状态
-            if response.status_code != 200:
+            if status != 200:
                 return {
-                    'analysis': f"分析请求失败，状态码：{response.status_code}",
+                    'analysis': f"分析请求失败，状态码：{status}",
                     'better_version': 'original',
                     'suggested_text': original
                 }
             
             # 处理响应结果
-            result = response.json()
-            if 'data' in result and 'choices' in result['data']:
-                analysis = result['data']['choices'][0]['content'].strip()
-                
-                # 判断哪个版本更好 - 使用更精确的判断标准
-                better_version = 'original'  # 默认为原文更好
-                
-                # 判断评分或明确陈述来确定更好的版本
-                if '润色后的文本评分' in analysis and '原文评分' in analysis:
-                    # 尝试从评分内容中提取得分
-                    try:
-                        # 使用正则表达式匹配分数
-                        import re
-                        original_score_match = re.search(r'原文评分[：:]\s*(\d+(?:\.\d+)?)', analysis)
-                        translated_score_match = re.search(r'润色后的文本评分[：:]\s*(\d+(?:\.\d+)?)', analysis)
-                        
-                        if original_score_match and translated_score_match:
-                            original_score = float(original_score_match.group(1))
-                            translated_score = float(translated_score_match.group(1))
-                            
-                            # 如果润色后的分数更高，则设为更好的版本
-                            if translated_score > original_score:
-                                better_version = 'translated'
-                    except:
-                        # 如果解析评分失败，使用关键词判断
-                        pass
-                
-                # 基于关键词判断
-                if better_version == 'original':  # 如果评分方式未确定结果，使用关键词
-                    if ('润色后的文本更好' in analysis or 
-                        '润色后的版本更好' in analysis or 
-                        '润色后的文本优于原文' in analysis or
-                        '润色版本优于原文' in analysis):
-                        better_version = 'translated'
-                
-                return {
-                    'analysis': analysis,
-                    'better_version': better_version,
-                    'suggested_text': translated if better_version == 'translated' else original,
-                    'scores': {
-                        'original': original_score_match.group(1) if 'original_score_match' in locals() and original_score_match else 'N/A',
-                        'translated': translated_score_match.group(1) if 'translated_score_match' in locals() and translated_score_match else 'N/A'
-                    } if 'original_score_match' in locals() or 'translated_score_match' in locals() else {}
-                }
+            if content is not None:
+                analysis_result = self._parse_analysis(content.strip(), original, translated)
+                # 只缓存成功的分析结果
+                self.analysis_cache.set(cache_key, analysis_result)
+                return analysis_result
             else:
                 return {
-                    'analysis': f"分析失败：{result.get('msg', '未知错误')}",
+                    'analysis': f"分析失败：{result.get('msg') or result.get('error') or '未知错误'}",
                     'better_version': 'original',
                     'suggested_text': original
                 }
@@ -704,21 +1916,59 @@ class FileRAGSystem:
                 'suggested_text': original
             }
 
-    async def polish_text(self, text: str, model: str = 'both') -> Dict[str, Any]:
-        """润色文本，可选择使用单个模型或两个模型 - 主要润色入口方法"""
+    async def _retrieve_context(self, text: str, top_k: int = 3) -> str:
+        """检索知识库中的相关文本作为上下文 - 查询编码放到线程池，避免阻塞事件循环"""
+        if not self.knowledge_base:
+            return ""
+        with timed_stage('retrieve'):
+            # 复制当前上下文，线程池中的编码与检索阶段也记录到本次请求的调用链中
+            related_texts = await asyncio.get_running_loop().run_in_executor(
+                self.executor, contextvars.copy_context().run, self.retrieve, text, top_k
+            )
+        return "\n\n".join(related_texts)
+
+    async def polish_text(self, text: str, model: str = 'both', trace: bool = False) -> Dict[str, Any]:
+        """润色文本，可选择使用单个模型或两个模型 - 主要润色入口方法
+
+        trace 为True（或配置了 RAG_TRACE=1）时，结果中附带本次请求各阶段的调用链。
+        """
+        with start_trace('polish_text', trace or self.trace_enabled) as request_trace:
+            started = time.perf_counter()
+            executed = False
+
+            async def run():
+                nonlocal executed
+                executed = True
+                # 共享执行的各阶段记录在单独的调用链中，结束后并入每个调用方（包括合并进来的调用方）的调用链
+                shared_trace = Trace('polish_text')
+                return await run_traced(shared_trace, self._polish_text(text, model)), shared_trace
+
+            # 相同的文本与模型同时到达时只执行一次润色流程；复制结果，各调用方附带自己的调用链
+            shared_result, shared_trace = await self._single_flight(
+                'polish', make_cache_key('polish', model, text), run
+            )
+            result = dict(shared_result)
+            if request_trace is not None:
+                # 合并进来的调用方：各阶段来自另一个请求的执行，标记为 coalesced
+                request_trace.merge(shared_trace, **({} if executed else {'coalesced': True}))
+            record_stage('polish', time.perf_counter() - started, self._model_label(model), started)
+        if 'error' in result:
+            STAGE_ERRORS.inc(stage='polish', engine=self._model_label(model))
+        if request_trace is not None:
+            result['trace'] = request_trace.to_dict()
+            result['trace']['coalesced'] = not executed
+        return result
+
+    async def _polish_text(self, text: str, model: str) -> Dict[str, Any]:
         try:
             # 设置超时时间（秒）
-            timeout = 60
+            timeout = self.polish_timeout
             
             # 使用RAG检索相关文本，作为翻译的上下文参考
-            if self.knowledge_base:
-                related_texts = self.retrieve(text, top_k=3)
-                context = "\n\n".join(related_texts)
-            else:
-                context = ""
+            context = await self._retrieve_context(text)
 
-            # 使用asyncio.wait_for添加超时控制
-            result = await asyncio.wait_for(
+            # 添加超时控制 - 排队等待引擎限流名额的时间不计入超时，文档片段大量并发时不会在排队中超时
+            result = await wait_for_active(
                 self.mirror_polish(text, model, context),
                 timeout=timeout
             )
@@ -727,18 +1977,14 @@ class FileRAGSystem:
             final_result = {
                 'original': text,
                 'suggested': {},
-                'analysis': {}
+                'analysis': {},
+                'timings': result['timings']
             }
             
-            # 添加有道翻译结果
-            if 'youdao' in result['final']:
-                final_result['suggested']['youdao'] = result['final']['youdao']
-                final_result['analysis']['youdao'] = result['comparison']['youdao']['analysis']
-            
-            # 添加智谱翻译结果
-            if 'zhipu' in result['final']:
-                final_result['suggested']['zhipu'] = result['final']['zhipu']
-                final_result['analysis']['zhipu'] = result['comparison']['zhipu']['analysis']
+            # 添加各引擎的润色结果与分析
+            for engine in result['final']:
+                final_result['suggested'][engine] = result['final'][engine]
+                final_result['analysis'][engine] = result['comparison'][engine]['analysis']
             
             return final_result
             
@@ -759,6 +2005,137 @@ class FileRAGSystem:
                 'error': f'润色过程中出错: {str(e)}'
             }
 
+    async def polish_text_stream(self, text: str, model: str = 'both', timeout: float = 120, trace: bool = False):
+        """流式润色 - 异步生成器，按完成顺序逐条产出事件，不等待所有引擎全部完成
+
+        事件类型：
+          start  开始润色
+          delta  智谱流式接口的增量文本（stage为 intermediate/final/analysis）
+          stage  某个引擎完成一个阶段（intermediate中间英文、final润色结果、analysis分析）
+          error  某个引擎出错或整体超时
+          done   全部结束，附带总耗时（开启调用链时附带 trace）
+        每个引擎的 中->英->中->分析 链路独立推进，先完成的引擎先输出。
+        """
+        start_time = time.time()
+        # 异步生成器无法为调用方设置上下文，调用链显式传给检索与各引擎任务
+        request_trace = Trace('polish_text_stream') if trace or self.trace_enabled else None
+        engines = self.select_engines(model)
+        yield {'type': 'start', 'original': text, 'engines': engines}
+
+        events = asyncio.Queue()
+        finished = object()  # 单个引擎链路结束的标记
+
+        async def run_chain(engine: str, context: str):
+            try:
+                await self._run_engine_chain(engine, text, context, self._translation_context_prompt(context),
+                                             on_event=events.put_nowait)
+            except Exception as e:
+                print(f"❌ {engine} 流式润色出错: {str(e)}")
+                events.put_nowait({'type': 'error', 'engine': engine, 'error': f'润色过程中出错: {str(e)}'})
+            finally:
+                events.put_nowait(finished)
+
+        tasks = []
+        deadline = start_time + timeout
+        try:
+            context = await asyncio.wait_for(run_traced(request_trace, self._retrieve_context(text)), timeout=timeout)
+            tasks = [asyncio.create_task(run_traced(request_trace, run_chain(engine, context))) for engine in engines]
+            remaining = len(tasks)
+            while remaining:
+                event = await asyncio.wait_for(events.get(), timeout=max(0.0, deadline - time.time()))
+                if event is finished:
+                    remaining -= 1
+                else:
+                    yield event
+        except asyncio.TimeoutError:
+            print("❌ 润色操作超时")
+            yield {'type': 'error', 'error': '润色操作超时，请稍后重试'}
+        except Exception as e:
+            print(f"❌ 润色过程中出错: {str(e)}")
+            yield {'type': 'error', 'error': f'润色过程中出错: {str(e)}'}
+        finally:
+            # 客户端断开或超时时取消仍在进行的上游请求
+            for task in tasks:
+                task.cancel()
+        done = {'type': 'done', 'elapsed': round(time.time() - start_time, 3)}
+        record_stage('polish_stream', done['elapsed'], self._model_label(model))
+        if request_trace is not None:
+            done['trace'] = request_trace.to_dict()
+        yield done
+
+    async def compare_versions(self, original: str, youdao_text: str, zhipu_text: str) -> str:
+        """使用智谱API对比有道与智谱两个润色版本 - 失败时返回空字符串"""
+        prompt = self.version_compare_template.format(original=original, youdao=youdao_text, zhipu=zhipu_text)
+        try:
+            status, result = await self.invoke_zhipu(prompt)
+            if status == 200 and 'data' in result and 'choices' in result['data']:
+                return result['data']['choices'][0]['content'].strip()
+        except Exception as e:
+            print(f"❌ 版本对比分析出错: {str(e)}")
+        return ""
+
+    async def _polish_segment(self, text: str, model: str) -> List[str]:
+        """润色单个文档片段，返回该片段在输出文件中的内容"""
+        result = await self.polish_text(text, model)
+        suggested = result.get('suggested', {})
+        analysis = result.get('analysis', {})
+
+        # 添加原文
+        content = [f"原文：\n{text}\n"]
+        if 'error' in result:
+            content.append(f"\n润色失败：{result['error']}")
+        elif model == 'both':
+            # 添加各自的润色结果
+            content.append(f"\n有道翻译润色版本：\n{suggested.get('youdao', '')}")
+            content.append(f"\n智谱API润色版本：\n{suggested.get('zhipu', '')}")
+            # 同时使用两种模型时，进行综合对比分析；对比失败时只保留各自的润色结果
+            comparison = await self.compare_versions(text, suggested.get('youdao', ''), suggested.get('zhipu', ''))
+            if comparison:
+                # 添加详细的对比分析
+                content.append(f"\n【润色版本对比分析】：\n{comparison}")
+        else:
+            # 单模型或全部引擎（all）模式下，依次显示各引擎的结果
+            for engine in self.select_engines(model):
+                name = self.limiters[engine].name if engine in self.limiters else engine
+                content.append(f"\n{name}润色：\n{suggested.get(engine, '')}")
+                content.append(f"\n{name}分析：\n{analysis.get(engine, '')}")
+
+        # 添加分隔符
+        content.append("\n" + "="*50 + "\n")
+        return content
+
+    def split_for_polish(self, documents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """把待润色文档切分为按原文顺序排列、互不重叠的片段"""
+        segments = []
+        for doc in documents:
+            segments.extend(self.polish_chunker.chunk_text(doc['text'], doc.get('source', '')))
+        return segments
+
+    async def polish_document(self, documents: List[Dict[str, str]], model: str = 'both',
+                              on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """并发润色整篇文档 - 片段并发处理（各引擎分别限流），结果按原文顺序拼接
+
+        on_progress(已完成片段数, 总片段数) 在每个片段完成后调用，用于上报进度。
+        """
+        segments = self.split_for_polish(documents)
+        segment_slots = asyncio.Semaphore(self.segment_concurrency)
+        finished = 0
+        if on_progress:
+            on_progress(0, len(segments))
+
+        async def run(segment):
+            nonlocal finished
+            async with segment_slots:
+                section = await self._polish_segment(segment['text'], model)
+            finished += 1
+            if on_progress:
+                on_progress(finished, len(segments))
+            return section
+
+        # gather按提交顺序返回结果，保证输出与原文顺序一致
+        sections = await asyncio.gather(*(run(segment) for segment in segments))
+        return '\n'.join(line for section in sections for line in section)
+
 
 def main():
     """主函数 - 命令行界面入口"""
@@ -771,7 +2148,9 @@ def main():
     print("支持的文件格式: .txt, .docx, .pdf, .json")
     print("输入 'exit' 退出")
     print("输入 'save' 保存知识库")
+    print("输入 'load' 加载知识库")
     print("输入 'list' 查看已上传文件")
+    print("输入 'ingest <目录>' 批量导入目录中的所有文件")
     print("=" * 50)
 
     # 命令行交互循环
@@ -787,14 +2166,30 @@ def main():
             filename = input("请输入保存文件名（直接回车使用默认名称）：")
             rag_system.save_knowledge_base(filename if filename.strip() else None)
 
+        # 加载知识库
+        elif command.lower() == 'load':
+            filename = input("请输入知识库文件路径（直接回车加载 knowledge_base 目录中最新的知识库）：")
+            if filename.strip():
+                rag_system.load_knowledge_base(filename.strip())
+            elif not rag_system.load_latest_knowledge_base('knowledge_base'):
+                print("📝 没有可加载的知识库")
+
         # 列出已上传文件
         elif command.lower() == 'list':
             if not rag_system.knowledge_base:
                 print("📝 知识库为空")
             else:
                 print("\n📚 已上传文件：")
-                for doc in rag_system.knowledge_base:
-                    print(f"- {doc['source']}")
+                for source in rag_system.embedding_store.sources():
+                    print(f"- {source}")
+
+        # 批量导入目录
+        elif command.lower().startswith('ingest '):
+            folder = command[len('ingest '):].strip()
+            if os.path.isdir(folder):
+                rag_system.ingest_directory(folder)
+            else:
+                print(f"❌ 目录不存在: {folder}")
 
         # 上传文件到知识库
         elif os.path.isfile(command):
@@ -0,0 +1,173 @@
+import asyncio
+from json import loads as parse_json  # 请求方法的 json 参数与模块同名
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiohttp  # 异步HTTP请求
+from yarl import URL  # aiohttp依赖的URL解析库
+
+
+class HTTPClient:
+    """共享的异步HTTP客户端 - 长连接复用、连接池上限、按主机限流与统一超时
+
+    整个进程共用一个 aiohttp.ClientSession，避免每次请求都重新建立TCP/TLS连接。
+    会话在第一次使用时（或调用 start() 时）在当前事件循环中创建，由 close() 释放。
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30,
+                 total_timeout: float = 60, connect_timeout: float = 10):
+        self.limit = limit  # 连接池总连接数上限
+        self.limit_per_host = limit_per_host  # 单个上游主机的并发连接上限
+        self.keepalive_timeout = keepalive_timeout  # 空闲连接保活时间（秒）
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._session = None
+        self._loop = None
+        self._closing = set()  # 正在关闭的旧会话任务，持有引用直到关闭完成
+
+    async def start(self):
+        """创建连接池 - 在应用启动时调用，也可以在第一次请求时自动创建"""
+        self._ensure_session()
+
+    async def close(self):
+        """关闭连接池 - 在应用退出时调用"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # 会话与事件循环绑定，循环变化（例如命令行多次 asyncio.run）时重新创建
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._release_session()
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    def _release_session(self):
+        """释放绑定在上一个事件循环上的会话，避免会话与连接池泄漏"""
+        session, loop = self._session, self._loop
+        self._session = None
+        self._loop = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running():
+            # 原循环仍在其他线程中运行，交给它关闭
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # 原循环已结束，在当前循环中关闭（原循环已关闭时连接池不再等待各连接的关闭回调）
+        task = asyncio.ensure_future(self._close_session(session))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_session(session: aiohttp.ClientSession):
+        try:
+            await session.close()
+        except Exception as e:
+            print(f"⚠️ 关闭旧的HTTP会话时出错: {str(e)}")
+
+    async def warm(self, urls, connections: int = 2, timeout: float = 5) -> int:
+        """预先建立到各上游主机的长连接 - 每个主机发送若干个HEAD请求，连接归还连接池后可被后续请求复用
+
+        返回成功建立的连接数；上游不可达时只跳过，不抛出异常。
+        """
+        origins = {str(URL(url).origin()) for url in urls if url}
+        request_timeout = aiohttp.ClientTimeout(total=timeout)
+
+        async def open_connection(origin: str) -> bool:
+            try:
+                async with self.session.head(origin, timeout=request_timeout, allow_redirects=False):
+                    return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+
+        results = await asyncio.gather(*[
+            open_connection(origin) for origin in origins for _ in range(connections)
+        ])
+        return sum(results)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """当前事件循环中的共享会话"""
+        return self._ensure_session()
+
+    async def post(self, url: str, json: Any = None, data: Any = None, headers: Dict[str, str] = None,
+                   timeout: Optional[float] = None) -> Tuple[int, Dict[str, Any]]:
+        """发送POST请求并解析JSON响应，返回 (状态码, 响应数据)；响应不是JSON时数据为空字典"""
+        options = {}
+        if timeout:
+            # 只在指定了单次超时时覆盖；timeout=None 在aiohttp中表示不限时，会绕过会话的默认超时
+            options['timeout'] = aiohttp.ClientTimeout(total=timeout, connect=self.timeout.connect)
+        async with self.session.post(url, json=json, data=data, headers=headers, **options) as response:
+            try:
+                payload = await response.json(content_type=None)
+            except ValueError:
+                payload = {}
+            return response.status, payload if payload is not None else {}
+
+    async def post_sse(self, url: str, on_event: Callable[[str, str], None], json: Any = None,
+                       headers: Dict[str, str] = None) -> Tuple[int, Dict[str, Any]]:
+        """发送POST请求并按SSE格式逐条读取事件，每条事件调用 on_event(事件名, 数据)
+
+        流式响应只限制单次读取的间隔，不限制总时长。状态码不是200时不读取事件流，
+        返回 (状态码, 响应数据)；成功时返回 (200, {})。
+        """
+        stream_timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout.connect,
+                                               sock_read=self.timeout.total)
+        async with self.session.post(url, json=json, headers=headers, timeout=stream_timeout) as response:
+            if response.status != 200:
+                try:
+                    payload = await response.json(content_type=None)
+                except ValueError:
+                    payload = {}
+                return response.status, payload if payload is not None else {}
+
+            # 按SSE规范解析：空行分隔事件，多行data以换行拼接
+            event, data_lines = None, []
+            async for raw_line in response.content:
+                line = raw_line.decode('utf-8').rstrip('\r\n')
+                if not line:
+                    if data_lines or event:
+                        on_event(event or 'message', '\n'.join(data_lines))
+                    event, data_lines = None, []
+                    continue
+                if line.startswith(':'):
+                    continue
+                field, _, value = line.partition(':')
+                if value.startswith(' '):
+                    value = value[1:]
+                if field == 'event':
+                    event = value
+                elif field == 'data':
+                    data_lines.append(value)
+            if data_lines:
+                on_event(event or 'message', '\n'.join(data_lines))
+            return response.status, {}
+
+    async def post_ndjson(self, url: str, on_message: Callable[[Dict[str, Any]], None], json: Any = None,
+                          headers: Dict[str, str] = None) -> Tuple[int, Dict[str, Any]]:
+        """发送POST请求并逐行读取JSON流（NDJSON，例如Ollama的流式接口），每行调用 on_message(数据)
+
+        与 post_sse 相同，只限制单次读取的间隔；状态码不是200时返回 (状态码, 响应数据)，成功时返回 (200, {})。
+        """
+        stream_timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout.connect,
+                                               sock_read=self.timeout.total)
+        async with self.session.post(url, json=json, headers=headers, timeout=stream_timeout) as response:
+            if response.status != 200:
+                try:
+                    payload = await response.json(content_type=None)
+                except ValueError:
+                    payload = {}
+                return response.status, payload if payload is not None else {}
+
+            async for raw_line in response.content:
+                line = raw_line.strip()
+                if line:
+                    on_message(parse_json(line))
+            return response.status, {}
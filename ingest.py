@@ -0,0 +1,220 @@
+import hashlib
+import itertools
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from chunking import TextChunker, rebase_chunks  # 知识库文档分块
+from result_cache import ResultCache, make_cache_key  # 解析结果缓存
+
+
+def parse_txt(file_path: str) -> List[Dict[str, str]]:
+    """处理txt文件 - 读取内容并返回结构化数据"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return [{"text": content, "source": os.path.basename(file_path)}]
+
+
+def iter_docx_paragraphs(file_path: str) -> Iterator[str]:
+    """逐段产出docx文件的段落文本"""
+    from docx import Document  # 用于处理Word文档，首次使用时才导入
+    for paragraph in Document(file_path).paragraphs:
+        yield paragraph.text
+
+
+def parse_docx(file_path: str) -> List[Dict[str, str]]:
+    """处理docx文件 - 提取所有段落文本"""
+    content = "\n".join(iter_docx_paragraphs(file_path))
+    return [{"text": content, "source": os.path.basename(file_path)}]
+
+
+def pdf_page_count(file_path: str) -> int:
+    """PDF的页数 - 只读取页面树，不提取文本"""
+    from PyPDF2 import PdfReader  # 用于处理PDF文件，首次使用时才导入
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """逐页产出PDF页码范围 [start, stop) 内的文本，不在内存中保留其他页的文本"""
+    from PyPDF2 import PdfReader  # 用于处理PDF文件，首次使用时才导入
+    reader = PdfReader(file_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for number in range(start, stop):
+        yield reader.pages[number].extract_text() or ""
+
+
+def parse_pdf(file_path: str, pages: Optional[Tuple[int, int]] = None) -> List[Dict[str, str]]:
+    """处理pdf文件 - 提取所有页面（或指定页码范围）的文本，每页末尾加换行
+
+    按页码范围分别提取的文本依次拼接后与整篇提取的文本相同。
+    """
+    content = "".join(page + "\n" for page in iter_pdf_pages(file_path, *(pages or (0, None))))
+    return [{"text": content, "source": os.path.basename(file_path)}]
+
+
+def parse_json(file_path: str) -> List[Dict[str, str]]:
+    """处理json文件 - 支持不同的JSON结构"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data  # 假设列表已经是合适的格式
+    return [{"text": str(data), "source": os.path.basename(file_path)}]
+
+
+# 文件扩展名 -> 解析函数，均为模块级函数以便在子进程中执行
+PARSERS = {
+    '.txt': parse_txt,
+    '.docx': parse_docx,
+    '.pdf': parse_pdf,
+    '.json': parse_json
+}
+
+# 解析器版本 - 修改解析逻辑时递增，旧版本的缓存结果随之失效
+PARSER_VERSIONS = {
+    '.txt': 1,
+    '.docx': 1,
+    '.pdf': 2,
+    '.json': 1
+}
+
+# 小于该字节数的PDF不检查页数，整篇作为一个任务解析
+PDF_SPLIT_MIN_BYTES = 1024 * 1024
+
+# 小于该字节数的docx整篇解析
+DOCX_SPLIT_MIN_BYTES = 1024 * 1024
+
+
+def pdf_page_ranges(file_path: str, pages_per_part: int) -> Optional[List[Tuple[int, int]]]:
+    """大PDF按页码切分为若干范围，可分别在不同进程中解析与分块；不需要切分时返回None"""
+    if not pages_per_part or not file_path.lower().endswith('.pdf') or os.path.getsize(file_path) < PDF_SPLIT_MIN_BYTES:
+        return None
+    count = pdf_page_count(file_path)
+    if count <= pages_per_part:
+        return None
+    return [(start, min(start + pages_per_part, count)) for start in range(0, count, pages_per_part)]
+
+
+def docx_needs_split(file_path: str, paragraphs_per_part: int) -> bool:
+    """大docx是否按段落分批处理"""
+    return (bool(paragraphs_per_part) and file_path.lower().endswith('.docx')
+            and os.path.getsize(file_path) >= DOCX_SPLIT_MIN_BYTES)
+
+
+def file_digest(file_path: str) -> str:
+    """文件内容的SHA-256摘要 - 分块读取，避免大文件一次性读入内存"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_file(file_path: str, cache: Optional[ResultCache] = None, digest: Optional[str] = None,
+               pages: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+    """解析文件，结果按 (扩展名, 解析器版本, 内容摘要[, 页码范围]) 缓存
+
+    同一路径上的文件内容变化后摘要随之变化，不会读到旧内容；内容相同的文件只解析一次。
+    缓存中不保存由文件名生成的来源字段，读取时按当前文件名补全。
+    pages 只用于PDF，表示只解析页码范围 [start, stop)，每个范围单独缓存。
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    parser = PARSERS[ext] if pages is None else lambda path: parse_pdf(path, pages)
+    if cache is None:
+        return parser(file_path)
+
+    source = os.path.basename(file_path)
+    key = make_cache_key('parse', ext, PARSER_VERSIONS[ext], digest or file_digest(file_path), *(pages or ()))
+    documents = cache.get(key)
+    if documents is None:
+        documents = parser(file_path)
+        cache.set(key, [
+            {k: v for k, v in doc.items() if not (k == 'source' and v == source)} if isinstance(doc, dict) else doc
+            for doc in documents
+        ])
+        return documents
+    return [dict(doc, source=doc.get('source') or source) if isinstance(doc, dict) else doc for doc in documents]
+
+
+def open_parse_cache(path: str, max_bytes: int, max_disk_bytes: int) -> ResultCache:
+    """创建解析结果缓存 - 结果不过期，按字节上限淘汰；磁盘层可被命令行与网页端等多个进程共享"""
+    return ResultCache('parse', max_bytes=max_bytes, ttl=0, path=path, max_disk_bytes=max_disk_bytes)
+
+
+def iter_files(folder: str, extensions=None) -> Iterator[str]:
+    """递归列出目录中受支持的文件，按路径排序保证导入顺序稳定"""
+    extensions = extensions or PARSERS
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield os.path.join(root, name)
+
+
+# 子进程中的全局状态，由 init_worker 在进程启动时设置一次
+_worker_chunker = None
+_worker_known_digests = frozenset()
+_worker_parse_cache = None
+
+
+def init_worker(max_tokens: int, overlap_tokens: int, known_digests: frozenset,
+                parse_cache_options: Optional[Dict[str, Any]] = None):
+    """进程池初始化函数 - 创建分块器、打开共享的解析缓存，并记录知识库中已有文件的摘要"""
+    global _worker_chunker, _worker_known_digests, _worker_parse_cache
+    _worker_chunker = TextChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    _worker_known_digests = known_digests
+    _worker_parse_cache = open_parse_cache(**parse_cache_options) if parse_cache_options else None
+
+
+def parse_and_chunk(file_path: str, source: str, digest: Optional[str] = None,
+                    pages: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """在子进程中计算摘要、解析并分块单个文件（或大PDF的一个页码范围）
+
+    内容摘要已在知识库中时跳过解析；传入 digest 时表示调用方已计算摘要并完成检查。
+    返回的分块都带有 source 与 content_hash 字段；页码范围内的分块偏移相对于该范围的文本，
+    chars 为该范围文本的字符数，由调用方按范围顺序换算为整篇文本中的偏移（见 rebase_chunks）。
+    """
+    result = {'path': file_path, 'source': source, 'digest': digest, 'bytes': 0, 'pages': pages,
+              'documents': [], 'chars': 0, 'skipped': False, 'error': None}
+    try:
+        if digest is None:
+            result['bytes'] = os.path.getsize(file_path)
+            result['digest'] = file_digest(file_path)
+            if result['digest'] in _worker_known_digests:
+                result['skipped'] = True
+                return result
+        documents = [
+            dict(doc, source=source, content_hash=result['digest'])
+            for doc in parse_file(file_path, _worker_parse_cache, result['digest'], pages)
+        ]
+        result['chars'] = sum(len(str(doc.get('text', ''))) for doc in documents)
+        result['documents'] = _worker_chunker.chunk_documents(documents)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def iter_docx_parts(file_path: str, source: str, paragraphs_per_part: int, chunker: TextChunker,
+                    digest: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """逐批读取大docx的段落并分块，逐批产出换算到整篇偏移后的分块
+
+    除第一批外每批文本以换行开头，各批依次拼接后与 parse_docx 提取的整篇文本相同。
+    任一时刻只保留一批段落的文本与分块（python-docx 仍会把整个文档的XML读入内存）。
+    """
+    digest = digest or file_digest(file_path)
+    paragraphs = iter_docx_paragraphs(file_path)
+    offset = index = 0
+    for number, batch in enumerate(iter(lambda: list(itertools.islice(paragraphs, paragraphs_per_part)), [])):
+        text = ("\n" if number else "") + "\n".join(batch)
+        documents = [{"text": text, "source": source, "content_hash": digest}]
+        chunks = rebase_chunks(chunker.chunk_documents(documents), offset, index)
+        offset += len(text)
+        index += len(chunks)
+        yield chunks
+
+
+def format_throughput(stats: Dict[str, Any]) -> Optional[str]:
+    """把导入统计格式化为一行吞吐量说明"""
+    if not stats.get('elapsed'):
+        return None
+    return (f"{stats['files_ingested']} 个文件 / {stats['chunks']} 个分块，耗时 {stats['elapsed']:.2f}s，"
+            f"{stats['files_per_sec']:.1f} 文件/s，{stats['chunks_per_sec']:.1f} 分块/s，{stats['mb_per_sec']:.2f} MB/s")
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+FINISHED_STATES = (COMPLETED, FAILED)
+
+
+class Job:
+    """后台任务 - 记录状态、进度和结果，并向订阅者推送状态变化"""
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind  # 任务类型，例如 polish_doc
+        self.params = params  # 任务参数，由处理函数解释
+        self.status = QUEUED
+        self.done = 0  # 已完成的步骤数
+        self.total = 0  # 总步骤数，未知时为0
+        self.result = None  # 处理函数的返回值（例如输出文件名）
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._listeners = set()  # 订阅状态变化的队列
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'progress': round(self.done / self.total, 4) if self.total else 0.0,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def update_progress(self, done: int, total: int):
+        """更新进度并通知订阅者 - 作为进度回调传给处理函数"""
+        self.done = done
+        self.total = total
+        self._notify()
+
+    def _notify(self):
+        snapshot = self.to_dict()
+        for listener in list(self._listeners):
+            listener.put_nowait(snapshot)
+
+
+class JobManager:
+    """后台任务队列 - 固定数量的工作协程从队列中取任务执行，提交方立即拿到任务ID
+
+    handler(job) 为异步处理函数，可通过 job.update_progress 上报进度，
+    其返回值保存在 job.result 中；抛出的异常会将任务标记为失败。
+    """
+
+    def __init__(self, handler: Callable[[Job], Awaitable[Any]], workers: int = 2, max_finished: int = 1000):
+        self.handler = handler
+        self.workers = workers  # 同时执行的任务数
+        self.max_finished = max_finished  # 保留的已结束任务数量，超出后丢弃最早的
+        self.jobs = OrderedDict()  # job_id -> Job
+        self._queue = None
+        self._worker_tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        """等待执行的任务数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """启动工作协程 - 在应用启动时调用"""
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """停止工作协程 - 在应用退出时调用，未完成的任务标记为失败"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for job in self.jobs.values():
+            if not job.finished:
+                self._finish(job, FAILED, error='服务已停止，任务未完成')
+
+    async def submit(self, kind: str, **params) -> Job:
+        """提交任务并立即返回"""
+        if self._queue is None:
+            await self.start()
+        job = Job(kind, params)
+        self.jobs[job.id] = job
+        self._trim()
+        await self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def subscribe(self, job_id: str):
+        """订阅任务状态变化 - 先返回当前状态，之后每次变化返回一次，任务结束后停止"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        listener = asyncio.Queue()
+        job._listeners.add(listener)
+        try:
+            snapshot = job.to_dict()
+            yield snapshot
+            while snapshot['status'] not in FINISHED_STATES:
+                snapshot = await listener.get()
+                yield snapshot
+        finally:
+            job._listeners.discard(listener)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = RUNNING
+                job.started_at = time.time()
+                job._notify()
+                result = await self.handler(job)
+                self._finish(job, COMPLETED, result=result)
+            except asyncio.CancelledError:
+                self._finish(job, FAILED, error='任务被取消')
+                raise
+            except Exception as e:
+                print(f"❌ 任务 {job.id} 执行失败: {str(e)}")
+                self._finish(job, FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: str = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job._notify()
+
+    def _trim(self):
+        """丢弃最早的已结束任务，避免任务记录无限增长"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
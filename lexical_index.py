@@ -0,0 +1,159 @@
+import bisect
+import copy
+import importlib
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+# 连续的汉字，或由字母数字组成的词（允许 . _ - 连接，如 GPT-4、v1.0）
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:[._-][a-z0-9]+)*')
+_MAX_TF = 65535  # 词频以uint16存储
+
+
+def char_ngram_tokenize(text: str) -> List[str]:
+    """按字符n-gram切分 - 汉字串切为相邻二元组（单字成词时保留单字），字母数字按词切分并转为小写
+
+    不需要分词词典，术语只要字面一致就能匹配，适合中英文混排的专业文本。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if len(run) > 1 and run[0] >= '\u3400':
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def jieba_tokenize(text: str) -> List[str]:
+    """jieba搜索引擎模式分词（可选依赖：pip install jieba），过滤标点与空白"""
+    import jieba  # 可选依赖，仅在选择该分词方式时导入
+    return [token for token in jieba.lcut_for_search(text.lower()) if _TOKEN_PATTERN.fullmatch(token)]
+
+
+# 可选的分词方式
+TOKENIZERS = {
+    'ngram': char_ngram_tokenize,
+    'jieba': jieba_tokenize,
+}
+
+
+def get_tokenizer(name: str = 'ngram') -> Callable[[str], List[str]]:
+    """根据配置名称获取分词函数 - jieba未安装时在此处报错，而不是在第一次检索时"""
+    name = (name or 'ngram').lower()
+    if name not in TOKENIZERS:
+        raise ValueError(f"不支持的分词方式: {name}，可选: {', '.join(TOKENIZERS)}")
+    if name == 'jieba':
+        importlib.import_module('jieba')
+    return TOKENIZERS[name]
+
+
+class BM25Index:
+    """内存倒排索引 + BM25打分 - 与向量存储的行号一一对应
+
+    每个词的倒排表为两个按行号递增的紧凑数组（行号uint32、词频uint16），追加新文档时只在末尾写入。
+    快照与写入方共享倒排表，查询时只读取快照文档数以内的行；有删除时整体重建，旧快照仍引用旧的倒排表。
+
+    build(documents)         用全部文档（含 text 字段）重建索引
+    update(documents, start) 前 start 篇文档不变，只索引之后新增的文档
+    search(query, top_k)     返回 (行号数组, BM25分数数组)，只返回至少命中一个词的文档
+    snapshot()               返回当前状态的只读副本
+    """
+
+    def __init__(self, tokenizer: str = 'ngram', k1: float = 1.5, b: float = 0.75):
+        self.tokenizer_name = tokenizer
+        self.tokenize = get_tokenizer(tokenizer)
+        self.k1 = k1  # 词频饱和参数
+        self.b = b  # 文档长度归一化参数
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}  # 词 -> (行号数组, 词频数组)
+        self._doc_lengths = array('I')  # 每篇文档的词数
+        self._size = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._postings)
+
+    def build(self, documents: Sequence[Dict[str, str]]):
+        # 替换而不是清空原有结构，已发布的快照继续使用旧的倒排表
+        self._reset()
+        self.update(documents, 0)
+
+    def update(self, documents: Sequence[Dict[str, str]], start: int):
+        if start != self._size:
+            self.build(documents)
+            return
+        postings = self._postings
+        for doc_id, doc in enumerate(documents[start:] if start else documents, start):
+            counts = Counter(self.tokenize(doc['text']))
+            for term, tf in counts.items():
+                posting = postings.get(term)
+                if posting is None:
+                    # 先填好再放入字典，并发的查询不会看到不完整的倒排表
+                    posting = (array('I', (doc_id,)), array('H', (min(tf, _MAX_TF),)))
+                    postings[term] = posting
+                else:
+                    posting[0].append(doc_id)
+                    posting[1].append(min(tf, _MAX_TF))
+            length = sum(counts.values())
+            self._doc_lengths.append(length)
+            self._total_length += length
+            self._size = doc_id + 1
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        count = self._size
+        terms = set(self.tokenize(query))
+        if not count or not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        lengths = np.frombuffer(self._doc_lengths[:count], dtype=np.uint32).astype(np.float32)
+        # 每篇文档的长度归一化项 k1 * (1 - b + b * dl / avgdl)
+        norms = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count))
+        scores = np.zeros(count, dtype=np.float32)
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            # 倒排表按行号递增，快照之后追加的行都在末尾
+            df = bisect.bisect_left(posting[0], count)
+            if not df:
+                continue
+            doc_ids = np.frombuffer(posting[0][:df], dtype=np.uint32)
+            tf = np.frombuffer(posting[1][:df], dtype=np.uint16).astype(np.float32)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + norms[doc_ids])
+
+        matched = np.flatnonzero(scores)
+        order = top_k_indices(scores[matched], top_k)
+        return matched[order].astype(np.int64), scores[matched[order]]
+
+    def snapshot(self) -> 'BM25Index':
+        # build 替换倒排表而 update 只在末尾追加，浅复制后文档数与总词数即固定
+        return copy.copy(self)
+
+    def stats(self) -> Dict[str, int]:
+        return {'documents': self._size, 'terms': len(self._postings), 'tokens': self._total_length}
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """倒数排名融合(RRF) - 每个排序列表中排名第r的结果得分 1/(k+r)，按总分降序返回 (行号, 分数)
+
+    只使用排名而不使用原始分数，BM25分数与余弦相似度不需要归一化到同一量纲。
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,296 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认的延迟直方图分桶（秒），覆盖毫秒级的缓存命中到分钟级的整篇润色
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metric:
+    """指标基类 - 按标签值组合分别计数，线程安全"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}  # 标签值元组 -> 数值或直方图状态
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    """只增计数器"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """同步由其他组件维护的累计值（例如缓存的命中次数），只在采集函数中使用"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    """可增可减的瞬时值"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """直方图 - 按分桶累计观测值个数，同时记录总和与总数，可在Prometheus中计算分位数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key, state) -> List[str]:
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表 - 同名指标只创建一次；采集函数在每次导出前调用，用于刷新由其他组件统计的瞬时值"""
+
+    def __init__(self):
+        self._metrics = {}  # 名称 -> 指标
+        self._collectors = {}  # 名称 -> 采集函数
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Sequence[str], **options) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **options)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"指标 {name} 已以不同的类型或标签注册")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def set_collector(self, name: str, collect: Callable[[], None]):
+        """注册（或替换）采集函数"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self) -> str:
+        """以Prometheus文本格式导出全部指标"""
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"❌ 采集指标 {name} 时出错: {str(e)}")
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局注册表 - /metrics 路由导出其中的全部指标
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'rag_stage_seconds', '润色流程各阶段耗时（秒）', ('stage', 'engine')
+)
+STAGE_ERRORS = REGISTRY.counter(
+    'rag_stage_errors_total', '润色流程各阶段的出错次数', ('stage', 'engine')
+)
+
+
+class Trace:
+    """单个请求的调用链 - 记录各阶段的开始时间（相对请求开始）、耗时与附加属性"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, seconds: float, attributes: Dict[str, Any]):
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start_ms': round((started - self.started) * 1000, 2),
+                'duration_ms': round(seconds * 1000, 2),
+                **attributes
+            })
+
+    def merge(self, other: 'Trace', **attributes):
+        """把另一条调用链的各阶段并入本调用链 - 开始时间按两者的起点换算，attributes 附加到每个阶段上"""
+        offset_ms = (other.started - self.started) * 1000
+        with other._lock:
+            spans = list(other.spans)
+        with self._lock:
+            for span in spans:
+                self.spans.append(dict(span, start_ms=round(span['start_ms'] + offset_ms, 2), **attributes))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start_ms'])
+        return {
+            'name': self.name,
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'spans': spans
+        }
+
+
+# 当前请求的调用链，随asyncio任务的上下文传递；为None时不记录
+_current_trace = contextvars.ContextVar('rag_trace', default=None)
+
+
+async def run_traced(trace: Optional[Trace], awaitable):
+    """在指定调用链下执行协程 - 用于异步生成器中启动的任务，这类任务无法继承调用方设置的调用链"""
+    token = _current_trace.set(trace)
+    try:
+        return await awaitable
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, enabled: bool = True):
+    """为当前请求开启调用链记录，enabled为False时不记录（返回None）"""
+    if not enabled:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float, engine: str = '', started: Optional[float] = None, **attributes):
+    """记录一个已完成阶段的耗时 - 写入阶段耗时直方图，开启调用链时同时记录一个span"""
+    STAGE_SECONDS.observe(seconds, stage=stage, engine=engine)
+    trace = _current_trace.get()
+    if trace is not None:
+        if engine:
+            attributes['engine'] = engine
+        trace.add(stage, started if started is not None else time.perf_counter() - seconds, seconds, attributes)
+
+
+@contextmanager
+def timed_stage(name: str, engine: str = '', **attributes):
+    """统计代码块的耗时并记录为一个阶段，代码块抛出异常时计入阶段出错次数"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name, engine=engine)
+        attributes['error'] = True
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started, engine, started, **attributes)
@@ -0,0 +1,327 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+import aiohttp  # 异步HTTP请求
+
+from metrics import REGISTRY  # 监控指标
+
+# 单次请求结果的分类，由调用方根据上游响应判断
+OK = 'ok'  # 成功
+THROTTLED = 'throttled'  # 被上游限流（如有道112/411、智谱429），降低速率后重试
+RETRY = 'retry'  # 上游临时故障（如5xx），退避后重试
+FAIL = 'fail'  # 不可重试的错误（如密钥错误），直接返回
+
+# 断路器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'rag_upstream_requests_total', '上游请求次数（每次重试单独计数），按结果分类', ('engine', 'outcome')
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    'rag_upstream_request_seconds', '单次上游请求耗时（秒）', ('engine',)
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'rag_upstream_errors_total', '上游返回的错误码或网络异常次数', ('engine', 'code')
+)
+
+
+# 当前调用链上的排队计时器，由 wait_for_active 设置，随任务上下文传给各引擎链路与批量请求
+QUEUE_CLOCKS = contextvars.ContextVar('queue_clocks', default=())
+
+
+class QueueClock:
+    """排队计时器 - 累计一次润色流程中等待限流名额（令牌桶与并发信号量）的时间，同时排队的多个调用只计一次"""
+
+    def __init__(self):
+        self.waiting = 0  # 正在排队的调用数
+        self._total = 0.0
+        self._since = 0.0
+
+    def enter(self):
+        if not self.waiting:
+            self._since = time.monotonic()
+        self.waiting += 1
+
+    def leave(self):
+        self.waiting -= 1
+        if not self.waiting:
+            self._total += time.monotonic() - self._since
+
+    def total(self) -> float:
+        """累计的排队时间（秒），包括正在进行的排队"""
+        return self._total + (time.monotonic() - self._since if self.waiting else 0.0)
+
+
+@contextlib.contextmanager
+def queued():
+    """标记当前调用正在等待限流名额，期间调用链上的排队计时器计时"""
+    clocks = QUEUE_CLOCKS.get()
+    for clock in clocks:
+        clock.enter()
+    try:
+        yield
+    finally:
+        for clock in clocks:
+            clock.leave()
+
+
+def start_with_clocks(coro: Awaitable[Any], clocks: Iterable[QueueClock]) -> asyncio.Future:
+    """以指定的排队计时器启动任务 - 合并请求的批量调用排队时，同批次各调用方的计时器都计时"""
+    token = QUEUE_CLOCKS.set(tuple(clocks))
+    try:
+        return asyncio.ensure_future(coro)
+    finally:
+        QUEUE_CLOCKS.reset(token)
+
+
+async def wait_for_active(awaitable: Awaitable[Any], timeout: float) -> Any:
+    """与 asyncio.wait_for 相同，但等待上游限流名额的时间不计入超时，超时只限制实际处理的时间"""
+    clock = QueueClock()
+    task = start_with_clocks(awaitable, QUEUE_CLOCKS.get() + (clock,))
+    started = time.monotonic()
+    try:
+        while True:
+            remaining = started + timeout + clock.total() - time.monotonic()
+            if remaining <= 0:
+                break
+            # 排队期间剩余时间不减少，按固定间隔重新检查
+            done, _ = await asyncio.wait({task}, timeout=max(remaining, 0.1) if clock.waiting else remaining)
+            if done:
+                return task.result()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    task.cancel()
+    raise asyncio.TimeoutError()
+
+
+class CircuitOpenError(Exception):
+    """断路器打开时快速失败"""
+
+
+class QueueFullError(Exception):
+    """等待并发名额的请求数达到上限时快速失败"""
+
+
+class TokenBucket:
+    """令牌桶 - 按QPS发放请求许可，支持在检测到限流时自适应降速（乘性减、加性增）"""
+
+    def __init__(self, rate: float, burst: float = 0, min_rate: float = 0.5,
+                 decrease_factor: float = 0.5, increase_step: float = 0):
+        self.max_rate = rate  # 配置的QPS上限，0表示不限速
+        self.rate = rate  # 当前生效的QPS
+        self.burst = burst or max(1.0, rate)  # 桶容量，允许的突发请求数
+        self.min_rate = min(min_rate, rate) if rate else 0  # 降速的下限
+        self.decrease_factor = decrease_factor  # 检测到限流时速率乘以该系数
+        self.increase_step = increase_step or rate / 20  # 每次成功后速率的恢复步长
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self.throttle_events = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """获取一个许可 - 令牌不足时预支令牌并等待，等待顺序与请求顺序一致"""
+        if not self.max_rate:
+            return
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def on_throttled(self):
+        """检测到上游限流 - 降低速率；同一波并发请求同时被限流时每秒最多降速一次"""
+        self.throttle_events += 1
+        now = time.monotonic()
+        if not self.max_rate or now - self._last_decrease < 1.0:
+            return
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._last_decrease = now
+
+    def on_success(self):
+        """请求成功 - 逐步恢复速率直到配置的上限"""
+        if self.max_rate and self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+class CircuitBreaker:
+    """断路器 - 连续失败达到阈值后打开，在冷却时间内直接拒绝请求；冷却后放行一个探测请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold  # 连续失败多少次后打开，0表示不启用
+        self.reset_timeout = reset_timeout  # 打开后的冷却时间（秒）
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_events = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否允许发送请求"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            # 半开状态只放行一个探测请求
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def release_probe(self):
+        self._probing = False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+            if self.state != OPEN:
+                self.open_events += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class EngineLimiter:
+    """上游引擎的流量控制 - 并发上限 + 令牌桶限速 + 指数退避重试 + 断路器
+
+    call(request, classify) 发送请求并用 classify(响应) 判断结果，
+    被限流或临时故障时按带抖动的指数退避重试，重试用尽后返回最后一次响应或抛出最后一次异常。
+    max_queue 大于0时，等待并发名额的请求数达到上限后新请求直接失败，不再无限排队。
+    """
+
+    def __init__(self, name: str, qps: float = 0, concurrency: int = 4, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8, failure_threshold: int = 5,
+                 reset_timeout: float = 30, label: str = '', max_queue: int = 0):
+        self.name = name  # 错误信息中显示的服务名称
+        self.label = label or name  # 监控指标中的引擎标识
+        self.concurrency = concurrency  # 同时进行的请求数上限
+        self.max_queue = max_queue  # 等待并发名额的请求数上限，0表示不限制
+        self.max_retries = max_retries  # 最多重试次数
+        self.base_delay = base_delay  # 第一次重试的退避时间上限（秒），之后每次翻倍
+        self.max_delay = max_delay  # 单次退避时间上限（秒）
+        self.bucket = TokenBucket(qps)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._semaphores = {}  # 事件循环 -> 信号量，懒创建
+        self.in_flight = 0
+        self.waiting = 0  # 正在等待并发名额的请求数
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0, 'rejected': 0}
+
+    def _slot(self) -> asyncio.Semaphore:
+        """并发信号量 - 与当前事件循环绑定，首次使用时创建"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            # 丢弃已关闭事件循环上的信号量
+            self._semaphores = {k: v for k, v in self._semaphores.items() if not k.is_closed()}
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    @contextlib.asynccontextmanager
+    async def _acquire(self, slot: asyncio.Semaphore):
+        """占用一个并发名额，等待期间计入排队数"""
+        self.waiting += 1
+        try:
+            with queued():
+                await slot.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次重试前的等待时间 - 指数退避加全抖动"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, request: Callable[[], Awaitable[Any]], classify: Callable[[Any], str]) -> Any:
+        attempt = 0
+        while True:
+            slot = self._slot()
+            if self.max_queue and slot.locked() and self.waiting >= self.max_queue:
+                self.stats['rejected'] += 1
+                UPSTREAM_REQUESTS.inc(engine=self.label, outcome='rejected')
+                raise QueueFullError(f"{self.name} 排队等待的请求已达上限（{self.max_queue}），请稍后重试")
+            if not self.breaker.allow():
+                self.stats['rejected'] += 1
+                UPSTREAM_REQUESTS.inc(engine=self.label, outcome='rejected')
+                raise CircuitOpenError(f"{self.name} 服务暂时不可用（连续失败已触发熔断），请稍后重试")
+
+            with queued():
+                await self.bucket.acquire()
+            error = None
+            async with self._acquire(slot):
+                self.in_flight += 1
+                self.stats['requests'] += 1
+                started = time.perf_counter()
+                try:
+                    response = await request()
+                    outcome = classify(response)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error, outcome = e, RETRY
+                    UPSTREAM_ERRORS.inc(engine=self.label, code=type(e).__name__)
+                except BaseException:
+                    # 其他异常（含取消）无法说明服务状态，只归还半开状态的探测名额
+                    self.breaker.release_probe()
+                    raise
+                finally:
+                    self.in_flight -= 1
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, engine=self.label)
+            UPSTREAM_REQUESTS.inc(engine=self.label, outcome=outcome)
+
+            if outcome == THROTTLED:
+                # 限流说明服务可用，只降速不计入熔断
+                self.stats['throttled'] += 1
+                self.bucket.on_throttled()
+                self.breaker.record_success()
+            elif outcome == RETRY:
+                self.stats['failures'] += 1
+                self.breaker.record_failure()
+            else:
+                self.bucket.on_success()
+                self.breaker.record_success()
+                return response
+
+            if attempt >= self.max_retries or self.breaker.state == OPEN:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+            self.stats['retries'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """限流器当前状态，用于监控"""
+        return {
+            **self.stats,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'concurrency': self.concurrency,
+            'max_queue': self.max_queue,
+            'qps': round(self.bucket.rate, 3),
+            'max_qps': self.bucket.max_rate,
+            'throttle_events': self.bucket.throttle_events,
+            'breaker_state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'breaker_open_events': self.breaker.open_events
+        }
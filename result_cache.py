@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def make_cache_key(*parts: Any) -> str:
+    """生成内容寻址的缓存键 - 对引擎、翻译方向、提示词/上下文和文本整体做SHA-256摘要"""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """结果缓存 - 内存层按字节数做LRU淘汰并支持TTL过期，可选SQLite磁盘层在进程间共享
+
+    查询顺序为 内存 -> 磁盘，磁盘命中后提升到内存层。值需可JSON序列化。
+    """
+
+    def __init__(self, name: str = 'cache', max_bytes: int = 64 * 1024 * 1024, ttl: float = 7 * 24 * 3600,
+                 path: str = '', max_disk_bytes: int = 512 * 1024 * 1024):
+        self.name = name  # 缓存名称，同时作为SQLite表名
+        self.max_bytes = max_bytes  # 内存层的字节数上限
+        self.ttl = ttl  # 过期时间（秒），0表示不过期
+        self.path = path  # SQLite文件路径，为空时只使用内存层
+        self.max_disk_bytes = max_disk_bytes  # 磁盘层的字节数上限
+        self._entries = OrderedDict()  # key -> (过期时间, 值, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_writes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+        if path:
+            self._open_db()
+
+    def _open_db(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # WAL模式允许多个工作进程同时读、串行写
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.name}" ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_accessed" ON "{self.name}" (accessed_at)')
+
+    def _expires_at(self) -> float:
+        # 不过期的条目使用一个足够远的时间戳，便于与磁盘层统一比较
+        return time.time() + self.ttl if self.ttl else 1e18
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry[1]
+                self._drop(key)
+                self.stats['expired'] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f'SELECT value, expires_at FROM "{self.name}" WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute(f'UPDATE "{self.name}" SET accessed_at = ? WHERE key = ?', (now, key))
+                    value = json.loads(row[0])
+                    self._put_memory(key, value, len(row[0].encode('utf-8')), row[1])
+                    self.stats['disk_hits'] += 1
+                    return value
+
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        """写入缓存 - 同时写入内存层与磁盘层"""
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        expires_at = self._expires_at()
+        with self._lock:
+            self._put_memory(key, value, size, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?, ?, ?, ?)',
+                    (key, encoded, size, expires_at, time.time())
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 100 == 0:
+                    self._prune_disk()
+
+    def _put_memory(self, key: str, value: Any, size: int, expires_at: float):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        # 按最近最少使用顺序淘汰，直到总字节数回到上限以内
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats['evictions'] += 1
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _prune_disk(self):
+        """清理磁盘层 - 删除过期条目，并按最近访问时间淘汰超出字节上限的部分"""
+        self._db.execute(f'DELETE FROM "{self.name}" WHERE expires_at <= ?', (time.time(),))
+        total = self._db.execute(f'SELECT COALESCE(SUM(size), 0) FROM "{self.name}"').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        freed = 0
+        victims = []
+        for key, size in self._db.execute(f'SELECT key, size FROM "{self.name}" ORDER BY accessed_at'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany(f'DELETE FROM "{self.name}" WHERE key = ?', victims)
+
+    def clear(self):
+        """清空内存层与磁盘层"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM "{self.name}"')
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        """返回命中统计及容量信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,221 @@
+import json
+import os
+import time
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # 写入进程选举，只在类Unix系统上可用
+except ImportError:
+    fcntl = None
+
+# 共享目录格式版本 - CURRENT 指向当前代的向量、文档与偏移文件
+SHARED_FORMAT_VERSION = 1
+
+
+class MappedDocuments(Sequence):
+    """内存映射的文档列表 - 每篇文档一行JSON，按偏移数组定位，访问时才解码，不把全部文档读入内存"""
+
+    __slots__ = ('_data', '_offsets')
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data  # 文档文件的uint8内存映射
+        self._offsets = offsets  # 第i篇文档为 data[offsets[i]:offsets[i+1]]
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _decode(self, index: int) -> Dict[str, Any]:
+        return json.loads(self._data[self._offsets[index]:self._offsets[index + 1]].tobytes())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('文档下标超出范围')
+        return self._decode(index)
+
+    def __iter__(self):
+        return (self._decode(i) for i in range(len(self)))
+
+
+def _open_mapped(path: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    """以只读内存映射打开文件的前 shape 个元素，元素数为0时返回空数组（np.memmap 不能映射空区域）"""
+    if not int(np.prod(shape)):
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+class SharedKnowledgeBase:
+    """多个工作进程共享的知识库目录 - 一个写入进程发布版本，其余进程以内存映射方式只读加载
+
+    目录结构：
+        CURRENT                  当前版本的元数据（版本号、代号、文档数、维度），原子替换
+        embeddings.<代号>.f32    float32向量，按行追加
+        documents.<代号>.jsonl   每行一篇文档的JSON
+        offsets.<代号>.i64       每篇文档在 documents 文件中的起止偏移
+        writer.lock              写入进程持有的文件锁，进程退出后自动释放
+        inbox/                   只读进程转交给写入进程的上传与删除请求
+
+    只追加文档时在当前代的文件末尾写入新行，再更新 CURRENT；读取方只映射 CURRENT 记录的行数，
+    看不到写了一半的数据。有删除或整体替换时写入新一代文件，上一代文件保留到再下一次换代，
+    正在读取上一代的进程不受影响。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inbox = os.path.join(path, 'inbox')
+        os.makedirs(self.inbox, exist_ok=True)
+        self._lock_file = None  # 持有写入锁时打开的锁文件
+        self._written = None  # 本进程最近一次发布的 CURRENT 内容，决定下次能否追加
+
+    def _file(self, kind: str, generation: int) -> str:
+        suffix = {'embeddings': 'f32', 'documents': 'jsonl', 'offsets': 'i64'}[kind]
+        return os.path.join(self.path, f'{kind}.{generation}.{suffix}')
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire_writer(self) -> bool:
+        """尝试成为写入进程 - 非阻塞地获取文件锁，成功后一直持有到进程退出"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(self.path, 'writer.lock'), 'a+')
+        if fcntl is None:
+            # 不支持文件锁的平台上无法选举，只允许以单个工作进程运行
+            print("⚠️ 当前平台不支持文件锁，共享知识库只能由单个工作进程使用")
+        else:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        self._written = self.current()
+        if self._written is not None:
+            self._truncate(self._written)
+        return True
+
+    def _truncate(self, meta: Dict[str, Any]):
+        """截掉上一个写入进程在更新 CURRENT 之前中断而留下的半截数据"""
+        generation, count = meta['generation'], meta['count']
+        with open(self._file('offsets', generation), 'r+b') as f:
+            f.seek(count * 8)
+            end = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+            f.truncate((count + 1) * 8)
+        with open(self._file('documents', generation), 'r+b') as f:
+            f.truncate(end)
+        with open(self._file('embeddings', generation), 'r+b') as f:
+            f.truncate(count * (meta['dim'] or 0) * 4)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """读取当前发布的版本元数据，尚未发布过时返回None"""
+        try:
+            with open(os.path.join(self.path, 'CURRENT'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open(self, meta: Dict[str, Any]) -> Tuple[MappedDocuments, Optional[np.ndarray]]:
+        """按版本元数据映射文档与向量 - 返回 (文档列表, 向量矩阵)，知识库为空时向量为None"""
+        generation, count, dim = meta['generation'], meta['count'], meta['dim']
+        offsets = _open_mapped(self._file('offsets', generation), np.int64, (count + 1,))
+        if not count:
+            return MappedDocuments(np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64)), None
+        data = _open_mapped(self._file('documents', generation), np.uint8, (int(offsets[-1]),))
+        matrix = _open_mapped(self._file('embeddings', generation), np.float32, (count, dim))
+        return MappedDocuments(data, offsets), matrix
+
+    def publish(self, documents: Sequence, embeddings: Optional[np.ndarray], version: int,
+                model: str, appended_from: Optional[int] = None) -> Dict[str, Any]:
+        """发布新版本并返回其元数据 - appended_from 为上次发布之后只追加了文档时的起始行号，此时只写入新增的行"""
+        if not self.is_writer:
+            raise RuntimeError('只有写入进程可以发布共享知识库')
+        count = len(documents)
+        dim = None if embeddings is None else embeddings.shape[1]
+        previous = self._written
+        append = (previous is not None and appended_from is not None and previous['count'] == appended_from
+                  and previous['count'] > 0 and previous['dim'] == dim and previous['model'] == model)
+        if append:
+            generation, start = previous['generation'], appended_from
+        else:
+            generation, start = (previous['generation'] + 1 if previous else 1), 0
+
+        mode = 'ab' if append else 'wb'
+        with open(self._file('documents', generation), mode) as data, \
+                open(self._file('offsets', generation), mode) as offsets:
+            # 追加时偏移文件已有上一行的结束位置，只写入新行的结束位置
+            bounds = [] if append else [0]
+            for doc in documents[start:count] if start else documents:
+                data.write(json.dumps(doc, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8'))
+                data.write(b'\n')
+                bounds.append(data.tell())
+            offsets.write(np.asarray(bounds, dtype=np.int64).tobytes())
+        with open(self._file('embeddings', generation), mode) as f:
+            if count > start:
+                f.write(np.ascontiguousarray(embeddings[start:count], dtype=np.float32).tobytes())
+
+        meta = {
+            'format_version': SHARED_FORMAT_VERSION,
+            'version': version,
+            'generation': generation,
+            'count': count,
+            'dim': dim,
+            'model': model,
+            'writer': os.getpid(),
+            'published_at': time.time(),
+        }
+        # 数据文件写完后再原子替换 CURRENT，读取方要么看到旧版本，要么看到完整的新版本
+        current = os.path.join(self.path, 'CURRENT')
+        with open(current + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(current + '.tmp', current)
+        self._written = meta
+        if not append:
+            self._remove_generations(keep=(generation, generation - 1))
+        return meta
+
+    def _remove_generations(self, keep: Tuple[int, ...]):
+        """删除更早的代 - 已映射这些文件的进程仍可继续读取（文件在解除映射后才真正释放）"""
+        for name in os.listdir(self.path):
+            parts = name.split('.')
+            if len(parts) == 3 and parts[0] in ('embeddings', 'documents', 'offsets') and parts[1].isdigit() \
+                    and int(parts[1]) not in keep:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def submit(self, op: str, **params) -> str:
+        """把写操作转交给写入进程 - 请求写入 inbox 目录，由写入进程按提交顺序处理"""
+        request = dict(params, op=op, pid=os.getpid(), submitted_at=time.time())
+        name = f'{time.time_ns():020d}-{os.getpid()}.json'
+        path = os.path.join(self.inbox, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(request, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        return name
+
+    def take_requests(self) -> List[Dict[str, Any]]:
+        """取出 inbox 中待处理的请求（按提交顺序），取出后即删除"""
+        requests = []
+        for name in sorted(os.listdir(self.inbox)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.inbox, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    requests.append(json.load(f))
+                os.remove(path)
+            except (OSError, ValueError) as e:
+                print(f"❌ 读取共享知识库请求 {name} 时出错: {str(e)}")
+        return requests
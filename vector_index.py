@@ -0,0 +1,320 @@
+import copy
+import threading
+from typing import Tuple
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """将向量按行归一化为float32单位向量 - 之后点积即为余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """用argpartition取分数最高的top_k个下标，并按分数降序排列"""
+    top_k = min(top_k, scores.shape[0])
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class VectorIndex:
+    """向量索引基类 - 所有后端都基于已归一化的float32矩阵，使用内积作为相似度
+
+    build(matrix)         用完整矩阵重建索引（有删除或压缩时调用）
+    update(matrix, start) 矩阵前 start 行不变，只需索引 start 之后新增的行
+    search(query, top_k)  返回 (行号数组, 相似度数组)
+    snapshot()            返回当前状态的只读副本，之后的 build/update 不影响它
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return 0 if self._matrix is None else self._matrix.shape[0]
+
+    def build(self, matrix: np.ndarray):
+        raise NotImplementedError
+
+    def update(self, matrix: np.ndarray, start: int):
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def snapshot(self) -> 'VectorIndex':
+        # build/update 只替换矩阵引用而不修改矩阵本身，浅复制即可
+        return copy.copy(self)
+
+
+class ExactIndex(VectorIndex):
+    """精确检索 - 对预归一化矩阵做一次矩阵向量乘，再用argpartition取top-k"""
+
+    name = 'exact'
+
+    def build(self, matrix: np.ndarray):
+        # 直接引用向量存储中的矩阵视图，不复制
+        self._matrix = matrix
+
+    def update(self, matrix: np.ndarray, start: int):
+        self._matrix = matrix
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self._matrix @ np.asarray(query, dtype=np.float32).ravel()
+        indices = top_k_indices(scores, top_k)
+        return indices, scores[indices]
+
+
+class IVFIndex(VectorIndex):
+    """倒排文件(IVF)近似检索 - 球面k-means聚类，查询时只扫描最近的 nprobe 个簇
+
+    数据量低于 min_train_size 时退化为精确检索；新增数据直接分配到最近的簇，
+    当数据量增长到训练时的 retrain_factor 倍后重新训练聚类中心。
+    """
+
+    name = 'ivf'
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, min_train_size: int = 4096,
+                 train_iterations: int = 10, max_train_points: int = 256, retrain_factor: float = 2.0,
+                 seed: int = 42):
+        super().__init__()
+        self.nlist = nlist  # 簇的数量，0表示按数据量自动选择
+        self.nprobe = nprobe  # 每次查询扫描的簇数量
+        self.min_train_size = min_train_size  # 触发训练的最小数据量
+        self.train_iterations = train_iterations  # k-means迭代次数
+        self.max_train_points = max_train_points  # 每个簇最多采样的训练点数
+        self.retrain_factor = retrain_factor  # 数据量增长多少倍后重新训练
+        self._rng = np.random.default_rng(seed)
+        self._centroids = None  # 聚类中心 (nlist, dim)
+        self._lists = []  # 每个簇包含的行号
+        self._trained_size = 0
+
+    def _choose_nlist(self, n: int) -> int:
+        if self.nlist:
+            return min(self.nlist, n)
+        return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        """把向量分配到内积最大的聚类中心，分批计算以限制内存"""
+        assignments = np.empty(vectors.shape[0], dtype=np.int64)
+        for begin in range(0, vectors.shape[0], batch_size):
+            block = vectors[begin:begin + batch_size]
+            assignments[begin:begin + batch_size] = np.argmax(block @ self._centroids.T, axis=1)
+        return assignments
+
+    def _train(self, matrix: np.ndarray):
+        n = matrix.shape[0]
+        nlist = self._choose_nlist(n)
+        sample_size = min(n, nlist * self.max_train_points)
+        sample = matrix[self._rng.choice(n, sample_size, replace=False)] if sample_size < n else matrix
+        centroids = sample[self._rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            self._centroids = centroids
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # 按簇排序后分段求和，比 np.add.at 快一个数量级
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[np.argsort(labels, kind='stable')], starts[~empty], axis=0)
+            # 空簇用随机样本重新初始化，避免中心退化
+            if empty.any():
+                sums[empty] = sample[self._rng.choice(sample.shape[0], int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        self._centroids = centroids
+        self._trained_size = n
+
+    def _rebuild_lists(self, matrix: np.ndarray):
+        labels = self._assign(matrix)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self._centroids.shape[0] + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self._centroids.shape[0])]
+
+    def build(self, matrix: np.ndarray):
+        self._matrix = matrix
+        if matrix is None or matrix.shape[0] < self.min_train_size:
+            self._centroids = None
+            self._lists = []
+            return
+        # 数据量变化不大时（例如删除了部分文档）沿用已有聚类中心，只重新分配倒排列表
+        if (self._centroids is None
+                or not self._trained_size / self.retrain_factor <= matrix.shape[0] < self._trained_size * self.retrain_factor):
+            self._train(matrix)
+        self._rebuild_lists(matrix)
+
+    def update(self, matrix: np.ndarray, start: int):
+        if (self._centroids is None or start != len(self)
+                or matrix.shape[0] >= self._trained_size * self.retrain_factor):
+            self.build(matrix)
+            return
+        self._matrix = matrix
+        if matrix.shape[0] <= start:
+            return
+        new_ids = np.arange(start, matrix.shape[0])
+        labels = self._assign(matrix[start:])
+        for cluster in np.unique(labels):
+            self._lists[cluster] = np.concatenate([self._lists[cluster], new_ids[labels == cluster]])
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self._centroids is None:
+            scores = self._matrix @ query
+            indices = top_k_indices(scores, top_k)
+            return indices, scores[indices]
+        probes = top_k_indices(self._centroids @ query, self.nprobe)
+        candidates = np.concatenate([self._lists[p] for p in probes])
+        scores = self._matrix[candidates] @ query
+        order = top_k_indices(scores, top_k)
+        return candidates[order], scores[order]
+
+    def snapshot(self) -> 'IVFIndex':
+        # update 会替换倒排列表中的元素，快照持有列表的副本（每个簇的行号数组本身不会被修改）
+        snapshot = copy.copy(self)
+        snapshot._lists = list(self._lists)
+        return snapshot
+
+
+class FaissIndex(VectorIndex):
+    """faiss HNSW后端（可选依赖：pip install faiss-cpu）
+
+    图索引无法低成本复制：快照与写入方共享同一个底层索引，增量添加与查询之间用锁互斥，
+    查询时过滤掉快照之后新增的行号。
+    """
+
+    name = 'faiss'
+
+    def __init__(self, m: int = 32, ef_construction: int = 200, ef_search: int = 512):
+        super().__init__()
+        import faiss  # 可选依赖，仅在选择该后端时导入
+        self._faiss = faiss
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._lock = threading.Lock()  # 底层索引不支持边添加边查询
+
+    def _new_index(self, dim: int):
+        index = self._faiss.IndexHNSWFlat(dim, self.m, self._faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        index.hnsw.efSearch = self.ef_search
+        return index
+
+    def build(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self._index = None
+        if matrix is not None and matrix.shape[0]:
+            self._index = self._new_index(matrix.shape[1])
+            self._index.add(np.ascontiguousarray(matrix))
+
+    def update(self, matrix: np.ndarray, start: int):
+        if self._index is None or self._index.ntotal != start:
+            self.build(matrix)
+            return
+        self._matrix = matrix
+        if matrix.shape[0] > start:
+            with self._lock:
+                self._index.add(np.ascontiguousarray(matrix[start:]))
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        count = len(self)
+        with self._lock:
+            # 多取快照之后新增的行数，过滤后仍能返回top_k个结果
+            k = min(top_k + self._index.ntotal - count, self._index.ntotal)
+            self._index.hnsw.efSearch = max(self.ef_search, k)
+            scores, indices = self._index.search(query, k)
+        valid = (indices[0] >= 0) & (indices[0] < count)
+        return indices[0][valid][:top_k].astype(np.int64), scores[0][valid][:top_k]
+
+
+class HnswIndex(VectorIndex):
+    """hnswlib HNSW后端（可选依赖：pip install hnswlib）
+
+    与faiss后端相同，快照共享底层索引，扩容/添加与查询之间用锁互斥，查询时过滤快照之后新增的行号。
+    """
+
+    name = 'hnsw'
+
+    def __init__(self, m: int = 32, ef_construction: int = 200, ef_search: int = 512):
+        super().__init__()
+        import hnswlib  # 可选依赖，仅在选择该后端时导入
+        self._hnswlib = hnswlib
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._count = 0
+        self._lock = threading.Lock()  # 扩容时不能同时查询
+
+    def build(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self._index = None
+        self._count = 0
+        if matrix is not None and matrix.shape[0]:
+            self._index = self._hnswlib.Index(space='ip', dim=matrix.shape[1])
+            self._index.init_index(max_elements=max(1024, matrix.shape[0] * 2),
+                                   M=self.m, ef_construction=self.ef_construction)
+            self._index.set_ef(self.ef_search)
+            self._add(matrix, 0)
+
+    def _add(self, matrix: np.ndarray, start: int):
+        count = matrix.shape[0]
+        with self._lock:
+            if count > self._index.get_max_elements():
+                self._index.resize_index(count * 2)
+            self._index.add_items(matrix[start:], np.arange(start, count))
+        self._count = count
+
+    def update(self, matrix: np.ndarray, start: int):
+        if self._index is None or self._count != start:
+            self.build(matrix)
+            return
+        self._matrix = matrix
+        if matrix.shape[0] > start:
+            self._add(matrix, start)
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        with self._lock:
+            total = self._index.get_current_count()
+            k = min(top_k + total - self._count, total)
+            self._index.set_ef(max(self.ef_search, k))
+            labels, distances = self._index.knn_query(np.asarray(query, dtype=np.float32).reshape(1, -1), k=k)
+        valid = labels[0] < self._count
+        # hnswlib的内积空间返回 1 - 内积
+        return labels[0][valid][:top_k].astype(np.int64), (1.0 - distances[0][valid][:top_k]).astype(np.float32)
+
+
+# 可选的索引后端
+INDEX_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+    'faiss': FaissIndex,
+    'hnsw': HnswIndex,
+}
+
+
+def create_index(backend: str = 'exact', **options) -> VectorIndex:
+    """根据配置名称创建向量索引"""
+    backend = (backend or 'exact').lower()
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"不支持的向量索引后端: {backend}，可选: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](**options)
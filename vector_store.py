@@ -0,0 +1,253 @@
+import itertools
+import json
+import os
+import threading
+from collections.abc import Sequence
+from typing import List, Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+# 持久化格式版本 - 元数据JSON + 同名 .npy 向量文件
+STORE_FORMAT_VERSION = 1
+
+
+class DocumentList(Sequence):
+    """文档列表的只读前缀视图 - 底层列表之后追加的文档对视图不可见，创建时不复制列表"""
+
+    __slots__ = ('_documents', '_size')
+
+    def __init__(self, documents: List[Dict[str, Any]], size: int):
+        self._documents = documents
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._documents[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('文档下标超出范围')
+        return self._documents[index]
+
+    def __iter__(self):
+        return itertools.islice(self._documents, self._size)
+
+
+class KnowledgeBaseSnapshot:
+    """知识库的一个版本 - 文档、向量矩阵与向量索引相互对应，发布后不再变化
+
+    读取方拿到快照引用后无需加锁；写入方修改完成后发布新快照，旧快照仍可被正在进行的检索安全使用。
+    """
+
+    __slots__ = ('version', 'documents', 'embeddings', 'index', 'lexical')
+
+    def __init__(self, version: int, documents: Sequence, embeddings: Optional[np.ndarray], index, lexical=None):
+        self.version = version  # 单调递增的版本号
+        self.documents = documents  # 与向量行一一对应的文档
+        self.embeddings = embeddings  # 有效向量的只读视图，知识库为空时为None
+        self.index = index  # 与向量矩阵对应的向量索引快照
+        self.lexical = lexical  # 与文档对应的BM25倒排索引快照，只使用向量检索时为None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+class EmbeddingStore:
+    """增量式嵌入向量存储 - 预分配可增长的float32矩阵，文档与向量行一一对应
+
+    写入采用写时复制：追加只写入已发布行之后的位置，删除时生成新的矩阵与文档列表，
+    因此 snapshot() 返回的视图在之后的修改中保持不变。
+    """
+
+    def __init__(self, initial_capacity: int = 1024, growth_factor: float = 2.0, normalize: bool = True):
+        self.initial_capacity = initial_capacity  # 首次分配的行数
+        self.growth_factor = growth_factor  # 容量不足时的扩容倍数
+        self.normalize = normalize  # 写入前按行归一化，检索时点积即余弦相似度
+        self.dim = None  # 向量维度，在第一次添加时确定
+        self._matrix = None  # 预分配的向量矩阵，只有前 _size 行有效
+        self._size = 0  # 当前有效行数
+        self.documents = []  # 与矩阵前 _size 行一一对应的文档
+        self._lock = threading.Lock()  # 保护矩阵与文档列表的同步修改
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """返回有效向量的视图（不复制），知识库为空时返回None"""
+        if self._size == 0:
+            return None
+        return self._matrix[:self._size]
+
+    @property
+    def capacity(self) -> int:
+        """当前预分配的行数"""
+        return 0 if self._matrix is None else self._matrix.shape[0]
+
+    def _ensure_capacity(self, extra: int):
+        """确保矩阵还能容纳 extra 行，不足时按倍数扩容并复制已有向量"""
+        required = self._size + extra
+        if self._matrix is not None and required <= self._matrix.shape[0]:
+            return
+        new_capacity = max(self.capacity, self.initial_capacity)
+        while new_capacity < required:
+            new_capacity = int(new_capacity * self.growth_factor) + 1
+        new_matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        if self._size:
+            new_matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = new_matrix
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """统一为二维float32矩阵，并按配置归一化"""
+        if np.size(vectors) == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self.normalize:
+            return normalize_rows(vectors)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(1, -1) if vectors.ndim == 1 else vectors
+
+    def add(self, documents: List[Dict[str, Any]], vectors: np.ndarray):
+        """追加文档及其向量 - 只写入新行，不重新编码已有文档"""
+        vectors = self._prepare(vectors)
+        if len(documents) != vectors.shape[0]:
+            raise ValueError(f"文档数({len(documents)})与向量数({vectors.shape[0]})不一致")
+        if not documents:
+            return
+        with self._lock:
+            self._add_locked(documents, vectors)
+
+    def _add_locked(self, documents: List[Dict[str, Any]], vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: 期望 {self.dim}，实际 {vectors.shape[1]}")
+        self._ensure_capacity(len(documents))
+        self._matrix[self._size:self._size + len(documents)] = vectors
+        self._size += len(documents)
+        if not isinstance(self.documents, list):
+            # 挂载的只读文档序列（共享知识库的内存映射）在第一次追加时转换为列表
+            self.documents = list(self.documents)
+        self.documents.extend(documents)
+
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        """按来源删除文档 - 压缩剩余向量行，返回删除的文档数"""
+        with self._lock:
+            return self._remove_locked(set(sources))
+
+    def _remove_locked(self, sources: set) -> int:
+        if not sources or self._size == 0:
+            return 0
+        keep = np.fromiter(
+            (doc.get("source") not in sources for doc in self.documents),
+            dtype=bool,
+            count=self._size
+        )
+        kept = int(keep.sum())
+        removed = self._size - kept
+        if removed:
+            # 不在原矩阵上压缩：已发布的快照仍在读取原矩阵，剩余的行复制到新矩阵
+            # （只读的内存映射矩阵也由此在第一次修改时复制到内存）
+            matrix = np.empty((max(kept, self.capacity if self._matrix.flags.writeable else kept), self.dim),
+                              dtype=np.float32)
+            matrix[:kept] = self._matrix[:self._size][keep]
+            self._matrix = matrix
+            self.documents = [doc for doc, k in zip(self.documents, keep) if k]
+            self._size = kept
+        return removed
+
+    def replace_sources(self, documents: List[Dict[str, Any]], vectors: np.ndarray, keep: Iterable[str] = (),
+                        sources: Iterable[str] = ()) -> int:
+        """用新文档替换同来源的旧文档 - 删除与追加在同一把锁内完成；keep 中的来源只追加不删除（分批写入的大文件）
+
+        sources 为额外需要替换的来源：重新上传的文件没有产生任何文档时，仍要删除该来源的旧文档。
+        """
+        vectors = self._prepare(vectors)
+        if len(documents) != vectors.shape[0]:
+            raise ValueError(f"文档数({len(documents)})与向量数({vectors.shape[0]})不一致")
+        sources = {doc.get("source") for doc in documents}.union(sources).difference(keep)
+        with self._lock:
+            removed = self._remove_locked(sources)
+            if documents:
+                self._add_locked(documents, vectors)
+        return removed
+
+    def clear(self):
+        """清空存储"""
+        with self._lock:
+            self.dim = None
+            self._matrix = None
+            self._size = 0
+            self.documents = []
+
+    def save(self, meta_path: str, extra_meta: Dict[str, Any] = None) -> str:
+        """保存到磁盘 - 文档与元数据写入JSON，向量写入同名 .npy 文件，返回向量文件路径"""
+        embeddings_path = os.path.splitext(meta_path)[0] + '.npy'
+        with self._lock:
+            documents = list(self.documents)
+            matrix = self.embeddings
+            meta = dict(extra_meta or {})
+            meta.update({
+                'format_version': STORE_FORMAT_VERSION,
+                'count': self._size,
+                'dim': self.dim,
+                'dtype': 'float32',
+                'normalized': self.normalize,
+                'embeddings_file': os.path.basename(embeddings_path),
+                'documents': documents
+            })
+            # 先写临时文件再原子替换，避免保存中断留下损坏的知识库
+            if matrix is not None:
+                with open(embeddings_path + '.tmp', 'wb') as f:
+                    np.save(f, matrix)
+                os.replace(embeddings_path + '.tmp', embeddings_path)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(',', ':'), default=str)
+        os.replace(meta_path + '.tmp', meta_path)
+        return embeddings_path
+
+    def load(self, meta_path: str, mmap: bool = True) -> Dict[str, Any]:
+        """从磁盘加载 - 默认以只读内存映射方式打开向量文件，不把向量复制进内存
+
+        返回元数据（不含文档列表）；旧版只有文档列表的JSON文件返回 {'documents': [...]}，
+        由调用方负责重新编码。
+        """
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if isinstance(meta, list):
+            return {'documents': meta}
+
+        documents = meta.pop('documents', [])
+        matrix = None
+        if meta.get('count'):
+            embeddings_path = os.path.join(os.path.dirname(meta_path), meta['embeddings_file'])
+            matrix = np.load(embeddings_path, mmap_mode='r' if mmap else None)
+            if matrix.shape != (len(documents), meta['dim']) or matrix.dtype != np.float32:
+                raise ValueError(f"向量文件与元数据不一致: {matrix.shape} {matrix.dtype}")
+        self.attach(documents, matrix)
+        return meta
+
+    def attach(self, documents: Sequence, matrix: Optional[np.ndarray]):
+        """直接使用已有的文档序列与向量矩阵（例如内存映射的文件），不复制数据 - 只读矩阵在第一次修改时才复制到内存"""
+        with self._lock:
+            self.documents = documents
+            self._matrix = matrix
+            self._size = len(documents) if matrix is not None else 0
+            self.dim = matrix.shape[1] if matrix is not None else None
+
+    def snapshot(self, version: int, index, lexical=None) -> KnowledgeBaseSnapshot:
+        """返回当前内容的只读快照 - 只引用已有的矩阵与文档列表，不复制数据"""
+        with self._lock:
+            embeddings = self.embeddings
+            if embeddings is not None and embeddings.flags.writeable:
+                embeddings = embeddings.view()
+                embeddings.setflags(write=False)
+            return KnowledgeBaseSnapshot(version, DocumentList(self.documents, self._size), embeddings, index, lexical)
+
+    def sources(self) -> List[str]:
+        """返回知识库中的来源列表（保持首次出现的顺序）"""
+        return list(dict.fromkeys(doc.get("source") for doc in self.documents))